@@ -46,6 +46,17 @@ from BalloonUpdate import *				# Class to hold balloon info
 from GetData import *					# Module for tracking methods
 from Payloads import *					# Module for handling payloads
 from MapHTML import *						# Module for generating Google Maps HTML and JavaScript
+from MagneticDeclination import declinationService		# Cached magnetic declination grid
+from TrackStore import TrackStore			# Columnar balloon track history
+from TrackingGraphs import TrackingGraphs	# Incremental tracking graphs
+from FlightLogger import FlightLogger		# Background log file writer
+from BinaryLog import *						# Compact binary flight logs
+from FlightReplay import FlightReplay		# Replays recorded flights through the tracker
+from TelemetryParser import telemetryParser	# Telemetry line decoders
+from RadioMultiplexer import *				# Shares the RFD between listen, commands and still images
+from DownloadQueue import DownloadQueue		# Background image download queue
+from PictureCache import PictureCache		# Decoded and scaled still image pictures
+from AprsIngest import *					# APRS sources, Eagle serial, KISS TNCs and APRS-IS
 
 # Matplotlib setup
 from matplotlib.figure import Figure
@@ -111,7 +122,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 	""" The Main GUI Window """
 	# Signals
 	# RFD Command Signals
-	commandFinished = pyqtSignal()
+	commandsOutstanding = pyqtSignal(int)
 	rfdCommandNewText = pyqtSignal(str)
 	rfdListenNewText = pyqtSignal(str)
 	piruntimeFinished = pyqtSignal()
@@ -128,6 +139,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 	stillNewProgress = pyqtSignal(int,int)
 	newPicture = pyqtSignal(str)
 	requestConfirmation = pyqtSignal(str)
+	previewReady = pyqtSignal(str)
 	newPicSliderValues = pyqtSignal(list)
 	stillSystemFinished = pyqtSignal()
 
@@ -152,6 +164,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		self.iridiumThread.daemon = True
 		self.aprsThread = EventThread()
 		self.aprsThread.daemon = True
+		self.replayThread = EventThread()
+		self.replayThread.daemon = True
 
 		# Start the threads, they should run forever, and add them to the thread pool
 		self.rfdListenThread.start()
@@ -159,6 +173,14 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		self.stillImageThread.start()
 		self.iridiumThread.start()
 		self.aprsThread.start()
+		self.replayThread.start()
+
+		# New balloon locations from every tracking source (and flight replays), connected once here
+		# so an update is only handled once however many times a source is restarted
+		self.rfdNewLocation.connect(self.updateBalloonLocation)
+		self.iridiumNewLocation.connect(self.updateBalloonLocation)
+		self.aprsNewLocation.connect(self.updateBalloonLocation)
+		self.flightReplay = None
 		
 		# Button Function Link Setup
 		# Settings Tab Button Links
@@ -185,6 +207,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 		# RFD Control Button Links
 		self.rfdCommandButton.clicked.connect(self.rfdCommandsButtonPress)
+		self.rfdCommandButton.setText("Send")		# Commands are queued, so the button always sends another one
+		self.rfdStopCommandsButton = QPushButton("Stop All")
+		self.verticalLayout_6.addWidget(self.rfdStopCommandsButton)
+		self.rfdStopCommandsButton.clicked.connect(self.rfdCommandsStop)
+		self.rfdHistoryButton = QPushButton("Command History")
+		self.verticalLayout_6.addWidget(self.rfdHistoryButton)
+		self.rfdHistoryButton.clicked.connect(self.showCommandHistory)
 		self.rfdListenButton.clicked.connect(self.rfdListenButtonPress)
 		self.getPiRuntimeDataButton.clicked.connect(self.getPiRuntimeDataButtonPress)
 		self.requestStatusButton.clicked.connect(self.requestDeviceStatus)
@@ -192,6 +221,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		
 		# Save Data Boolean
 		self.saveData = False
+		self.saveBinaryLogs = True		# Also keep balloon locations and pointing in binary logs, see BinaryLog.py
+		self.flightLogger = None
 
 		# Still Image Control Button Links
 		self.mostRecentImageButton.clicked.connect(lambda: self.stillImageButtonPress('mostRecent'))
@@ -211,13 +242,22 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 	
 		# Initial Still Image System Picture Display Setup
 		self.stillImageOnline = False
-		self.stillImageStall = False
 		self.picHFlip = False
 		self.picVFlip = False
 		self.displayPhotoPath = "Images/MnSGC_Logo_highRes.png"  # The starting display photo is the logo of the MnSGC
+		self.pictureCache = PictureCache()
+		self.resizeTimer = QtCore.QTimer()			# Smooth scales the picture once resizing stops
+		self.resizeTimer.setSingleShot(True)
+		self.resizeTimer.timeout.connect(self.showPicture)
+		self.resizeDelay = 150						# Milliseconds
 		self.tabs.resizeEvent = self.resizePicture
 		self.picLabel.setScaledContents(True)
 		self.updatePicture(self.displayPhotoPath)
+
+		# Image Download Queue, drained in the background whenever the still image system is free
+		self.downloadQueue = DownloadQueue("Images/downloadqueue.json")
+		self.queueGap = 2000			# Milliseconds left between queued downloads for other radio traffic
+		self.queueWindow = None
 		# pm = QPixmap(self.displayPhotoPath)		# Create a pixmap from the default image
 		# scaledPm = pm.scaled(self.picLabel.size(),QtCore.Qt.KeepAspectRatio,QtCore.Qt.SmoothTransformation)
 		# self.picLabel.setPixmap(scaledPm)		# Set the label to the map
@@ -277,6 +317,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		self.centerBear = 0.00
 		self.panOffset = 0.00
 		self.tiltOffset = 0.00
+		self.pointingSolver = PointingSolver(self.groundLat, self.groundLon, self.groundAlt)
 
 		# SQL Access
 		self.dbHost = "eclipse.rci.montana.edu"
@@ -300,19 +341,26 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		layout = QtGui.QVBoxLayout()
 		layout.addWidget(self.canvas)
 		self.graphWidget.setLayout(layout)
+		self.graphMaxFrameRate = 4		# Max number of graph redraws per second
+		self.trackingGraphs = TrackingGraphs(self.figure, self.canvas, self.graphMaxFrameRate)
 
 		# Graphing Arrays
-		self.receivedTime = np.array([])
-		self.receivedLat = np.array([])
-		self.receivedLon = np.array([])
-		self.receivedAlt = np.array([])
-		self.losLog = np.array([])
-		self.elevationLog = np.array([])
-		self.bearingLog = np.array([])
+		self.trackHistory = TrackStore()
 
 		# Determine Serial Connections
 		self.searchComPorts()
 
+	def startReplay(self, path, speed=1.0):
+		""" Replays a recorded balloon location log through the tracker at the given speed (0 for as fast as possible) """
+
+		if self.flightReplay is not None:		# Stop the one already running, the new one starts once it has
+			self.flightReplay.interrupt()
+		self.flightReplay = FlightReplay(self, path, speed)
+		self.flightReplay.moveToThread(self.replayThread)
+		self.flightReplay.start.connect(self.flightReplay.run)
+		self.flightReplay.setInterrupt.connect(lambda: self.flightReplay.interrupt())
+		self.flightReplay.start.emit()
+
 	def iridiumNoConnection(self):
 		self.useIridium = False
 		self.autoIridium.setChecked(False)
@@ -323,6 +371,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 
 	def closeEvent(self, event):
+		self.stopLogging()
+
 		# At the close of the main window, write each payload's information to a file
 		for each in self.payloadList:
 			payloadInstance = "Logs/"+each.getName() + '-'+str(datetime.today().strftime("%m-%d-%Y %H-%M-%S")+'.txt')
@@ -356,18 +406,20 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 	def updateBalloonLocation(self, update):
 		""" Updates the tracker with the latest balloon location """
 		
-		# Log the balloon location no matter what
-		self.logData("balloonLocation", update.getTrackingMethod()+','+str(update.getTime())+','+str(update.getLat())+','+str(update.getLon())+','+str(update.getAlt())+','+str(update.getBear())+','+str(update.getEle())+','+str(update.getLOS()))
+		# Log the balloon location no matter what, unless it's from a replay of a log
+		if not update.isReplayed():
+			self.logData("balloonLocation", update.getTrackingMethod()+','+str(update.getTime())+','+str(update.getLat())+','+str(update.getLon())+','+str(update.getAlt())+','+str(update.getBear())+','+str(update.getEle())+','+str(update.getLOS()))
+			self.logRecord("balloonLocation", locationValues(update))
 
-		if update.getTrackingMethod() == 'RFD':
-			if not self.useRFD:
-				return
-		if update.getTrackingMethod() == 'Iridium':
-			if not self.useIridium:
-				return
-		if update.getTrackingMethod() == 'APRS':
-			if not self.useAPRS:
-				return
+			if update.getTrackingMethod() == 'RFD':
+				if not self.useRFD:
+					return
+			if update.getTrackingMethod() == 'Iridium':
+				if not self.useIridium:
+					return
+			if update.getTrackingMethod() == 'APRS':
+				if not self.useAPRS:
+					return
 		
 		# Make sure it's a good location
 		if ((update.getLat() == 0.0) or (update.getLon() == 0.0) or (update.getAlt() == 0.0)):		# Don't consider updates with bad info to be new updates
@@ -437,32 +489,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		
 		# Update the Graphs in the Tracker Tab
 		if self.graphReal.isChecked():						# Check to see if you have the graph checkbox selected
-			if len(self.receivedAlt) > 0:
-
-				# creates the 4 subplots 
-				altPlot = self.figure.add_subplot(221)
-				losPlot = self.figure.add_subplot(222)
-				elePlot = self.figure.add_subplot(223)
-				bearPlot = self.figure.add_subplot(224)
-
-				# discards the old graph
-				altPlot.hold(False)
-				losPlot.hold(False)
-				elePlot.hold(False)
-				bearPlot.hold(False)
-				
-				# plot data
-				altPlot.plot(self.receivedTime-self.receivedTime[0],self.receivedAlt, 'r-')
-				altPlot.set_ylabel('Altitude (ft)')
-				losPlot.plot(self.receivedTime-self.receivedTime[0],self.losLog,'g-')
-				losPlot.set_ylabel('Line-of-Sight (km)')
-				elePlot.plot(self.receivedTime-self.receivedTime[0],self.elevationLog, 'b-')
-				elePlot.set_ylabel('Elevation Angle')
-				bearPlot.plot(self.receivedTime-self.receivedTime[0],self.bearingLog,'y-')
-				bearPlot.set_ylabel('Bearing Angle')
-
-				# refresh canvas
-				self.canvas.draw()
+			if len(self.trackHistory) > 0:
+				receivedTime = self.trackHistory.column('seconds')
+				self.trackingGraphs.setData(receivedTime-receivedTime[0], self.trackHistory.column('alt'), self.trackHistory.column('los'), self.trackHistory.column('ele'), self.trackHistory.column('bear'))
 
 	def manualRefresh(self):
 		""" Updates the ground station data table """
@@ -490,23 +519,26 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 				if not os.path.exists("Logs"):
 					os.makedirs("Logs")
 				try:
-					# Create the log files
+					# Create the log files, they stay open in the logger's writer thread
 					self.rfdLog = "Logs/"+timestamp + ' ' + "RFDLOG.txt"
-					f = open(self.rfdLog, 'w')
-					f.close()
 					self.stillImageLog = "Logs/"+timestamp + ' ' + "STILLIMAGELOG.txt"
-					f = open(self.stillImageLog, 'w')
-					f.close()
 					self.balloonLocationLog = "Logs/"+timestamp + ' ' + "BALLOONLOCATIONLOG.txt"
-					f = open(self.balloonLocationLog, 'w')
-					f.close()
 					self.pointingLog = "Logs/"+timestamp + ' ' + "POINTINGLOG.txt"
-					f = open(self.pointingLog, 'w')
-					f.close()
+					self.flightLogger = FlightLogger()
+					self.flightLogger.addStream("RFD", self.rfdLog)
+					self.flightLogger.addStream("stillImage", self.stillImageLog)
+					self.flightLogger.addStream("balloonLocation", self.balloonLocationLog)
+					self.flightLogger.addStream("pointing", self.pointingLog)
+					if self.saveBinaryLogs:
+						self.flightLogger.addRecordStream("balloonLocation", BinaryLogWriter("Logs/"+timestamp + ' ' + "BALLOONLOCATIONLOG.bin", LOCATION_RECORD))
+						self.flightLogger.addRecordStream("pointing", BinaryLogWriter("Logs/"+timestamp + ' ' + "POINTINGLOG.bin", POINTING_RECORD))
+					self.flightLogger.start()
 				except Exception, e:
 					print(str(e))
+					self.saveData = False
 		elif not self.saveDataCheckbox.isChecked():
 			self.saveData = False
+			self.stopLogging()
 			
 		# Determine if there's internet Access for the maps
 		if self.internetCheckBox.isChecked():
@@ -542,11 +574,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 				if not self.rfdCOM.text() == "":
 					rfdCOM = str(self.rfdCOM.text())
 					self.RFD = SerialDevice(rfdCOM, 38400, 2)
+					self.radio = RadioMultiplexer(self.RFD.getDevice())
+					self.radio.start()
 
-					# Prepare the RFD Controls and the Still Image System
-					self.rfdListen = RfdListen(self, self.RFD.getDevice())
-					self.rfdCommand = RfdCommand(self, self.RFD.getDevice())
-					self.stillImageSystem = StillImageSystem(self, self.RFD.getDevice())
+					# Prepare the RFD Controls and the Still Image System, each with their own stream of the radio
+					self.rfdListen = RfdListen(self, self.radio)
+					self.rfdCommand = RfdCommand(self, self.radio.openStream(PRIORITY_COMMAND), self.radio.openStream(PRIORITY_CONTROL))
+					self.stillImageSystem = StillImageSystem(self, self.radio.openStream(PRIORITY_CONTROL))
 					
 					# Move them to the side threads
 					self.rfdListen.moveToThread(self.rfdListenThread)
@@ -556,10 +590,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 					# Set up slots
 					self.rfdListen.listenStart.connect(self.rfdListen.listen)
 					self.rfdListen.listenInterrupt.connect(lambda: self.rfdListen.setInterrupt(True))
-					self.rfdListen.shareIdentifier.connect(self.rfdListen.setIdentifier)
 					self.rfdCommand.commandStart.connect(self.rfdCommand.command)
 					self.rfdCommand.commandInterrupt.connect(lambda: self.rfdCommand.setInterrupt(True))
-					self.rfdCommand.foundIdentifier.connect(self.rfdCommand.setAcknowledged)
 					self.rfdCommand.piruntimeStart.connect(self.rfdCommand.getPiRuntimeData)
 					self.rfdCommand.statusStart.connect(self.rfdCommand.getDeviceStatus)
 					self.rfdCommand.cutdownStart.connect(self.rfdCommand.sendCutdown)
@@ -571,12 +603,14 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 					self.stillImageSystem.mostRecentImageStart.connect(self.stillImageSystem.getMostRecentImage)
 					self.stillImageSystem.imageDataStart.connect(self.stillImageSystem.getImageDataTxt)
 					self.stillImageSystem.requestedImageStart.connect(self.stillImageSystem.getRequestedImage)
+					self.stillImageSystem.previewImageStart.connect(self.stillImageSystem.getImagePreview)
 					self.stillImageSystem.getSettingsStart.connect(self.stillImageSystem.getPicSettings)
 					self.stillImageSystem.sendSettingsStart.connect(self.stillImageSystem.sendNewPicSettings)
 					self.stillImageSystem.timeSyncStart.connect(self.stillImageSystem.time_sync)
 					self.stillImageSystem.stillInterrupt.connect(lambda: self.stillImageSystem.setInterrupt(True))
 					
 					self.rfdStarted = True
+					QtCore.QTimer.singleShot(self.queueGap, self.drainQueue)		# Pick up the download queue from last time
 
 		if self.arduinoAttached.isChecked():
 			if not self.arduinoStarted:
@@ -591,8 +625,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			else:
 				self.callsign = self.aprsCallsign.text()
 			if not self.aprsCOM.text() == "":
-				aprsCOM = str(self.aprsCOM.text())
-				self.APRS = SerialDevice(aprsCOM, 9600, 5)
+				self.APRS = self.openAprsSource(str(self.aprsCOM.text()))
 				
 		# Get the IMEI for the iridium modem, default to placeholder
 		if self.iridiumIMEI.text() == '':
@@ -633,6 +666,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			self.groundLat = float(self.groundLat)
 			self.groundLon = float(self.groundLon)
 			self.groundAlt = float(self.groundAlt)
+			self.updateGroundStation()
 
 		# Determine which types of tracking are selected
 		self.useIridium = self.autoIridium.isChecked()
@@ -656,10 +690,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 		if self.useAPRS and not self.aprsStarted:
 			if self.APRSAttached:  # Don't start it up again if it's already going
-				self.getAPRS = GetAPRS(self, self.APRS.getDevice())
+				self.getAPRS = GetAPRS(self, self.APRS)
 				self.getAPRS.moveToThread(self.aprsThread)
 				self.getAPRS.start.connect(self.getAPRS.run)
-				self.getAPRS.setInterrupt.connect(self.getAPRS.interrupt)
+				self.getAPRS.setInterrupt.connect(lambda: self.getAPRS.interrupt())		# Not queued behind run, which doesn't return until interrupted
 				self.getAPRS.start.emit()
 				self.aprsStarted = True
 
@@ -679,7 +713,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 				self.getIridium = GetIridium(self, self.dbHost, self.dbUser, self.dbPass, self.dbName, self.IMEI)
 				self.getIridium.moveToThread(self.iridiumThread)
 				self.getIridium.start.connect(self.getIridium.run)
-				self.getIridium.setInterrupt.connect(self.getIridium.interrupt)
+				self.getIridium.setInterrupt.connect(lambda: self.getIridium.interrupt())		# Not queued behind run, which doesn't return until interrupted
 				self.getIridium.start.emit()
 				self.iridiumStarted = True
 
@@ -701,6 +735,17 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			self.useDisabled = True		
 			self.manualRefresh()
 
+	def openAprsSource(self, aprsCOM):
+		""" Opens the APRS source picked by the APRS COM entry, see AprsIngest.py """
+		kind, where = aprsSourceKind(aprsCOM)
+		if kind == 'aprsis':
+			return AprsIsSource(where[0], where[1], [str(self.callsign)])
+		if kind == 'kisstcp':
+			return KissTcpSource(where[0], where[1], [str(self.callsign)])
+		if kind == 'kiss':
+			return KissSerialSource(SerialDevice(where, 9600, 1).getDevice(), [str(self.callsign)])
+		return EagleSerialSource(SerialDevice(where, 9600, 5).getDevice(), [str(self.callsign)])
+
 	def createWarning(self, text):
 		""" Creates a warning pop up window that can be dismissed by clicking the button """
 		self.warning = QWidget()
@@ -731,13 +776,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 		else:
 			# Graphing Arrays - wipe them
-			self.receivedTime = []
-			self.receivedLat = []
-			self.receivedLon = []
-			self.receivedAlt = []
-			self.losLog = []
-			self.elevationLog = []
-			self.bearingLog = []
+			self.trackHistory.clear()
+			self.trackingGraphs.reset()
 			# Update a nice and pretty status indicator in red
 			self.status.setText("Offline")
 			self.changeTextColor(self.status, "red")
@@ -863,18 +903,27 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		""" Resume the RFD listen if you were doing it before """
 		
 		self.stillImageStop()
-		if self.stillImageStall:
-			self.stillImageStall = False
-			print('start')
-			self.rfdListenStart()
+
+		# Finish the queued download if that's what this was, and start the next one after a gap
+		if self.downloadQueue.active is not None:
+			self.downloadQueue.finish(self.stillImageSystem.imageComplete)
+			self.refreshQueueWindow()
+		QtCore.QTimer.singleShot(self.queueGap, self.drainQueue)
 			
 	def stillImageStart(self):
+		""" Gives the still image system the radio, returns False if something else (like a runtime data download) has it """
+		if not self.radio.beginSession(self.stillImageSystem.rfdSer):		# The still image system gets the radio, GPS lines still go to the listen
+			print("The RFD is busy, try again once it's done")
+			self.updateStillBrowser("The RFD is busy, try again once it's done")
+			return False
 		self.stillImageOnline = True
 		self.stillImageOnlineLabel.setText("ON")
 		self.changeTextColor(self.stillImageOnlineLabel, "green")
 		self.logData('stillImage', 'toggle'+','+"Still Image System Turned On")
+		return True
 		
 	def stillImageStop(self):
+		self.radio.endSession()
 		self.stillImageOnline = False
 		self.stillImageOnlineLabel.setText("OFF")
 		self.changeTextColor(self.stillImageOnlineLabel, "red")
@@ -884,14 +933,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		""" Starts the function associate to the button pressed in the worker thread """
 
 		if arg == 'mostRecent':
-			self.stillImageStart()
-			if self.rfdListenOnline:
-				self.stillImageStall = True
-				self.rfdListenStop()
+			if not self.stillImageStart():
+				return
 			self.stillImageSystem.mostRecentImageStart.emit(self.requestedImageName.text())
 			
 		if arg == 'selectImage':
-			self.stillImageStart()
+			if not self.stillImageStart():
+				return
 			if self.stillImageOnline:
 
 				# Build the image selection window
@@ -902,30 +950,31 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 				self.picSelectionLabel.setText("Select the Picture to Receive")
 				self.picSelectionButton = QPushButton()
 				self.picSelectionButton.setText("Select")
+				self.picQueueButton = QPushButton()
+				self.picQueueButton.setText("Add to Download Queue")
 				self.picSelectLayout = QVBoxLayout()
 				self.picSelectLayout.addWidget(self.picSelectionLabel)
 				self.picSelectLayout.addWidget(self.listbox)
 				self.picSelectLayout.addWidget(self.picSelectionButton)
+				self.picSelectLayout.addWidget(self.picQueueButton)
 				self.picSelectionWindow.setLayout(self.picSelectLayout)
 				self.picSelectionWindow.show()
 				# Move to the function if they click select
 				self.picSelectionButton.clicked.connect(lambda: self.checkRequestedImage(self.listbox.currentItem()))
+				self.picQueueButton.clicked.connect(lambda: self.queueImages(self.listbox.selectedItems()))
+				self.listbox.setSelectionMode(QAbstractItemView.ExtendedSelection)
 
-			if self.rfdListenOnline:
-				self.stillImageStall = True
-				self.rfdListenStop()
 
 			self.stillImageSystem.imageDataStart.emit()
 			
 		if arg == 'getPicSettings':
-			self.stillImageStart()
-			if self.rfdListenOnline:
-				self.stillImageStall = True
-				self.rfdListenStop()
+			if not self.stillImageStart():
+				return
 			self.stillImageSystem.getSettingsStart.emit()
 			
 		if arg == 'sendNewSettings':
-			self.stillImageStart()
+			if not self.stillImageStart():
+				return
 			# Update the global values based on current slider position
 			self.picWidth = int(self.picWidthSlider.value())
 			self.picHeight = int(self.picHeightSlider.value())
@@ -936,9 +985,6 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			self.picISO = int(self.picISOSlider.value())
 			picSettings = [self.picWidth,self.picHeight,self.picSharpness,self.picBrightness,self.picContrast,self.picSaturation,self.picISO]
 
-			if self.rfdListenOnline:
-				self.stillImageStall = True
-				self.rfdListenStop()
 			self.stillImageSystem.sendSettingsStart.emit(picSettings)
 			
 		if arg == 'HFlip':
@@ -956,10 +1002,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			self.updatePicture(self.displayPhotoPath)
 			
 		if arg == 'timeSync':
-			self.stillImageStart()
-			if self.rfdListenOnline:
-				self.stillImageStall = True
-				self.rfdListenStop()
+			if not self.stillImageStart():
+				return
 			self.stillImageSystem.timeSyncStart.emit()
 
 
@@ -969,27 +1013,144 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 	def updatePicture(self, displayPath):
 		""" Updates the still image system picture display to the picture associated with the path """
 		
-		pm = QPixmap(str(displayPath))		# Create a pixmap from the default image
-		if self.picHFlip:
-			if self.picVFlip:
-				pm = pm.transformed(QTransform().scale(-1,-1))
-			else:
-				pm = pm.transformed(QTransform().scale(-1,1))
-		elif self.picVFlip:
-			pm = pm.transformed(QTransform().scale(1,-1))
 		print("Updating Picture")
-		scaledPm = pm.scaled(self.picLabel.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
-		self.picLabel.setPixmap(scaledPm)			# Set the label to the map
-		self.picLabel.show()				# Show the image
 		self.displayPhotoPath = displayPath
+		self.resizeTimer.stop()
+		self.showPicture()
 		
 		self.logData('stillImage','newPic'+','+displayPath)
 
+	def showPicture(self, smooth=True):
+		""" Shows the current picture scaled to the label, from the picture cache when it's been shown at this size before """
+		pm = self.pictureCache.scaled(self.displayPhotoPath, self.picHFlip, self.picVFlip, self.picLabel.size(), smooth)
+		self.picLabel.setPixmap(pm)			# Set the label to the map
+		self.picLabel.show()				# Show the image
+
 	def updatePictureProgress(self, progress, maxProgress):
 		""" Updates the still image system photo progress bar based on the value and max value passed in as arguments """
 		self.photoProgressBar.setMaximum(maxProgress)
 		self.photoProgressBar.setValue(progress)
 
+		if self.downloadQueue.active is not None and maxProgress > 1:		# The bar is reset with (0,1) at the end
+			self.downloadQueue.progress(progress, maxProgress)
+			self.refreshQueueWindow()
+
+	def queueImages(self, items):
+		""" Still Image System: Adds the images selected from imagedata.txt to the download queue """
+
+		for each in items:
+			self.downloadQueue.add(str(each.text()).strip())
+			self.updateStillBrowser("Queued " + str(each.text())[0:15])
+		self.showQueueWindow()
+		self.drainQueue()
+
+	def drainQueue(self):
+		""" Starts the next queued download if the still image system is free """
+
+		if not self.rfdStarted or self.stillImageOnline or self.radio.busy():		# Picked up again when the radio is free
+			return
+		item = self.downloadQueue.next()
+		if item is None:
+			return
+		if not self.stillImageStart():
+			return
+		self.downloadQueue.start(item)
+		self.refreshQueueWindow()
+		self.stillImageSystem.requestedImageStart.emit(item.data)
+
+	def pauseQueue(self):
+		""" Stops the queue, the current download stops too and picks up where it left off when resumed """
+
+		self.downloadQueue.pause()
+		if self.downloadQueue.active is not None:
+			self.stillImageSystem.setInterrupt(True)
+		self.refreshQueueWindow()
+
+	def resumeQueue(self):
+		self.downloadQueue.resume()
+		self.refreshQueueWindow()
+		self.drainQueue()
+
+	def changeQueuePriority(self, change):
+		item = self.queueList.currentItem()
+		if item is not None:
+			self.downloadQueue.changePriority(str(item.text())[0:15], change)
+			self.refreshQueueWindow()
+
+	def removeFromQueue(self):
+		item = self.queueList.currentItem()
+		if item is not None:
+			self.downloadQueue.remove(str(item.text())[0:15])
+			self.refreshQueueWindow()
+
+	def showQueueWindow(self):
+		""" Still Image System: Window with the download queue, its progress and controls """
+
+		if self.queueWindow is not None:
+			self.queueWindow.show()
+			self.queueWindow.raise_()
+			return
+
+		# Build the queue window
+		self.queueWindow = QWidget()
+		self.queueWindow.setWindowTitle("Image Download Queue")
+		self.queueList = QListWidget()
+		self.queueStatusLabel = QLabel()
+		self.queueUpButton = QPushButton()
+		self.queueDownButton = QPushButton()
+		self.queueRemoveButton = QPushButton()
+		self.queueClearButton = QPushButton()
+		self.queuePauseButton = QPushButton()
+		self.queueResumeButton = QPushButton()
+		self.queueUpButton.setText("Raise Priority")
+		self.queueDownButton.setText("Lower Priority")
+		self.queueRemoveButton.setText("Remove")
+		self.queueClearButton.setText("Clear Finished")
+		self.queuePauseButton.setText("Pause")
+		self.queueResumeButton.setText("Resume")
+		self.queueHLayout = QHBoxLayout()
+		for each in [self.queueUpButton, self.queueDownButton, self.queueRemoveButton, self.queueClearButton, self.queuePauseButton, self.queueResumeButton]:
+			self.queueHLayout.addWidget(each)
+		self.queueVLayout = QVBoxLayout()
+		self.queueVLayout.addWidget(self.queueStatusLabel)
+		self.queueVLayout.addWidget(self.queueList)
+		self.queueVLayout.addLayout(self.queueHLayout)
+		self.queueWindow.setLayout(self.queueVLayout)
+
+		# Connect the buttons to the functions
+		self.queueUpButton.clicked.connect(lambda: self.changeQueuePriority(1))
+		self.queueDownButton.clicked.connect(lambda: self.changeQueuePriority(-1))
+		self.queueRemoveButton.clicked.connect(self.removeFromQueue)
+		self.queueClearButton.clicked.connect(lambda: self.downloadQueue.clearFinished())
+		self.queueClearButton.clicked.connect(self.refreshQueueWindow)
+		self.queuePauseButton.clicked.connect(self.pauseQueue)
+		self.queueResumeButton.clicked.connect(self.resumeQueue)
+
+		self.refreshQueueWindow()
+		self.queueWindow.show()
+
+	def refreshQueueWindow(self):
+		""" Rewrites the queue window's list, keeping the selected item selected """
+
+		if self.queueWindow is None:
+			return
+		current = self.queueList.currentItem()
+		selected = str(current.text())[0:15] if current is not None else None
+		queue = self.downloadQueue
+		items = [queue.active] if queue.active is not None else []
+		items += queue.pending()
+		items += [each for each in queue.items if each not in items]
+		self.queueList.clear()
+		for each in items:
+			self.queueList.addItem(queue.describe(each))
+			if each.name == selected:
+				self.queueList.setCurrentRow(self.queueList.count() - 1)
+
+		status = "Paused" if queue.paused else "Running"
+		if queue.rate > 0:
+			status += ", %d bytes/s" % queue.rate
+		self.queueStatusLabel.setText(status)
+
 	def checkRequestedImage(self, pic):
 		""" Still Image System: Make sure the user doesn't accidentally get a high res image """
 
@@ -1001,12 +1162,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			self.confirmationLabel = QLabel()
 			self.confirmationLabel.setText("WARNING! You have selected a high resolution image! Are you sure you want to download?")
 			self.confirmationYesButton = QPushButton()
+			self.confirmationPreviewButton = QPushButton()
 			self.confirmationNoButton = QPushButton()
 			self.confirmationYesButton.setText("Yes")
+			self.confirmationPreviewButton.setText("Preview First")
 			self.confirmationNoButton.setText("No")
 			self.confirmationHLayout = QHBoxLayout()
 			self.confirmationVLayout = QVBoxLayout()
 			self.confirmationHLayout.addWidget(self.confirmationYesButton)
+			self.confirmationHLayout.addWidget(self.confirmationPreviewButton)
 			self.confirmationHLayout.addWidget(self.confirmationNoButton)
 			self.confirmationVLayout.addWidget(self.confirmationLabel)
 			self.confirmationVLayout.addLayout(self.confirmationHLayout)
@@ -1015,6 +1179,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 			# Connect the buttons to the functions
 			self.confirmationYesButton.clicked.connect(lambda: self.getRequestedImageHelper(data))
+			self.confirmationPreviewButton.clicked.connect(lambda: self.getImagePreviewHelper(data))
 			self.confirmationNoButton.clicked.connect(lambda: self.deleteWindow(self.confirmationCheckWindow))
 			self.confirmationNoButton.clicked.connect(lambda: self.deleteWindow(self.picSelectionWindow))			
 
@@ -1031,8 +1196,48 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		except Exception, e:
 			print(str(e))
 
+		if not self.stillImageStart():
+			return
 		self.stillImageSystem.requestedImageStart.emit(data)
 
+	def getImagePreviewHelper(self, data):
+		""" Starts getting the requested image's thumbnail in the rfd thread """
+
+		# Get rid of the confirmation window, the full image is confirmed after the preview
+		try:
+			self.deleteWindow(self.confirmationCheckWindow)
+		except Exception, e:
+			print(str(e))
+
+		if not self.stillImageStart():
+			return
+		self.stillImageSystem.previewImageStart.emit(data)
+
+	def confirmFullImage(self, data):
+		""" Still Image System: With the preview showing, ask whether to download the full image """
+
+		# Create the window to ask for confirmation, with text and buttons
+		self.previewCheckWindow = QWidget()
+		self.previewCheckLabel = QLabel()
+		self.previewCheckLabel.setText("Preview of " + str(data)[0:15] + " received. Download the full image?")
+		self.previewYesButton = QPushButton()
+		self.previewNoButton = QPushButton()
+		self.previewYesButton.setText("Yes")
+		self.previewNoButton.setText("No")
+		self.previewHLayout = QHBoxLayout()
+		self.previewVLayout = QVBoxLayout()
+		self.previewHLayout.addWidget(self.previewYesButton)
+		self.previewHLayout.addWidget(self.previewNoButton)
+		self.previewVLayout.addWidget(self.previewCheckLabel)
+		self.previewVLayout.addLayout(self.previewHLayout)
+		self.previewCheckWindow.setLayout(self.previewVLayout)
+		self.previewCheckWindow.show()
+
+		# Connect the buttons to the functions
+		self.previewYesButton.clicked.connect(lambda: self.deleteWindow(self.previewCheckWindow))
+		self.previewYesButton.clicked.connect(lambda: self.getRequestedImageHelper(data))
+		self.previewNoButton.clicked.connect(lambda: self.deleteWindow(self.previewCheckWindow))
+
 	def picDefaultSettings(self):
 		""" Still Image System: Sets the camera variables to the default values """
 			
@@ -1083,10 +1288,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		return
 		
 	def resizePicture(self, event):
-		pm = QPixmap(self.displayPhotoPath)		# Create a pixmap from the default image
-		scaledPm = pm.scaled(self.picLabel.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
-		self.picLabel.setPixmap(scaledPm)			# Set the label to the map
-		self.picLabel.show()				# Show the image
+		""" Keeps the picture fitted to the tab while it's resized, with a fast scale until the resizing stops """
+		QTabWidget.resizeEvent(self.tabs, event)
+		self.showPicture(smooth=False)
+		self.resizeTimer.start(self.resizeDelay)		# Restarted by every resize event, so only the last one smooth scales
 		
 	def rfdListenButtonPress(self):
 		""" Receives the press of the listen button, and handles it """
@@ -1099,12 +1304,6 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			
 	def rfdListenStart(self):
 		""" Start the RFD Listen """
-		if self.stillImageOnline:
-			print("Still Image System cannot be Online")
-			self.updateRFDBrowser("Still Image System cannot be Online")
-			self.rfdListenOnline = False
-			return
-
 		if self.RFDAttached:		# Only try to do things if the RFD is attached
 			self.rfdListenOnline = True
 			self.rfdListenButton.setText("Stop Listening")		# Update the button text and label color
@@ -1133,61 +1332,67 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		self.logData("RFD", 'toggle'+','+"RFD Listen Offline")
 			
 	def rfdCommandsButtonPress(self):
-		""" Toggles the state of the RFD Commands """
+		""" Sends the command in the entries, alongside any commands still waiting for their acknowledge """
 		
-		# If the commands aren't online, turn them online, and change the text/color of the label and button
+		if self.stillImageOnline:		# Don't let this work if the still image system is using the RFD 900
+			print("Still Image System cannot be Online")
+			self.updateRFDBrowser("Still Image System cannot be Online")
+			return
+		if not self.RFDAttached:		# If no RFD, let the user know and return
+			print("No RFD Radio attached to this Computer")
+			self.updateRFDBrowser("No RFD Radio attached to this Computer")
+			return
+
+		# Acquire the identifier and command
+		identifier = str(self.rfdIDEntry.text())
+		command = str(self.rfdCommandEntry.text())
+		if identifier == '' or command == '':		# Don't send null strings
+			print("Null strings not allowed")
+			self.updateRFDBrowser("Null strings not allowed")
+			return
+
 		if not self.rfdCommandsOnline:
-			if self.stillImageOnline:		# Don't let this work if the still image system is using the RFD 900
-				print("Still Image System cannot be Online")
-				self.updateRFDBrowser("Still Image System cannot be Online")
-				return
-			if self.RFDAttached:		# Only try to do things if the RFD is attached	
-				self.rfdCommandsOnline = True
+			self.rfdCommandsOnline = True
+			self.logData("RFD",'toggle'+','+'RFD Commands Online')	# Log the toggle
 
-				self.logData("RFD",'toggle'+','+'RFD Commands Online')	# Log the toggle
-				self.rfdCommandButton.setText("STOP")		# Change the button and label to opposite state
-				self.rfdCommandsOnlineLabel.setText("ON")
-				self.changeTextColor(self.rfdCommandsOnlineLabel,"green")
-					
-				# Acquire the identifier and command
-				identifier = str(self.rfdIDEntry.text())
-				command = str(self.rfdCommandEntry.text())
-				if identifier == '' or command == '':		# Don't send null strings
-					print("Null strings not allowed")
-					self.updateRFDBrowser("Null strings not allowed")
-					self.rfdCommandsOnline = False
-					self.rfdListenOnline = False
-					self.rfdCommandButton.setText("START")
-					self.rfdCommandsOnlineLabel.setText("OFF")
-					self.changeTextColor(self.rfdCommandsOnlineLabel,"red")
-					return
-				else:
-					# Start up the RFD command function (and the listen if it isn't on already)
-					if not self.rfdListenOnline:
-						self.rfdListenStart()
-					self.rfdCommand.commandStart.emit(identifier,command)
-
-			else:		# If no RFD, let the user know and return
-				print("No RFD Radio attached to this Computer")
-				self.updateRFDBrowser("No RFD Radio attached to this Computer")
-				return
-		else:
-			# Turn off the RFD Commands, and change the button and label text and color
+		# Start up the RFD command function (and the listen if it isn't on already)
+		if not self.rfdListenOnline:
+			self.rfdListenStart()
+		self.rfdCommand.commandStart.emit(identifier,command)
+
+	def rfdCommandsStop(self):
+		""" Stops resending all of the outstanding commands """
+		if self.rfdCommandsOnline:
 			self.rfdCommand.commandInterrupt.emit()
+
+	def rfdCommandsDone(self, outstanding):
+		""" The command thread sent or retired a command, the commands go offline once none are outstanding """
+		self.updateCommandsLabel(outstanding)
+		if outstanding == 0 and self.rfdCommandsOnline:
 			self.rfdCommandsOnline = False
+			self.logData("RFD", 'toggle'+','+"RFD Commands Offline")
 
-			self.logData("RFD",'toggle'+','+"RFD Commands Offline")
-			self.rfdCommandButton.setText("START")
+	def updateCommandsLabel(self, outstanding):
+		if outstanding > 0:
+			self.rfdCommandsOnlineLabel.setText("%d WAITING" % outstanding)
+			self.changeTextColor(self.rfdCommandsOnlineLabel,"green")
+		else:
 			self.rfdCommandsOnlineLabel.setText("OFF")
 			self.changeTextColor(self.rfdCommandsOnlineLabel, "red")
-
-	def rfdCommandsDone(self):
-		self.rfdCommandsOnline = False
-		self.logData("RFD", 'toggle'+','+"RFD Commands Offline")
-		self.rfdCommandButton.setText("START")
-		self.rfdCommandsOnlineLabel.setText("OFF")
-		self.changeTextColor(self.rfdCommandsOnlineLabel, "red")
 		
+	def showCommandHistory(self):
+		""" Prints the latest commands with their attempts and latency to the RFD browser """
+		if not self.rfdStarted:
+			self.updateRFDBrowser("No RFD Radio attached to this Computer")
+			return
+		lines = self.rfdCommand.commandHistory()
+		if not lines:
+			self.updateRFDBrowser("No commands sent yet")
+		for line in lines:
+			self.updateRFDBrowser(line)
+		if self.rfdCommand.srtt is not None:
+			self.updateRFDBrowser("Smoothed round trip %.2f s" % self.rfdCommand.srtt)
+
 	def getPiRuntimeDataButtonPress(self):
 		""" Check to see if the system is in a state where it can receive the pi Runtime Data """
 		
@@ -1201,11 +1406,15 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			self.updateRFDBrowser("No RFD Attached")
 			return
 
-		self.rfdListenStop()
+		if self.radio.busy() or not self.radio.beginSession(self.rfdCommand.runtimeSer):		# The runtime data download gets the radio until it's done
+			print("The RFD is busy, try again once it's done")
+			self.updateRFDBrowser("The RFD is busy, try again once it's done")
+			return
 		self.rfdCommand.piruntimeStart.emit()
 	
 	def piruntimeDone(self):
-		self.rfdListenStart()
+		self.radio.endSession()
+		QtCore.QTimer.singleShot(self.queueGap, self.drainQueue)		# The download queue waits while the radio is busy
 
 	def requestDeviceStatus(self):
 		""" Check to see if the system is in a state where it can receive the command relay device status """
@@ -1279,20 +1488,23 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		to the ones known. Updates the browsers in the payloads tabs as well
 		"""
 		
+		payloadLine = telemetryParser.parsePayloadLine(str(received))
+		if payloadLine is None:		# Not a payload message
+			return
+
 		# Go through each payload in the payload list, and see if this message is from a known payload
 		knownPayload = False
 		for each in self.payloadList:
-			if each.getName() == str(received.split(';')[0]):
-				each.addMessage(str(received.split(';')[1][:-2]))
+			if each.getName() == payloadLine.name:
+				each.addMessage(payloadLine.message)
 				knownPayload = True
 		
-		if not knownPayload:
-			if len(received.split(';')) == 2:		# If there is a new identifier, make a new payload and add the message to it
-				print("Made new Payload: " + str(received.split(';')[0]))
-				temp = self.tabs.currentIndex()
-				self.tabs.setCurrentIndex(4)		# Change the current tab index to the payloads tab (to make the focus right)
-				self.createNewPayload(str(received.split(';')[0]), str(received.split(';')[1][:-2]))		# Make the new payload
-				self.tabs.setCurrentIndex(temp)		# Switch back to the tab you were on before it was made
+		if not knownPayload:		# If there is a new identifier, make a new payload and add the message to it
+			print("Made new Payload: " + payloadLine.name)
+			temp = self.tabs.currentIndex()
+			self.tabs.setCurrentIndex(4)		# Change the current tab index to the payloads tab (to make the focus right)
+			self.createNewPayload(payloadLine.name, payloadLine.message)		# Make the new payload
+			self.tabs.setCurrentIndex(temp)		# Switch back to the tab you were on before it was made
 		
 		# Update the text browsers and maps in the payloads tab for each payload
 		for each in self.payloadList:
@@ -1558,7 +1770,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		tempAlt = tempAlt.split(".")
 		self.groundAlt = int(tempAlt[0])										# Get the altitude to the floor(foot)
 		self.centerBear = float(tempoffsetDegrees)
-		declination = float(geomag.declination(dlat=self.groundLat, dlon=self.groundLon, h=self.groundAlt))
+		self.updateGroundStation()
+		declination = declinationService.declination(self.groundLat, self.groundLon, self.groundAlt)
 		self.centerBear = (self.centerBear+declination)
 		if self.centerBear > 360:
 			self.centerBear -= 360
@@ -1576,43 +1789,37 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 		self.centerBearSet = True		# Lets the program know that the center bearing has been set before
 		self.manualRefresh()
 
+	def updateGroundStation(self):
+		""" Rebuilds the pointing solver and declination grid for the current ground station, and repoints the graphing history against it in one pass """
+
+		self.pointingSolver = PointingSolver(self.groundLat, self.groundLon, self.groundAlt)
+		declinationService.setCenter(self.groundLat, self.groundLon)
+		if len(self.trackHistory) > 0:
+			track = self.trackHistory
+			track.setPointing(*self.pointingSolver.solve(track.column('lat'), track.column('lon'), track.column('alt')))
+
 	def updateGraphingArrays(self, location):
-		if len(self.receivedTime) == 0:
-			self.receivedTime = np.append(self.receivedTime, location.getSeconds())
-			self.receivedLon = np.append(self.receivedLon, location.getLon())
-			self.receivedLat = np.append(self.receivedLat, location.getLat())
-			self.receivedAlt = np.append(self.receivedAlt, location.getAlt())
-			self.bearingLog = np.append(self.bearingLog, location.getBear())
-			self.elevationLog = np.append(self.elevationLog, location.getEle())
-			self.losLog = np.append(self.losLog, location.getLOS())
-		elif self.receivedTime[len(self.receivedTime) - 1] < location.getSeconds():
-			self.receivedTime = np.append(self.receivedTime, location.getSeconds())
-			self.receivedLon = np.append(self.receivedLon, location.getLon())
-			self.receivedLat = np.append(self.receivedLat, location.getLat())
-			self.receivedAlt = np.append(self.receivedAlt, location.getAlt())
-			self.bearingLog = np.append(self.bearingLog, location.getBear())
-			self.elevationLog = np.append(self.elevationLog, location.getEle())
-			self.losLog = np.append(self.losLog, location.getLOS())
+		""" Appends the update to the track history if it's newer than the last point """
+		if len(self.trackHistory) == 0 or self.trackHistory.last('seconds') < location.getSeconds():
+			self.trackHistory.append(location)
 
 	def logData(self, type, msg):
-		""" Logs the message in the correct file designated in the type argument """
-		if self.saveData:
-			try:
-				if type == "RFD":
-					f = open(self.rfdLog, 'a')
-				elif type == "stillImage":
-					f = open(self.stillImageLog, 'a')
-				elif type == "balloonLocation":
-					f = open(self.balloonLocationLog, 'a')
-				elif type == "pointing":
-					f = open(self.pointingLog, 'a')
-				f.write(str(datetime.today().strftime("%m/%d/%Y %H:%M:%S"))+','+msg+'\n')
-				f.close()
-			except:
-				print("Error logging data: "+type+','+msg)
-
-		else:
-			return
+		""" Queues the message for the log file designated in the type argument """
+		if self.saveData and self.flightLogger is not None:
+			self.flightLogger.log(type, msg)
+
+	def logRecord(self, type, values):
+		""" Queues the values as a record for the binary log designated in the type argument """
+		if self.saveData and self.flightLogger is not None:
+			self.flightLogger.logRecord(type, values)
+
+	def stopLogging(self):
+		""" Writes out any queued log lines and closes the log files """
+		if self.flightLogger is not None:
+			self.flightLogger.stop()
+			stats = self.flightLogger.getStats()
+			print("Logging stopped: %d lines written, %d dropped, max queue depth %d" % (stats['written'], stats['dropped'], stats['maxQueueDepth']))
+			self.flightLogger = None
 
 	def pointToMostRecentBalloon(self):
 		""" Aims the tracker at the balloon, even if the antenna tracker is offline """
@@ -1682,6 +1889,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 			
 		# Write the new pointing location to the log file
 		self.logData("pointing", str(bearing)+','+str(elevation))
+		self.logRecord("pointing", (bearing, elevation))
 
 		# Update pointing values
 		self.antennaBear = bearing
@@ -1702,5 +1910,9 @@ if __name__ == "__main__":
 	
 	mGui = MainWindow()						# Launch the main window
 	mGui.showMaximized()					# Shows the main window maximized
+	if '--replay' in sys.argv:				# Replay a recorded flight: --replay <BALLOONLOCATIONLOG> [speed]
+		idx = sys.argv.index('--replay')
+		replaySpeed = float(sys.argv[idx+2]) if len(sys.argv) > idx+2 else 1.0
+		mGui.startReplay(sys.argv[idx+1], replaySpeed)
 	sys.stdout = Unbuffered(sys.stdout)		# Sets up an unbuffered stream
 	app.exec_()								# Starts the application
@@ -0,0 +1,590 @@
+"""
+APRS ingest for the APRS tracking method, from a KISS TNC (serial or TCP, like Direwolf) or an APRS-IS server.
+
+Position reports are decoded from the three APRS formats balloons send: uncompressed
+("!DDMM.mmN/DDDMM.mmW..."), compressed (base 91) and Mic-E (latitude in the AX.25 destination).
+Busy frequencies and APRS-IS feeds carry far more traffic than the balloon's, so every packet is
+checked against the tracked callsigns before any decoding: KISS frames by comparing the raw AX.25
+source address bytes, APRS-IS lines by their prefix.
+
+The APRS COM entry picks the source:
+	COM3 or /dev/ttyUSB0					Eagle flight computer on a serial port (the original)
+	kiss:COM3								KISS TNC on a serial port
+	kiss:localhost:8001						KISS TNC over TCP
+	aprsis:rotate.aprs2.net[:14580]			APRS-IS, filtered to the callsign
+
+Self test against a local stand-in server:
+	python AprsIngest.py
+"""
+
+import re
+import time
+import socket
+import threading
+from TelemetryParser import AprsPosition, SOURCE_APRS, telemetryParser
+
+# KISS framing
+FEND = '\xc0'
+FESC = '\xdb'
+TFEND = '\xdc'
+TFESC = '\xdd'
+
+APRSIS_PORT = 14580
+
+FEET_PER_METER = 3.28084
+
+# Uncompressed position: "DDMM.mmN/DDDMM.mmW$", spaces are position ambiguity
+UNCOMPRESSED = re.compile(r'(\d{2})([\d ]{2}\.[\d ]{2})([NS])(.)(\d{3})([\d ]{2}\.[\d ]{2})([EW])(.)')
+
+# Compressed position: symbol table, 4 base 91 latitude, 4 longitude, symbol, course/speed or altitude, type
+COMPRESSED = re.compile(r'([/\\A-Za-j0-9])([!-{]{4})([!-{]{4})(.)(.)(.)(.)')
+
+# Altitude in the comment, feet
+ALTITUDE = re.compile(r'/A=(-?\d{1,6})')
+
+# Mic-E altitude in the status text, 3 base 91 characters then }, meters above -10000
+MICE_ALTITUDE = re.compile(r'([!-{]{3})\}')
+
+# Timestamp after / or @, only HHMMSSh gives the time of day to the second
+TIMESTAMP = re.compile(r'(\d{6})([zh/])')
+
+
+def kissEscape(data):
+	return data.replace(FESC, FESC + TFESC).replace(FEND, FESC + TFEND)
+
+
+def kissUnescape(data):
+	return data.replace(FESC + TFEND, FEND).replace(FESC + TFESC, FESC)
+
+
+def kissEncode(frame, port=0):
+	""" Wraps an AX.25 frame as a KISS data frame """
+	return FEND + chr(port << 4) + kissEscape(frame) + FEND
+
+
+class KissDeframer:
+	""" Splits the bytes from a KISS TNC into AX.25 frames """
+
+	def __init__(self):
+		self.buffer = ''
+
+	def feed(self, data):
+		""" Returns the data frames completed by data, without their KISS command byte """
+		self.buffer += data
+		parts = self.buffer.split(FEND)
+		self.buffer = parts.pop()
+		frames = []
+		for part in parts:
+			if len(part) < 2 or ord(part[0]) & 0x0f != 0:		# Empty, or not a data frame
+				continue
+			frames.append(kissUnescape(part[1:]))
+		return frames
+
+
+def ax25Address(callsign, last=False, repeated=False):
+	""" The 7 byte AX.25 address of CALL-SSID """
+	call, _, ssid = callsign.partition('-')
+	call = call.upper().ljust(6)[:6]
+	ssidByte = 0x60 | (int(ssid or 0) & 0x0f) << 1
+	if last:
+		ssidByte |= 0x01
+	if repeated:
+		ssidByte |= 0x80
+	return ''.join([chr(ord(c) << 1) for c in call]) + chr(ssidByte)
+
+
+def ax25Callsign(address):
+	""" CALL-SSID from a 7 byte AX.25 address """
+	call = ''.join([chr(ord(c) >> 1) for c in address[:6]]).rstrip()
+	ssid = (ord(address[6]) >> 1) & 0x0f
+	if ssid:
+		return call + '-' + str(ssid)
+	return call
+
+
+def encodeAx25(packet):
+	""" An AX.25 UI frame from a TNC2 format packet, "SOURCE>DEST,PATH:info" """
+	header, info = packet.split(':', 1)
+	source, path = header.split('>', 1)
+	path = path.split(',')
+	addresses = [path[0], source] + path[1:]
+	frame = ''
+	for i, each in enumerate(addresses):
+		frame += ax25Address(each.rstrip('*'), i == len(addresses) - 1, each.endswith('*'))
+	return frame + '\x03\xf0' + info
+
+
+def decodeAx25(frame):
+	""" (source, destination, path, info) of an AX.25 UI frame, None if it isn't one """
+	end = 0
+	while end + 7 <= len(frame):
+		end += 7
+		if ord(frame[end - 1]) & 0x01:		# Last address
+			break
+	else:
+		return None
+	if end < 14 or frame[end:end + 2] != '\x03\xf0':
+		return None
+	dest = ax25Callsign(frame[0:7])
+	source = ax25Callsign(frame[7:14])
+	path = [ax25Callsign(frame[i:i + 7]) for i in range(14, end, 7)]
+	return source, dest, path, frame[end + 2:]
+
+
+def base91(text):
+	value = 0
+	for c in text:
+		value = value*91 + ord(c) - 33
+	return value
+
+
+class AprsDecoder:
+	"""
+	Decodes APRS position reports from the tracked callsigns. A callsign without an SSID matches every SSID
+	of that call, like the Eagle decoder's search. Counts the packets that were filtered out, decoded,
+	and the ones from tracked callsigns that weren't usable positions
+	"""
+
+	def __init__(self, callsigns=()):
+		self.filtered = 0
+		self.parsed = 0
+		self.errors = 0
+		self.setCallsigns(callsigns)
+
+	def setCallsigns(self, callsigns):
+		self.callsigns = [str(each).upper() for each in callsigns if each]
+
+		# APRS-IS line prefixes
+		prefixes = []
+		for each in self.callsigns:
+			if '-' in each:
+				prefixes.append(each + '>')
+			else:
+				prefixes += [each + '>', each + '-']
+		self.linePrefixes = tuple(prefixes)
+
+		# AX.25 source addresses, the shifted call and the SSID bits (None for any SSID)
+		self.addresses = []
+		for each in self.callsigns:
+			address = ax25Address(each)
+			self.addresses.append((address[:6], ord(address[6]) & 0x1e if '-' in each else None))
+
+	def matchesFrame(self, frame):
+		""" Whether an AX.25 frame's source address is a tracked callsign, without decoding it """
+		call = frame[7:13]
+		for address, ssid in self.addresses:
+			if call == address and (ssid is None or len(frame) > 13 and ord(frame[13]) & 0x1e == ssid):
+				return True
+		return False
+
+	def decodeFrame(self, frame):
+		""" The position report in an AX.25 frame from a tracked callsign, None for anything else """
+		if not self.matchesFrame(frame):
+			self.filtered += 1
+			return None
+		decoded = decodeAx25(frame)
+		if decoded is None:
+			self.errors += 1
+			return None
+		source, dest, path, info = decoded
+		return self.decodeInfo(source, dest, info)
+
+	def decodeLine(self, line):
+		""" The position report in an APRS-IS (TNC2 format) line from a tracked callsign, None for anything else """
+		if not line.startswith(self.linePrefixes):
+			self.filtered += 1
+			return None
+		header, sep, info = line.rstrip('\r\n').partition(':')
+		source, sep2, path = header.partition('>')
+		if not sep or not sep2:
+			self.errors += 1
+			return None
+		return self.decodeInfo(source, path.split(',')[0], info)
+
+	def decodeInfo(self, source, dest, info):
+		""" Decodes the information field of a packet from source, None if it isn't a position report """
+		position = None
+		try:
+			kind = info[:1]
+			if kind in ('!', '='):
+				position = self.decodePosition(info[1:])
+			elif kind in ('/', '@'):
+				position = self.decodePosition(info[8:], info[1:8])
+			elif kind in ('`', "'", '\x1c', '\x1d'):
+				position = self.decodeMicE(dest, info)
+			elif '!' in info[:40]:		# Some trackers put text before the position
+				position = self.decodePosition(info[info.index('!') + 1:])
+		except (ValueError, IndexError):
+			position = None
+		if position is None:
+			self.errors += 1
+			telemetryParser.errors[SOURCE_APRS] += 1
+			return None
+		lat, lon, alt, stamp = position
+		if stamp is None:		# No time in the packet, use the time it was received
+			now = time.gmtime()
+			stamp = (now.tm_hour, now.tm_min, now.tm_sec)
+		self.parsed += 1
+		telemetryParser.parsed[SOURCE_APRS] += 1
+		return AprsPosition(source, '%02d:%02d:%02d' % stamp, stamp[0]*3600 + stamp[1]*60 + stamp[2], lat, lon, alt)
+
+	def decodePosition(self, body, timestamp=None):
+		""" (lat, lon, alt, (h,m,s) or None) of an uncompressed or compressed position, alt None if it wasn't sent """
+		stamp = None
+		if timestamp is not None:
+			m = TIMESTAMP.match(timestamp)
+			if m is None:
+				return None
+			if m.group(2) == 'h':
+				digits = m.group(1)
+				stamp = (int(digits[0:2]), int(digits[2:4]), int(digits[4:6]))
+
+		m = UNCOMPRESSED.match(body)
+		if m is not None:
+			latDeg, latMin, ns, table, lonDeg, lonMin, ew, symbol = m.groups()
+			lat = int(latDeg) + float(latMin.replace(' ', '0'))/60
+			lon = int(lonDeg) + float(lonMin.replace(' ', '0'))/60
+			if ns == 'S':
+				lat = -lat
+			if ew == 'W':
+				lon = -lon
+			comment = body[m.end():]
+			alt = None
+		else:
+			m = COMPRESSED.match(body)
+			if m is None:
+				return None
+			table, latText, lonText, symbol, c, s, t = m.groups()
+			lat = 90 - base91(latText)/380926.0
+			lon = -180 + base91(lonText)/190463.0
+			comment = body[m.end():]
+			alt = None
+			if c != ' ' and (ord(t) - 33) >> 3 & 0x03 == 2:		# cs holds the altitude from a GGA sentence
+				alt = 1.002**((ord(c) - 33)*91 + ord(s) - 33)
+		if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+			return None
+		a = ALTITUDE.search(comment)
+		if a is not None:
+			alt = float(a.group(1))
+		return lat, lon, alt, stamp
+
+	def decodeMicE(self, dest, info):
+		""" (lat, lon, alt, None) of a Mic-E position, the latitude and longitude flags are in the destination """
+		dest = dest.split('-')[0]
+		if len(dest) != 6 or len(info) < 9:
+			return None
+		digits = ''
+		for c in dest:
+			if '0' <= c <= '9':
+				digits += c
+			elif 'A' <= c <= 'J':
+				digits += chr(ord(c) - ord('A') + ord('0'))
+			elif 'P' <= c <= 'Y':
+				digits += chr(ord(c) - ord('P') + ord('0'))
+			elif c in 'KLZ':		# Position ambiguity
+				digits += '0'
+			else:
+				return None
+		lat = int(digits[0:2]) + (int(digits[2:4]) + int(digits[4:6])/100.0)/60
+		if dest[3] < 'P':
+			lat = -lat
+
+		lon = ord(info[1]) - 28
+		if dest[4] >= 'P':
+			lon += 100
+		if 180 <= lon <= 189:
+			lon -= 80
+		elif 190 <= lon <= 199:
+			lon -= 190
+		minutes = ord(info[2]) - 28
+		if minutes >= 60:
+			minutes -= 60
+		lon = lon + (minutes + (ord(info[3]) - 28)/100.0)/60
+		if dest[5] >= 'P':
+			lon = -lon
+		if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+			return None
+
+		alt = None
+		a = MICE_ALTITUDE.search(info, 9)
+		if a is not None:
+			alt = (base91(a.group(1)) - 10000)*FEET_PER_METER
+		return lat, lon, alt, None
+
+
+class AprsSource:
+	""" Something positions are read from, read() returns the positions from the tracked callsigns that arrived since the last call """
+
+	def __init__(self, callsigns=()):
+		self.decoder = AprsDecoder(callsigns)
+
+	def setCallsigns(self, callsigns):
+		self.decoder.setCallsigns(callsigns)
+
+	def read(self):
+		return []
+
+	def close(self):
+		pass
+
+
+class EagleSerialSource(AprsSource):
+	""" Eagle flight computer lines from a serial port, decoded by the telemetry parser """
+
+	def __init__(self, ser, callsigns=()):
+		AprsSource.__init__(self, callsigns)
+		self.ser = ser
+
+	def read(self):
+		line = str(self.ser.readline())
+		positions = []
+		for callsign in self.decoder.callsigns:
+			position = telemetryParser.parseEagleAprs(line, callsign)
+			if position is not None:
+				positions.append(position)
+		return positions
+
+	def close(self):
+		self.ser.close()
+
+
+class KissSerialSource(AprsSource):
+	""" A KISS TNC on a serial port """
+
+	def __init__(self, ser, callsigns=()):
+		AprsSource.__init__(self, callsigns)
+		self.ser = ser
+		self.deframer = KissDeframer()
+
+	def read(self):
+		data = self.ser.read(max(self.ser.inWaiting(), 1))		# Everything waiting, or wait for the next byte
+		positions = []
+		for frame in self.deframer.feed(data):
+			position = self.decoder.decodeFrame(frame)
+			if position is not None:
+				positions.append(position)
+		return positions
+
+	def close(self):
+		self.ser.close()
+
+
+class SocketSource(AprsSource):
+	""" A TCP source, connects on the first read and reconnects after the connection drops """
+
+	def __init__(self, host, port, callsigns=(), timeout=1.0, retryDelay=5.0):
+		AprsSource.__init__(self, callsigns)
+		self.host = host
+		self.port = port
+		self.timeout = timeout				# Seconds a read waits for data
+		self.retryDelay = retryDelay		# Seconds between connection attempts
+		self.sock = None
+		self.lastAttempt = 0
+
+	def connect(self):
+		self.lastAttempt = time.time()
+		self.sock = socket.create_connection((self.host, self.port), self.timeout)
+		self.sock.settimeout(self.timeout)
+		self.connected()
+
+	def connected(self):
+		""" Called after each connection, for logging in """
+		pass
+
+	def handle(self, data):
+		""" Returns the positions decoded from data """
+		return []
+
+	def read(self):
+		if self.sock is None:
+			if time.time() - self.lastAttempt < self.retryDelay:
+				time.sleep(self.timeout)
+				return []
+			try:
+				self.connect()
+			except (socket.error, socket.timeout), e:
+				print("Error connecting to APRS source " + self.host + ":" + str(self.port) + ": " + str(e))
+				self.close()
+				return []
+		try:
+			data = self.sock.recv(4096)
+		except socket.timeout:
+			return []
+		except socket.error, e:
+			print("APRS source connection lost: " + str(e))
+			self.close()
+			return []
+		if data == '':
+			print("APRS source closed the connection")
+			self.close()
+			return []
+		return self.handle(data)
+
+	def close(self):
+		if self.sock is not None:
+			try:
+				self.sock.close()
+			except socket.error:
+				pass
+		self.sock = None
+
+
+class KissTcpSource(SocketSource):
+	""" A KISS TNC over TCP, like Direwolf's KISS port """
+
+	def connected(self):
+		self.deframer = KissDeframer()
+
+	def handle(self, data):
+		positions = []
+		for frame in self.deframer.feed(data):
+			position = self.decoder.decodeFrame(frame)
+			if position is not None:
+				positions.append(position)
+		return positions
+
+
+class AprsIsSource(SocketSource):
+	""" An APRS-IS server, logged in receive only with a filter for the tracked callsigns """
+
+	def __init__(self, host, port=APRSIS_PORT, callsigns=(), login='N0CALL', passcode='-1', **kwargs):
+		SocketSource.__init__(self, host, port, callsigns, **kwargs)
+		self.login = login
+		self.passcode = passcode
+
+	def connected(self):
+		self.buffer = ''
+		budlist = ' '.join(['b/' + each + ('' if '-' in each else '*') for each in self.decoder.callsigns])
+		self.sock.sendall('user %s pass %s vers AntennaTracker 1.0 filter %s\r\n' % (self.login, self.passcode, budlist))
+
+	def handle(self, data):
+		lines = (self.buffer + data).split('\n')
+		self.buffer = lines.pop()
+		positions = []
+		for line in lines:
+			if line.startswith('#'):		# Server comments and keepalives
+				continue
+			position = self.decoder.decodeLine(line)
+			if position is not None:
+				positions.append(position)
+		return positions
+
+
+def aprsSourceKind(text):
+	"""
+	('eagle', port), ('kiss', port), ('kisstcp', (host, port)) or ('aprsis', (host, port)) for an APRS COM entry,
+	the serial ports are opened by the GUI
+	"""
+	text = text.strip()
+	if text.startswith('aprsis:'):
+		host, _, port = text[len('aprsis:'):].partition(':')
+		return 'aprsis', (host, int(port or APRSIS_PORT))
+	if text.startswith('kiss:'):
+		rest = text[len('kiss:'):]
+		host, _, port = rest.rpartition(':')
+		if host and port.isdigit():
+			return 'kisstcp', (host, int(port))
+		return 'kiss', rest
+	return 'eagle', text
+
+
+class AprsStandIn:
+	"""
+	A local stand-in for an APRS-IS server or KISS TNC, streams the TNC2 format packets it's given to every client.
+	As APRS-IS it expects a login line first and sends the packets unfiltered, so the callsign filtering is exercised
+	"""
+
+	def __init__(self, packets, kiss=False, interval=0, host='127.0.0.1', port=0):
+		self.packets = packets
+		self.kiss = kiss
+		self.interval = interval			# Seconds between packets
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server.bind((host, port))
+		self.server.listen(5)
+		self.server.settimeout(0.2)
+		self.host, self.port = self.server.getsockname()
+		self.logins = []
+		self.stopEvent = threading.Event()
+		self.thread = threading.Thread(target=self.serve)
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopEvent.set()
+		self.thread.join(1)
+		self.server.close()
+
+	def serve(self):
+		while not self.stopEvent.is_set():
+			try:
+				client, address = self.server.accept()
+			except socket.timeout:
+				continue
+			clientThread = threading.Thread(target=self.stream, args=(client,))
+			clientThread.daemon = True
+			clientThread.start()
+
+	def stream(self, client):
+		try:
+			if not self.kiss:
+				client.sendall('# aprsc stand-in\r\n')
+				login = client.makefile().readline()
+				self.logins.append(login.strip())
+				client.sendall('# logresp N0CALL unverified, server STANDIN\r\n')
+			for packet in self.packets:
+				if self.stopEvent.is_set():
+					break
+				if self.kiss:
+					client.sendall(kissEncode(encodeAx25(packet)))
+				else:
+					client.sendall(packet + '\r\n')
+				if self.interval:
+					time.sleep(self.interval)
+			self.stopEvent.wait()
+		except socket.error:
+			pass
+		finally:
+			client.close()
+
+
+# Packets for the self test and benchmarks, the balloon's and some other traffic
+BALLOON_PACKETS = [
+	'KD0FNR-11>APRS,WIDE1-1,WIDE2-1:!4458.23N/09314.52WO000/000/A=012345 Eagle',
+	'KD0FNR-11>APRS,WIDE2-1:/123456h4500.00N/09300.00WO090/015/A=023456',
+	'KD0FNR-11>APRS:=/5L!!<*e7OS]S',
+	'KD0FNR-11>445X2S,WIDE1-1:`y*PlNjO/"To}',
+]
+OTHER_PACKETS = [
+	'W0ABC-9>APDR15,WIDE1-1:=4459.00N/09312.00W>Driving',
+	'N0XYZ>APRS,TCPIP*,qAC,T2USA:@092345z4455.55N/09322.22W_000/000g005t045',
+	'K0DEF-1>APN391,WIDE2-1:!4501.00NS09301.00W#PHG5360',
+]
+
+
+if __name__ == "__main__":
+	expected = [(44.97050, -93.24200, 12345), (45.0, -93.0, 23456), (49.5, -72.75, 10004), (44.97050, -93.24200, 9843)]
+	decoder = AprsDecoder(['KD0FNR-11'])
+	for packet, (lat, lon, alt) in zip(BALLOON_PACKETS, expected):
+		position = decoder.decodeLine(packet)
+		ok = position is not None and abs(position.lat - lat) < 1e-4 and abs(position.lon - lon) < 1e-4 and abs(position.alt - alt) < 1
+		print(packet + '\n\t' + str(position) + ('' if ok else ' WRONG'))
+
+	for kiss in [False, True]:
+		packets = OTHER_PACKETS*50 + BALLOON_PACKETS
+		standIn = AprsStandIn(packets, kiss).start()
+		if kiss:
+			source = KissTcpSource(standIn.host, standIn.port, ['KD0FNR'])
+		else:
+			source = AprsIsSource(standIn.host, standIn.port, ['KD0FNR'])
+		positions = []
+		killTime = time.time() + 5
+		while len(positions) < len(BALLOON_PACKETS) and time.time() < killTime:
+			positions += source.read()
+		source.close()
+		standIn.stop()
+		print("%s: %d positions, %d filtered, %d errors %s" % ('KISS' if kiss else 'APRS-IS', len(positions),
+			source.decoder.filtered, source.decoder.errors, standIn.logins))
@@ -1,11 +1,14 @@
 from PointingMath import *
-import geomag
+from MagneticDeclination import declinationService
 
 class BalloonUpdate(object):
 	"""
-	A class to hold all of the information in a new balloon position and pointing update
+	A class to hold all of the information in a new balloon position and pointing update.
+	Slotted, since one is created for every update from every tracking source
 	"""
 
+	__slots__ = ('time', 'seconds', 'lat', 'lon', 'alt', 'trackingMethod', 'bear', 'ele', 'los', 'magDec', 'replayed')
+
 	def __init__(self,time,seconds,lat,lon,alt,trackingMethod,groundLat,groundLon,groundAlt):
 		self.time = time
 		self.seconds = seconds
@@ -13,13 +16,14 @@ class BalloonUpdate(object):
 		self.lon = lon
 		self.alt = alt
 		self.trackingMethod = trackingMethod
+		self.replayed = False		# Set by FlightReplay, so the recorded flight isn't logged again or held back by the tracking method settings
 
 		### Calculate pointing values and distances ###
 		distanceToTarget = haversine(groundLat, groundLon, self.lat, self.lon)
 		self.bear = bearing(groundLat, groundLon, self.lat, self.lon)
 		self.ele = elevationAngle(self.alt,groundAlt,distanceToTarget)
 		self.los = losDistance(self.alt,groundAlt,distanceToTarget)
-		self.magDec = geomag.declination(dlat = self.lat,dlon = self.lon, h = self.alt)
+		self.magDec = declinationService.declination(self.lat, self.lon, self.alt)
 
 	def getTime(self):
 		return self.time
@@ -49,4 +53,7 @@ class BalloonUpdate(object):
 		return self.trackingMethod
 		
 	def getSeconds(self):
-		return self.seconds
\ No newline at end of file
+		return self.seconds
+
+	def isReplayed(self):
+		return self.replayed
\ No newline at end of file
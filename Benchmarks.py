@@ -0,0 +1,273 @@
+"""
+Micro-benchmarks for the ground station software, run with:
+	python Benchmarks.py
+"""
+
+import os
+import time
+import base64
+import hashlib
+import binascii
+import shutil
+import tempfile
+import threading
+from TelemetryParser import TelemetryParser
+from ImageTransfer import INTEGRITY, ImageSender, ImageReceiver
+from LinkSimulator import SimulatedLink, PiResponder
+from AprsIngest import AprsDecoder, encodeAx25, BALLOON_PACKETS, OTHER_PACKETS
+from RadioMultiplexer import RadioMultiplexer, PRIORITY_COMMAND, PRIORITY_CONTROL
+
+# Link configurations for benchmarkLink, the RFD runs at 38400 baud
+LINK_CONFIGS = [
+	('clean', {'baud': 38400, 'latency': 0.05}),
+	('bit errors 1e-5', {'baud': 38400, 'latency': 0.05, 'bitErrorRate': 1e-5}),
+	('drops and insertions 1e-4', {'baud': 38400, 'latency': 0.05, 'dropRate': 1e-4, 'insertRate': 1e-4}),
+	('half second latency', {'baud': 38400, 'latency': 0.5}),
+]
+
+
+def timeCalls(function, args, minTime=0.5):
+	""" Calls function(*args) repeatedly for at least minTime seconds, returns the calls per second """
+
+	count = 0
+	start = time.time()
+	elapsed = 0
+	while elapsed < minTime:
+		for i in xrange(1000):
+			function(*args)
+		count += 1000
+		elapsed = time.time() - start
+	return count/elapsed
+
+
+def benchmarkParsers():
+	""" Lines per second for each telemetry format, for good and malformed frames """
+
+	parser = TelemetryParser()
+	callsign = 'KD0FNR-11'
+	cases = [
+		('RFD GPS', parser.parseRfdGps, ('GPS:17,42,13.00,44.974712,-93.232101,10432.5,9!\n',)),
+		('RFD GPS malformed', parser.parseRfdGps, ('GPS:17,42,13.00,44.97x712,-93.232101\n',)),
+		('RFD other line', parser.parseRfdGps, ('Camera Settings Updated\n',)),
+		('Eagle APRS', parser.parseEagleAprs, (callsign + '>CQ,WIDE1-1,WIDE2-2:!4458.48N/09313.93WO000/000/A=034215RadBug,23C,982mb,001\n', callsign)),
+		('Eagle APRS other callsign', parser.parseEagleAprs, ('N0CALL-1>CQ,WIDE1-1,WIDE2-2:!4458.48N/09313.93WO000/000/A=034215RadBug,23C,982mb,001\n', callsign)),
+		('Payload line', parser.parsePayloadLine, ('BOREALIS;Cutdown armed!\n',)),
+		('Payload GPS', parser.parsePayloadGps, ('17:42:13,44.974712,-93.232101,10432.5,9',)),
+	]
+	results = []
+	for name, function, args in cases:
+		results.append((name, timeCalls(function, args)))
+	return results
+
+
+def benchmarkAprs():
+	""" Packets per second through the APRS decoder, filtered to the balloon's callsign and decoding every packet """
+
+	results = []
+	packets = OTHER_PACKETS*10 + BALLOON_PACKETS
+	frames = [encodeAx25(each) for each in packets]
+	everyone = [each.split('>')[0] for each in packets]
+	for name, callsigns in [('filtered', ['KD0FNR-11']), ('decode all', everyone)]:
+		decoder = AprsDecoder(callsigns)
+		lineRate = timeCalls(lambda: [decoder.decodeLine(each) for each in packets], ())*len(packets)
+		frameRate = timeCalls(lambda: [decoder.decodeFrame(each) for each in frames], ())*len(frames)
+		results.append((name, lineRate, frameRate))
+	return results
+
+
+def verifyLegacy(word, checktheirs):
+	""" The original transfer's check, MD5 hex of the base64 word """
+	return hashlib.md5(word).hexdigest() == checktheirs
+
+
+def verifyWindowed(digest, data, theirs):
+	""" The windowed transfer's check, the digest of the image bytes against the hex sent with them """
+	return binascii.hexlify(digest(data)) == theirs
+
+
+def benchmarkIntegrity(chunkSizes=(500, 1500, 5250)):
+	"""
+	Per chunk integrity overhead and verify cost of the original MD5 hex check and each windowed integrity mode.
+	Chunk sizes are image bytes, the original transfer sends them as base64 words (7000 characters is 5250 bytes)
+	"""
+
+	results = []
+	for size in chunkSizes:
+		data = os.urandom(size)
+		word = base64.b64encode(data)
+		results.append(('md5 hex (original)', size, 32, timeCalls(verifyLegacy, (word, hashlib.md5(word).hexdigest()))))
+		for name in sorted(INTEGRITY):
+			digest = INTEGRITY[name]
+			theirs = binascii.hexlify(digest(data))
+			results.append((name, size, len(theirs), timeCalls(verifyWindowed, (digest, data, theirs))))
+	return results
+
+
+def transferImage(link, image, **options):
+	""" Sends image from a reference Pi sender to an ImageReceiver over the link, returns the receiver's stats """
+
+	ground, pi = link.ends()
+	imageDir = tempfile.mkdtemp()
+	try:
+		with open(os.path.join(imageDir, 'image.jpg'), 'wb') as f:
+			f.write(image)
+		stopEvent = threading.Event()
+		sender = threading.Thread(target=ImageSender(pi, imageDir).serve, args=(stopEvent,))
+		sender.daemon = True
+		sender.start()
+
+		receiver = ImageReceiver(ground, **options)
+		header = receiver.request('image.jpg')
+		stats = {'complete': False}
+		if header is not None:
+			stats['complete'] = receiver.receive(header, os.path.join(imageDir, 'received.jpg'))
+			stats['identical'] = open(os.path.join(imageDir, 'received.jpg'), 'rb').read() == image
+			stats.update(receiver.stats)
+		stopEvent.set()
+		sender.join(2*pi.timeout)
+		return stats
+	finally:
+		shutil.rmtree(imageDir)
+
+
+def benchmarkEncodings(imageSize=20000, baud=57600, latency=0.05, bitErrorRate=0):
+	""" Image bytes per second of the windowed transfer with base64 frames and with raw COBS frames, over a simulated link """
+
+	image = os.urandom(imageSize)			# As incompressible as a JPEG
+	results = []
+	for encoding in ['b64', 'cobs']:
+		link = SimulatedLink(baud, latency, bitErrorRate, seed=1)
+		results.append((encoding, transferImage(link, image, encoding=encoding)))
+	return results
+
+
+class SignalSink:
+	""" Stands in for the MainWindow and its signals, so the still image system can run without the GUI """
+
+	def __getattr__(self, name):
+		return self
+
+	def emit(self, *args):
+		pass
+
+	def connect(self, *args):
+		pass
+
+
+def commandLatency(radio, count=5, schedule=None):
+	"""
+	Sends payload commands through RfdCommand, resent on its RetransmitSchedule (or the one given), and returns
+	the seconds until each was acknowledged
+	"""
+
+	from RfdControls import RfdCommand
+
+	command = RfdCommand(SignalSink(), radio.openStream(PRIORITY_COMMAND), radio.openStream(PRIORITY_CONTROL))
+	if schedule is not None:
+		command.schedule = schedule
+	listener = lambda line: command.acknowledge(line.replace('\n',''))		# What the RFD listen does with each line
+	radio.addLineListener(listener)
+	latencies = []
+	for i in range(count):
+		command.command('BENCH%d' % i, 'status')
+		record = command.history[-1]
+		while record['result'] == 'Pending':
+			time.sleep(0.01)
+		if record['result'] == 'Acknowledged':
+			latencies.append(record['latency'])
+	radio.removeLineListener(listener)
+	return latencies
+
+
+def benchmarkLink(configs=LINK_CONFIGS, imageSize=10000):
+	"""
+	Runs the still image system and payload commands against a simulated Pi over each link configuration,
+	through the radio multiplexer like the GUI does. Returns the original and windowed image transfer rates and retries,
+	and the command acknowledge latency for each
+	"""
+
+	from StillImageSystem import StillImageSystem
+
+	image = os.urandom(imageSize)
+	name = 'bench_image.jpg'		# The still image system uses the first 15 characters of a name
+	cwd = os.getcwd()
+	workDir = tempfile.mkdtemp()
+	results = []
+	try:
+		os.chdir(workDir)
+		os.mkdir('Images')
+		os.mkdir('Pi')
+		with open(os.path.join('Pi', name), 'wb') as f:
+			f.write(image)
+
+		for configName, settings in configs:
+			link = SimulatedLink(seed=1, **settings)
+			ground, pi = link.ends()
+			responder = PiResponder(pi, 'Pi')
+			stopEvent = threading.Event()
+			responderThread = threading.Thread(target=responder.run, args=(stopEvent,))
+			responderThread.daemon = True
+			responderThread.start()
+			radio = RadioMultiplexer(ground)
+			radio.start()
+			stream = radio.openStream(PRIORITY_CONTROL)
+			still = StillImageSystem(SignalSink(), stream)
+			result = {}
+
+			# The original transfer
+			still.windowedSupported = False
+			radio.beginSession(stream)
+			start = time.time()
+			still.getRequestedImage(name)
+			seconds = time.time() - start
+			radio.endSession()
+			result['legacyComplete'] = still.imageComplete and open(os.path.join('Images', name), 'rb').read() == image
+			result['legacyRate'] = imageSize/seconds
+			result['legacyRetries'] = responder.stats['legacyRetries']
+
+			# The windowed transfer
+			still.windowedSupported = None
+			radio.beginSession(stream)
+			still.getRequestedImage(name)
+			radio.endSession()
+			stats = still.chunkSizer.history[-1] if still.chunkSizer.history else {'rate': 0, 'retries': 0}
+			result['windowedComplete'] = still.imageComplete and open(os.path.join('Images', name), 'rb').read() == image
+			result['windowedRate'] = stats['rate']
+			result['windowedRetries'] = stats['retries']
+
+			latencies = commandLatency(radio)
+			result['commandLatency'] = sum(latencies)/len(latencies) if latencies else None
+			result['commandsLost'] = 5 - len(latencies)
+
+			stopEvent.set()
+			radio.stop()
+			results.append((configName, result))
+	finally:
+		os.chdir(cwd)
+		shutil.rmtree(workDir)
+	return results
+
+
+if __name__ == "__main__":
+	print("Telemetry parsers (lines/sec)")
+	for name, rate in benchmarkParsers():
+		print("\t%-28s %12.0f" % (name, rate))
+
+	print("Chunk integrity (overhead per chunk, chunks verified/sec)")
+	for name, size, overhead, rate in benchmarkIntegrity():
+		print("\t%-20s %6d bytes  %3d chars (%5.2f%% of the base64)  %10.0f" % (name, size, overhead, 100.0*overhead/len(base64.b64encode(' '*size)), rate))
+
+	print("Windowed image transfer over a simulated 57600 baud link (image bytes/sec)")
+	for encoding, stats in benchmarkEncodings():
+		print("\t%-6s %8.0f  complete: %s, %d bad frames" % (encoding, stats.get('rate', 0), stats['complete'], stats.get('bad', 0)))
+
+	print("APRS decoder (packets/sec)")
+	for name, lineRate, frameRate in benchmarkAprs():
+		print("\t%-10s APRS-IS %10.0f  KISS %10.0f" % (name, lineRate, frameRate))
+
+	print("Simulated link (image bytes/sec, retries, command acknowledge ms)")
+	for configName, result in benchmarkLink():
+		latency = "%6.0f" % (1000*result['commandLatency']) if result['commandLatency'] is not None else "  lost"
+		print("\t%-26s original %6.0f %3d %-5s  windowed %6.0f %3d %-5s  command %s" % (configName,
+			result['legacyRate'], result['legacyRetries'], result['legacyComplete'],
+			result['windowedRate'], result['windowedRetries'], result['windowedComplete'], latency))
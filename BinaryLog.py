@@ -0,0 +1,179 @@
+"""
+Compact binary flight logs for balloon locations and pointing commands.
+Each file is a 16 byte header followed by fixed width little endian records,
+so a whole flight can be memory mapped straight into numpy arrays without parsing
+"""
+
+import os
+import sys
+import time
+import struct
+import numpy as np
+from TrackStore import trackingMethodCodes, METHOD_UNKNOWN
+
+MAGIC = 'TRKLOG'
+VERSION = 1
+HEADER = struct.Struct('<6sHHIH')		# magic, version, record type, record size, reserved
+HEADER_SIZE = HEADER.size
+
+# Record types
+LOCATION_RECORD = 1
+POINTING_RECORD = 2
+
+# Record layouts, the struct and numpy versions must match byte for byte (numpy dtypes are packed by default)
+recordStructs = {
+	LOCATION_RECORD: struct.Struct('<dbddddddd'),
+	POINTING_RECORD: struct.Struct('<ddd'),
+}
+recordDtypes = {
+	LOCATION_RECORD: np.dtype([('time', '<f8'), ('method', 'i1'), ('seconds', '<f8'), ('lat', '<f8'), ('lon', '<f8'), ('alt', '<f8'), ('bear', '<f8'), ('ele', '<f8'), ('los', '<f8')]),
+	POINTING_RECORD: np.dtype([('time', '<f8'), ('bearing', '<f8'), ('elevation', '<f8')]),
+}
+
+
+class BinaryLogWriter:
+	""" Appends fixed width records of one type to a binary log file """
+
+	def __init__(self, path, recordType):
+		self.path = path
+		self.recordType = recordType
+		self.record = recordStructs[recordType]
+		newFile = not os.path.exists(path) or os.path.getsize(path) == 0
+		if not newFile:
+			readHeader(path, recordType)		# Make sure we're appending to the same kind of log
+		self.f = open(path, 'ab')
+		if newFile:
+			self.f.write(HEADER.pack(MAGIC, VERSION, recordType, self.record.size, 0))
+
+	def write(self, stamp, values):
+		""" Writes one record, stamp is the time it was logged and values are the rest of the record fields """
+
+		self.f.write(self.record.pack(stamp, *values))
+
+	def flush(self):
+		self.f.flush()
+
+	def fileno(self):
+		return self.f.fileno()
+
+	def close(self):
+		self.f.close()
+
+
+def locationValues(update):
+	""" The location record fields (after the logged time) for a BalloonUpdate """
+
+	return (trackingMethodCodes.get(update.getTrackingMethod(), METHOD_UNKNOWN), update.getSeconds(), update.getLat(), update.getLon(), update.getAlt(), update.getBear(), update.getEle(), update.getLOS())
+
+
+def readHeader(path, recordType=None):
+	""" Checks the header of a binary log, returns its record type """
+
+	with open(path, 'rb') as f:
+		data = f.read(HEADER_SIZE)
+	if len(data) != HEADER_SIZE:
+		raise ValueError("%s is too short to be a binary log" % path)
+	magic, version, fileType, recordSize, reserved = HEADER.unpack(data)
+	if magic != MAGIC or version != VERSION:
+		raise ValueError("%s is not a version %d binary log" % (path, VERSION))
+	if fileType not in recordDtypes or recordSize != recordDtypes[fileType].itemsize:
+		raise ValueError("%s has an unknown record layout" % path)
+	if recordType is not None and fileType != recordType:
+		raise ValueError("%s holds record type %d, not %d" % (path, fileType, recordType))
+	return fileType
+
+
+def readLog(path):
+	""" Memory maps a whole binary log as a numpy structured array, a partial last record is left off """
+
+	recordType = readHeader(path)
+	dtype = recordDtypes[recordType]
+	count = (os.path.getsize(path) - HEADER_SIZE)//dtype.itemsize
+	if count == 0:
+		return np.zeros(0, dtype=dtype)
+	return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def gpsSeconds(gpsTime):
+	""" Seconds into the day for an HH:MM:SS time string """
+
+	parts = gpsTime.split(':')
+	return float(parts[0])*3600 + float(parts[1])*60 + float(parts[2])
+
+
+def textLogType(textPath):
+	""" The record type for a BALLOONLOCATIONLOG or POINTINGLOG text log """
+
+	name = os.path.basename(textPath).upper()
+	if 'BALLOONLOCATIONLOG' in name:
+		return LOCATION_RECORD
+	elif 'POINTINGLOG' in name:
+		return POINTING_RECORD
+	raise ValueError("Only balloon location and pointing logs can be converted")
+
+
+def iterTextLog(textPath, recordType):
+	""" Yields (logged time, record values) for each line of a text log, and None for lines that can't be parsed """
+
+	with open(textPath, 'r') as f:
+		for line in f:
+			fields = line.strip().split(',')
+			try:
+				stamp = time.mktime(time.strptime(fields[0], "%m/%d/%Y %H:%M:%S"))
+				if recordType == LOCATION_RECORD:
+					values = (trackingMethodCodes.get(fields[1], METHOD_UNKNOWN), gpsSeconds(fields[2])) + tuple(float(x) for x in fields[3:9])
+				else:
+					values = (float(fields[1]), float(fields[2]))
+				yield stamp, values
+			except Exception:
+				yield None
+
+
+def readTextLog(textPath):
+	""" Loads a text log into the same structured array readLog returns, along with the number of lines skipped """
+
+	recordType = textLogType(textPath)
+	records = []
+	skipped = 0
+	for each in iterTextLog(textPath, recordType):
+		if each is None:
+			skipped += 1
+		else:
+			records.append((each[0],) + each[1])
+	return np.array(records, dtype=recordDtypes[recordType]), skipped
+
+
+def loadFlightLog(path):
+	""" Loads a binary or text log as a structured array """
+
+	if path.lower().endswith('.bin'):
+		return readLog(path)
+	return readTextLog(path)[0]
+
+
+def convertTextLog(textPath, binaryPath=None):
+	"""
+	Converts a BALLOONLOCATIONLOG or POINTINGLOG text log to a binary log,
+	returns the binary log path and the number of lines that couldn't be converted
+	"""
+
+	recordType = textLogType(textPath)
+	if binaryPath is None:
+		binaryPath = os.path.splitext(textPath)[0] + '.bin'
+
+	writer = BinaryLogWriter(binaryPath, recordType)
+	skipped = 0
+	for each in iterTextLog(textPath, recordType):
+		if each is None:
+			skipped += 1
+		else:
+			writer.write(*each)
+	writer.close()
+	return binaryPath, skipped
+
+
+if __name__ == "__main__":
+	# Convert each text log given on the command line
+	for each in sys.argv[1:]:
+		path, skipped = convertTextLog(each)
+		print("%s -> %s (%d lines skipped)" % (each, path, skipped))
@@ -0,0 +1,198 @@
+import os
+import time
+import json
+
+# Item states
+QUEUED = 'Queued'
+DOWNLOADING = 'Downloading'
+DONE = 'Done'
+FAILED = 'Failed'
+
+
+class DownloadItem:
+	""" An image waiting in the download queue, with its line from imagedata.txt """
+
+	def __init__(self, data, priority=0, size=0, received=0, status=QUEUED, attempts=0, added=None):
+		self.data = data					# Line from the image listing, the name is the first 15 characters
+		self.name = data[0:15]
+		self.priority = priority			# Higher goes first
+		self.size = size					# Bytes, 0 until the download has started
+		self.received = received
+		self.status = status
+		self.attempts = attempts
+		self.added = added or time.time()
+
+	def toDict(self):
+		return {'data': self.data, 'priority': self.priority, 'size': self.size, 'received': self.received,
+				'status': self.status, 'attempts': self.attempts, 'added': self.added}
+
+	@staticmethod
+	def fromDict(saved):
+		return DownloadItem(str(saved['data']), saved['priority'], saved['size'], saved['received'], saved['status'], saved['attempts'], saved['added'])
+
+
+class DownloadQueue:
+	"""
+	Images the operator wants, downloaded one at a time by priority whenever the still image system is free.
+	Saved to path after every change so the queue survives a restart. Tracks the link's throughput from
+	the download progress to estimate when each image will be done
+	"""
+
+	def __init__(self, path, maxAttempts=3, rate=0):
+		self.path = path
+		self.maxAttempts = maxAttempts		# Incomplete downloads before an item is marked failed
+		self.items = []
+		self.paused = False
+		self.active = None					# Item being downloaded
+		self.rate = rate					# Smoothed bytes per second
+		self.lastProgress = None			# (time, bytes) of the last progress update
+		self.load()
+
+	def load(self):
+		if not os.path.isfile(self.path):
+			return
+		try:
+			with open(self.path, 'r') as f:
+				saved = json.load(f)
+			self.items = [DownloadItem.fromDict(each) for each in saved['items']]
+			self.paused = saved['paused']
+			self.rate = saved.get('rate', self.rate)
+		except Exception, e:
+			print("Error reading the download queue " + self.path + ": " + str(e))
+			return
+		for each in self.items:
+			if each.status == DOWNLOADING:		# Interrupted by closing the program, the chunk journal picks it back up
+				each.status = QUEUED
+
+	def save(self):
+		try:
+			temp = self.path + '.tmp'
+			with open(temp, 'w') as f:
+				json.dump({'items': [each.toDict() for each in self.items], 'paused': self.paused, 'rate': self.rate}, f)
+			os.rename(temp, self.path)
+		except Exception, e:
+			print("Error saving the download queue " + self.path + ": " + str(e))
+
+	def find(self, name):
+		for each in self.items:
+			if each.name == name:
+				return each
+		return None
+
+	def add(self, data, priority=0):
+		""" Queues the image, or requeues it with the new priority if it's already there """
+		item = self.find(data[0:15])
+		if item is None:
+			item = DownloadItem(data, priority)
+			self.items.append(item)
+		else:
+			item.priority = priority
+			if item.status == FAILED:
+				item.status = QUEUED
+				item.attempts = 0
+		self.save()
+		return item
+
+	def remove(self, name):
+		item = self.find(name)
+		if item is not None and item is not self.active:
+			self.items.remove(item)
+			self.save()
+
+	def changePriority(self, name, change):
+		item = self.find(name)
+		if item is not None:
+			item.priority += change
+			self.save()
+
+	def clearFinished(self):
+		self.items = [each for each in self.items if each.status not in (DONE, FAILED)]
+		self.save()
+
+	def pending(self):
+		""" Queued items in the order they'll be downloaded """
+		queued = [each for each in self.items if each.status == QUEUED]
+		return sorted(queued, key=lambda each: (-each.priority, each.added))
+
+	def next(self):
+		""" The next item to download, or None if there's nothing to do or the queue is paused """
+		if self.paused or self.active is not None:
+			return None
+		pending = self.pending()
+		if not pending:
+			return None
+		return pending[0]
+
+	def start(self, item):
+		item.status = DOWNLOADING
+		item.attempts += 1
+		self.active = item
+		self.lastProgress = None
+		self.save()
+
+	def progress(self, received, size):
+		""" Updates the active item, and the throughput from the bytes received since the last update """
+		item = self.active
+		if item is None:
+			return
+		now = time.time()
+		if self.lastProgress is not None and received > self.lastProgress[1] and now > self.lastProgress[0]:
+			rate = (received - self.lastProgress[1])/(now - self.lastProgress[0])
+			self.rate = rate if self.rate <= 0 else 0.8*self.rate + 0.2*rate
+		self.lastProgress = (now, received)
+		item.received = received
+		item.size = size
+
+	def finish(self, complete):
+		""" Ends the active item's download. Incomplete ones go back in the queue until they've run out of attempts """
+		item = self.active
+		self.active = None
+		if item is None:
+			return
+		if complete:
+			item.status = DONE
+			item.received = item.size
+		elif self.paused or item.attempts < self.maxAttempts:
+			item.status = QUEUED
+		else:
+			item.status = FAILED
+		self.save()
+
+	def pause(self):
+		self.paused = True
+		self.save()
+
+	def resume(self):
+		self.paused = False
+		self.save()
+
+	def averageSize(self):
+		""" Typical image size, for estimating items that haven't started """
+		sizes = [each.size for each in self.items if each.size > 0]
+		if not sizes:
+			return 0
+		return sum(sizes)/len(sizes)
+
+	def remaining(self, item):
+		return max((item.size or self.averageSize()) - item.received, 0)
+
+	def eta(self, item):
+		""" Seconds until item is downloaded, counting everything ahead of it, None if there's no estimate yet """
+		if self.rate <= 0 or item.status not in (QUEUED, DOWNLOADING):
+			return None
+		ahead = [self.active] if self.active is not None and self.active is not item else []
+		for each in self.pending():
+			if each is item:
+				break
+			ahead.append(each)
+		return (sum([self.remaining(each) for each in ahead]) + self.remaining(item))/self.rate
+
+	def describe(self, item):
+		""" A line for the queue window """
+		text = "%s  priority %d  %s" % (item.name, item.priority, item.status)
+		if item.size > 0:
+			text += "  %d%%" % (100*item.received/item.size)
+		eta = self.eta(item)
+		if eta is not None:
+			text += "  ETA %d:%02d" % (int(eta)//60, int(eta) % 60)
+		return text
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+import Queue
+from datetime import datetime
+
+
+class FlightLogger(threading.Thread):
+	"""
+	A background writer for the flight log files. Lines are put on a bounded queue by the GUI
+	and worker threads and written in batches by this thread, with each stream's file kept open,
+	flushed after every batch, and fsynced periodically. If the queue is full the line is dropped
+	and counted rather than blocking the caller. Record streams take tuples of values for a
+	binary log writer instead of text lines
+	"""
+
+	def __init__(self, maxQueue=10000, batchSize=500, flushInterval=0.5, fsyncInterval=5.0):
+		super(FlightLogger, self).__init__()
+		self.daemon = True
+		self.queue = Queue.Queue(maxQueue)
+		self.batchSize = batchSize				# Max number of lines written per batch
+		self.flushInterval = flushInterval		# Max time in seconds a line waits before being flushed
+		self.fsyncInterval = fsyncInterval		# Time in seconds between fsyncs of the open files
+		self.streams = {}						# Stream name -> open file
+		self.recordStreams = {}					# Stream name -> binary log writer
+		self.lock = threading.Lock()
+		self.stopping = False
+
+		# Counters
+		self.dropped = 0
+		self.written = 0
+		self.maxDepth = 0
+
+		# Timestamp cache, the formatted time only changes once a second
+		self.stampSecond = None
+		self.stampText = ''
+
+	def addStream(self, name, path):
+		""" Opens the file at path for the stream with this name """
+
+		f = open(path, 'a')
+		with self.lock:
+			old = self.streams.get(name)
+			self.streams[name] = f
+		if old is not None:
+			old.close()
+
+	def addRecordStream(self, name, writer):
+		""" Adds a binary log writer as the record stream with this name """
+
+		with self.lock:
+			old = self.recordStreams.get(name)
+			self.recordStreams[name] = writer
+		if old is not None:
+			old.close()
+
+	def log(self, stream, msg):
+		""" Queues the message for the stream without blocking, returns False if it had to be dropped """
+
+		return self.enqueue((stream, time.time(), msg, False))
+
+	def logRecord(self, stream, values):
+		""" Queues a record for the record stream without blocking, returns False if it had to be dropped """
+
+		return self.enqueue((stream, time.time(), values, True))
+
+	def enqueue(self, item):
+		try:
+			self.queue.put_nowait(item)
+		except Queue.Full:
+			self.dropped += 1
+			return False
+		depth = self.queue.qsize()
+		if depth > self.maxDepth:
+			self.maxDepth = depth
+		return True
+
+	def getQueueDepth(self):
+		return self.queue.qsize()
+
+	def getDropped(self):
+		return self.dropped
+
+	def getStats(self):
+		""" Returns the logging counters """
+
+		return {'written': self.written, 'dropped': self.dropped, 'queueDepth': self.queue.qsize(), 'maxQueueDepth': self.maxDepth}
+
+	def run(self):
+		""" Writes batches of queued lines until stopped """
+
+		lastSync = time.time()
+		while True:
+			try:
+				batch = [self.queue.get(timeout=self.flushInterval)]
+			except Queue.Empty:
+				batch = []
+			while len(batch) < self.batchSize:
+				try:
+					batch.append(self.queue.get_nowait())
+				except Queue.Empty:
+					break
+
+			self.writeBatch(batch)
+
+			if time.time() - lastSync > self.fsyncInterval:
+				self.sync()
+				lastSync = time.time()
+
+			if self.stopping and self.queue.empty():
+				break
+
+		self.sync()
+		self.closeStreams()
+
+	def writeBatch(self, batch):
+		""" Writes each line to its stream's file, then flushes the files that were written to """
+
+		if not batch:
+			return
+		dirty = set()
+		with self.lock:
+			for stream, stamp, msg, isRecord in batch:
+				if isRecord:
+					f = self.recordStreams.get(stream)
+				else:
+					f = self.streams.get(stream)
+				if f is None:
+					self.dropped += 1
+					continue
+				try:
+					if isRecord:
+						f.write(stamp, msg)
+					else:
+						f.write(self.timestamp(stamp)+','+msg+'\n')
+					self.written += 1
+					dirty.add(f)
+				except Exception, e:
+					print("Error logging data: "+stream+','+str(msg))
+					print(str(e))
+			for f in dirty:
+				f.flush()
+
+	def sync(self):
+		""" Forces the written data onto the disk """
+
+		with self.lock:
+			for f in self.streams.values() + self.recordStreams.values():
+				try:
+					f.flush()
+					os.fsync(f.fileno())
+				except Exception, e:
+					print(str(e))
+
+	def timestamp(self, stamp):
+		""" Formats the time the line was logged, reusing the text within the same second """
+
+		second = int(stamp)
+		if second != self.stampSecond:
+			self.stampSecond = second
+			self.stampText = datetime.fromtimestamp(second).strftime("%m/%d/%Y %H:%M:%S")
+		return self.stampText
+
+	def stop(self, timeout=5):
+		""" Writes out everything left in the queue, closes the files and ends the thread """
+
+		self.stopping = True
+		if self.is_alive():
+			self.join(timeout)
+		else:
+			self.closeStreams()
+
+	def closeStreams(self):
+		with self.lock:
+			for f in self.streams.values() + self.recordStreams.values():
+				f.close()
+			self.streams = {}
+			self.recordStreams = {}
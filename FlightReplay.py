@@ -0,0 +1,170 @@
+"""
+Flight replay: drives the tracker from a recorded BALLOONLOCATIONLOG (text or binary)
+through the same new location signals as the live tracking sources.
+
+Headless load test:
+	python FlightReplay.py <log> <groundLat> <groundLon> <groundAlt> [speed]
+A speed of 0 replays as fast as possible
+"""
+
+import sys
+import time
+import collections
+from PyQt4 import QtCore
+from PyQt4 import QtGui
+from PyQt4.QtCore import *
+from BalloonUpdate import *
+from BinaryLog import loadFlightLog
+from TrackStore import trackingMethodNames, METHOD_RFD, METHOD_IRIDIUM, METHOD_APRS
+
+
+class FlightReplay(QtCore.QObject):
+
+	# Received Signals
+	start = pyqtSignal()
+	setInterrupt = pyqtSignal()
+
+	# Emitted Signals
+	replayFinished = pyqtSignal()
+
+	def __init__(self, MainWindow, path, speed=1.0, newestOnly=False):
+		super(FlightReplay, self).__init__()
+		self.mainWindow = MainWindow
+		self.path = path
+		self.speed = speed				# 1 is real time, N is N times faster, 0 is as fast as possible
+		self.newestOnly = newestOnly	# Skip updates the tracker would ignore (bad or older locations)
+		self.replayInterrupt = False
+		self.track = loadFlightLog(path)
+		self.emitTimes = collections.deque()		# Wall time each update was emitted, for latency measurements
+
+		self.locationSignals = {
+			METHOD_RFD: self.mainWindow.rfdNewLocation,
+			METHOD_IRIDIUM: self.mainWindow.iridiumNewLocation,
+			METHOD_APRS: self.mainWindow.aprsNewLocation,
+		}		# Connected to updateBalloonLocation once by the MainWindow, the replay only emits
+
+	def run(self):
+		""" Emits each logged location as a BalloonUpdate, paced by the time it was originally logged """
+
+		self.replayInterrupt = False
+		track = self.track
+		startWall = time.time()
+		startLogged = track['time'][0] if len(track) > 0 else 0
+		newest = -1
+
+		for i in range(len(track)):
+			if self.replayInterrupt:
+				break
+
+			method = int(track['method'][i])
+			if method not in self.locationSignals:
+				continue
+			seconds = float(track['seconds'][i])
+			lat = float(track['lat'][i])
+			lon = float(track['lon'][i])
+			alt = float(track['alt'][i])
+			if self.newestOnly:
+				if seconds <= newest or lat == 0.0 or lon == 0.0 or alt == 0.0:
+					continue
+				newest = seconds
+
+			# Wait until it's time for this update, in short naps so an interrupt is seen quickly
+			if self.speed > 0:
+				due = startWall + (track['time'][i] - startLogged)/self.speed
+				while not self.replayInterrupt and time.time() < due:
+					time.sleep(min(due - time.time(), 0.05))
+
+			gpsTime = "%02d:%02d:%02d" % (int(seconds)//3600, (int(seconds)//60) % 60, int(seconds) % 60)
+			try:
+				newLocation = BalloonUpdate(gpsTime, seconds, lat, lon, alt, trackingMethodNames[method], self.mainWindow.groundLat, self.mainWindow.groundLon, self.mainWindow.groundAlt)
+			except Exception, e:
+				print(str(e))
+				continue
+			newLocation.replayed = True
+
+			self.emitTimes.append(time.time())
+			self.locationSignals[method].emit(newLocation)
+
+		self.replayInterrupt = False
+		self.replayFinished.emit()
+
+	def interrupt(self):
+		self.replayInterrupt = True
+
+
+class ServoProbe:
+	""" Stands in for the servo serial port, and times each pan move against the update that caused it """
+
+	def __init__(self, emitTimes, moveCommand=0xFF, panChannel=1):
+		self.emitTimes = emitTimes
+		self.moveCommand = moveCommand
+		self.panChannel = panChannel
+		self.latencies = []
+		self.lastCommand = 0
+
+	def write(self, data):
+		if len(data) >= 2 and data[0] == self.moveCommand and data[1] == self.panChannel:
+			self.lastCommand = time.time()
+			if self.emitTimes:
+				self.latencies.append(self.lastCommand - self.emitTimes.popleft())
+
+
+def runHeadless(path, groundLat, groundLon, groundAlt, speed=0):
+	"""
+	Replays a flight through a hidden MainWindow with autotracking on and the servo port replaced
+	by a ServoProbe, and returns the update to servo command latency and throughput
+	"""
+
+	from Antenna_Tracker_and_RFD_Controls_GUI import MainWindow, EventThread
+	from ServoController import ServoController
+
+	app = QtGui.QApplication.instance()
+	if not app:
+		app = QtGui.QApplication(sys.argv)
+
+	window = MainWindow()
+	window.groundLat = float(groundLat)
+	window.groundLon = float(groundLon)
+	window.groundAlt = float(groundAlt)
+	window.updateGroundStation()
+	window.internetAccess = False
+	window.useRFD = window.useIridium = window.useAPRS = True
+	window.autotrackOnline = True
+	window.servosAttached = True
+
+	replayThread = EventThread()
+	replayThread.start()
+	replay = FlightReplay(window, path, speed, newestOnly=True)		# Every emitted update then moves the servos once
+	probe = ServoProbe(replay.emitTimes)
+	window.servoController = ServoController(probe)
+	replay.moveToThread(replayThread)
+	replay.start.connect(replay.run)
+	replay.replayFinished.connect(lambda: QtCore.QTimer.singleShot(500, app.quit))		# Let the last queued updates land
+
+	startTime = time.time()
+	replay.start.emit()
+	app.exec_()
+	replayThread.quit()
+	replayThread.wait()
+
+	latencies = sorted(probe.latencies)
+	count = len(latencies)
+	duration = (probe.lastCommand - startTime) if count else 0
+	stats = {'updates': count, 'duration': duration, 'throughput': count/duration if duration > 0 else 0}
+	if count:
+		stats['meanLatency'] = sum(latencies)/count
+		stats['medianLatency'] = latencies[count//2]
+		stats['p95Latency'] = latencies[min(int(count*0.95), count - 1)]
+		stats['maxLatency'] = latencies[-1]
+	return stats
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 5:
+		print(__doc__)
+		sys.exit(1)
+	speed = float(sys.argv[5]) if len(sys.argv) > 5 else 0
+	stats = runHeadless(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], speed)
+	print("Updates: %d in %.2f s (%.1f updates/s)" % (stats['updates'], stats['duration'], stats['throughput']))
+	if stats['updates']:
+		print("Latency ms: mean %.2f, median %.2f, p95 %.2f, max %.2f" % (1000*stats['meanLatency'], 1000*stats['medianLatency'], 1000*stats['p95Latency'], 1000*stats['maxLatency']))
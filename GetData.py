@@ -3,6 +3,8 @@ from PyQt4 import QtCore
 from PyQt4 import QtGui
 from PyQt4.QtCore import *
 from BalloonUpdate import *
+from TelemetryParser import telemetryParser
+from IridiumPoller import IridiumPoller
 import MySQLdb
 import datetime
 import serial
@@ -26,10 +28,10 @@ class GetIridium(QtCore.QObject):
 		self.dbName = name
 		self.IMEI = IMEI
 		self.iridiumInterrupt = False
+		self.poller = None			# Database connection for the SQL fallback, opened on first use
 
 		# Emitted Signals
 		self.mainWindow.noIridium.connect(self.mainWindow.iridiumNoConnection)
-		self.mainWindow.iridiumNewLocation.connect(self.mainWindow.updateBalloonLocation)
 
 	def getApiData(self):
 		"""Retrieve most recent IMEI data from database API as dict"""
@@ -45,7 +47,6 @@ class GetIridium(QtCore.QObject):
 		""" Gets tracking information from the Iridium satellite modem by taking the information from the web api or SQL database at Montana State University """
 
 		self.iridiumInterrupt = False
-		prev = ''
 		connectAttempts = 0
 		while(not self.iridiumInterrupt):
 			time.sleep(2)
@@ -73,64 +74,51 @@ class GetIridium(QtCore.QObject):
 					print(str(e))
 			
 			else:
-				# Connect to the SQL Database
-				connected = False
-				while(not connected and not self.iridiumInterrupt):
-					QtGui.QApplication.processEvents()
-					if connectAttempts < 20:
-						try:
-							db_local = MySQLdb.connect(host=self.dbHost,user=self.dbUser,passwd=self.dbPass,db=self.dbName)		# Connect to the database
-							cursor = db_local.cursor()																# prepare a cursor object using cursor() method
-							sql = "select gps_fltDate,gps_time,gps_lat,gps_long,gps_alt from gps where gps_IMEI = "+self.IMEI+" order by pri_key DESC"
-							cursor.execute(sql)
-							connected = True
-							if self.iridiumInterrupt:
-								cursor.close()
-								db_local.close()
-								connected = True
-						except:
-							print("Failed to connect to database, trying again")
-							connectAttempts += 1
-					else:
+				# Poll the SQL Database for rows added since the last poll, over one kept open connection
+				if self.poller is None:
+					self.poller = IridiumPoller(MySQLdb, {'host': self.dbHost, 'user': self.dbUser, 'passwd': self.dbPass, 'db': self.dbName}, self.IMEI)
+				try:
+					rows = self.poller.poll()
+					connectAttempts = 0
+				except Exception, e:
+					print("Failed to query the database, trying again: " + str(e))
+					rows = []
+					connectAttempts += 1
+					if connectAttempts >= 20:
 						print("Failed to connect to database too many times")
 						self.interrupt()
 						self.mainWindow.noIridium.emit()
 
-					if connected:
-					### Fetch a single row using fetchone() method. ###
+				for results in rows:
+					try:
+						remoteTime = results[1].split(":")
+						remoteHours = int(remoteTime[0])
+						remoteMinutes = int(remoteTime[1])
+						remoteSeconds = int(remoteTime[2])
+						remoteTime = results[1]
+						remoteSeconds = remoteSeconds + (60*remoteMinutes) + (3600*remoteHours)
+						remoteLat = float(results[2])				   #http://stackoverflow.com/questions/379906/parse-string-to-float-or-int
+						remoteLon = float(results[3])
+						remoteAlt = float(results[4]) * 3.280839895  #(meters to feet conversion)
+
+						### Create a new location object ###
 						try:
-							results = cursor.fetchone()
-							if(results != prev):
-								prev = results
-								remoteTime = results[1].split(":")
-								remoteHours = int(remoteTime[0])
-								remoteMinutes = int(remoteTime[1])
-								remoteSeconds = int(remoteTime[2])
-								remoteTime = results[1]
-								remoteSeconds = remoteSeconds + (60*remoteMinutes) + (3600*remoteHours)
-								remoteLat = float(results[2])				   #http://stackoverflow.com/questions/379906/parse-string-to-float-or-int
-								remoteLon = float(results[3])
-								remoteAlt = float(results[4]) * 3.280839895  #(meters to feet conversion)
-
-								### Create a new location object ###
-								try:
-									newLocation = BalloonUpdate(remoteTime,remoteSeconds,remoteLat,remoteLon,remoteAlt,"Iridium",self.mainWindow.groundLat,self.mainWindow.groundLon,self.mainWindow.groundAlt)
-								except:
-									print("Error creating a new balloon location object from Iridium Data")
-
-								try:
-									self.mainWindow.iridiumNewLocation.emit(newLocation)				# Notify the main GUI of the new location
-								except Exception, e:
-									print(str(e))
+							newLocation = BalloonUpdate(remoteTime,remoteSeconds,remoteLat,remoteLon,remoteAlt,"Iridium",self.mainWindow.groundLat,self.mainWindow.groundLon,self.mainWindow.groundAlt)
 						except:
-							print("ERROR PARSING DATA FROM DATABASE: Cannot parse data or data may not exist, please double check your IMEI number")
+							print("Error creating a new balloon location object from Iridium Data")
+							continue
+
+						try:
+							self.mainWindow.iridiumNewLocation.emit(newLocation)				# Notify the main GUI of the new location
+						except Exception, e:
+							print(str(e))
+					except:
+						print("ERROR PARSING DATA FROM DATABASE: Cannot parse data or data may not exist, please double check your IMEI number")
 
 		### Clean up ###
-		try:
-			cursor.close()
-			db_local.close()
-		except:
-			print("Error closing database")
+		if self.poller is not None:
+			self.poller.close()
+			self.poller = None
 			
 		self.iridiumInterrupt = False
 
@@ -143,63 +131,47 @@ class GetAPRS(QtCore.QObject):
 	start = pyqtSignal()
 	setInterrupt = pyqtSignal()
 
-	def __init__(self,MainWindow,APRS):
+	def __init__(self,MainWindow,source):
 		super(GetAPRS, self).__init__()
 		self.mainWindow = MainWindow
-		self.aprsSer = APRS
+		self.source = source		# An AprsSource, the Eagle serial port, a KISS TNC or APRS-IS
 		self.aprsInterrupt = False
 
-		# Emitted Signals
-		self.mainWindow.aprsNewLocation.connect(self.mainWindow.updateBalloonLocation)
-
 	def run(self):
-		""" Gets tracking information from the APRS receiver """
+		""" Gets tracking information from the APRS source """
 
-		aprsSer = self.APRS.getDevice()
+		source = self.source
+		source.setCallsigns([str(self.mainWindow.callsign)])
 
 		while(not self.aprsInterrupt):
-			### Read the APRS serial port, and parse the string appropriately 								###
-			### Format: "Callsign">CQ,WIDE1-1,WIDE2-2:!"Lat"N/"Lon"EO000/000/A="Alt"RadBug,23C,982mb,001	###
 			try:
-				line = str(aprsSer.readline())
-				print(line)
-				idx = line.find(self.callsign)
-				if(idx != -1):
-					line = line[idx:]
-					line = line[line.find("!")+1:line.find("RadBug")]
-					line = line.split("/")
+				positions = source.read()		# Positions from the callsign, everything else is filtered out before decoding
+			except Exception, e:
+				print("Error retrieving APRS Data: " + str(e))
+				time.sleep(1)
+				continue
+			for position in positions:
+				if position.alt is None:		# Tracking needs the altitude
+					print("APRS position from " + position.callsign + " has no altitude")
+					continue
 					
-					### Get the individual values from the newly created list ###
-					time = datetime.utcfromtimestamp(time.time()).strftime('%H:%M:%S')
-					lat = line[0][0:-1]
-					latDeg = float(lat[0:2])
-					latMin = float(lat[2:])
-					lon = line[1][0:line[1].find("W")]
-					lonDeg = float(lon[0:3])
-					lonMin = float(lon[3:])
-					lat = latDeg + (latMin/60)
-					lon = -lonDeg - (lonMin/60)
-					alt = float(line[3][2:])
-					aprsSeconds = float(time.split(':')[0]) * 3600 + float(time.split(':')[1])*60 + float(time.split(':')[2])
+				### Create a new location object ###
+				try:
+					newLocation = BalloonUpdate(position.time,position.seconds,position.lat,position.lon,position.alt,"APRS",self.mainWindow.groundLat,self.mainWindow.groundLon,self.mainWindow.groundAlt)
+				except:
+					print("Error creating a new balloon location object from APRS Data")
+					continue
 					
-					### Create a new location object ###
-					try:
-						newLocation = BalloonUpdate(time,aprsSeconds,lat,lon,alt,"APRS",self.mainWindow.groundLat,self.mainWindow.groundLon,self.mainWindow.groundAlt)
-					except:
-						print("Error creating a new balloon location object from APRS Data")
-						
-					try:
-						self.aprsNewLocation.emit(newLocation)				# Notify the main GUI of the new location
-					except Exception, e:
-						print(str(e))
-			except:
-				print("Error retrieving APRS Data")
+				try:
+					self.mainWindow.aprsNewLocation.emit(newLocation)				# Notify the main GUI of the new location
+				except Exception, e:
+					print(str(e))
 
 		### Clean Up ###
 		try:
-			aprsSer.close()			# Close the APRS Serial Port
+			source.close()			# Close the APRS serial port or connection
 		except:
-			print("Error closing APRS serial port")
+			print("Error closing APRS source")
 			
 		self.aprsInterrupt = False
 
@@ -0,0 +1,794 @@
+"""
+Windowed image transfer for the still image system.
+
+The ground station asks for an image with IMAGE;9! and a request line, and the Pi sends sequence
+numbered chunks a window at a time, each with its own digest. After each window the ground station
+answers with a selective acknowledgement of only the chunks that were lost or corrupted, so a bad
+chunk costs one chunk of link time instead of a resync.
+
+	Ground									Pi
+	IMAGE;9!							->
+										<-	A
+	RQ;name;W=8;C=1500;I=crc32;E=cobs\\n	->
+										<-	OK;name;size;W=8;C=1500;I=crc32;E=cobs\\n
+										<-	a window of chunk frames, then an end of window frame
+	SACK;high;missing,missing;C=2000\\n	->
+										<-	the missing chunks and new ones, then an end of window frame
+	...
+	DONE\\n								->
+
+If the operator stops the download the ground station sends STOP\\n instead of a SACK, and throws
+away whatever the Pi had already sent until the link goes quiet.
+
+An empty name asks for the most recent image. High is the highest sequence number the ground station
+has seen, the Pi resends the missing chunks and anything it sent after high. An optional C= in the
+SACK changes the size of the chunks the Pi hasn't sent yet (see ChunkSizeController).
+
+Downloads can be resumed: the ground station keeps a ChunkJournal next to the image, and a request
+with S=<size> and N=<start-end,...> asks only for the missing byte ranges. The Pi echoes N in its
+OK line if it's sending just those ranges (the image is still the same size), otherwise it sends it all.
+V=thumb asks for a preview instead, the small thumbnail the camera embeds in the JPEG's EXIF data,
+so the operator can judge a high resolution image after a few seconds of link time. The Pi echoes V
+if it's sending the thumbnail, and answers NO if the image doesn't have one.
+A Pi that doesn't know the integrity check (I=) or encoding (E=) asked for answers with md5 or b64,
+which every version has. E=b64 sends the frames as base64 text lines, E=cobs as raw bytes (see CobsFrameCodec).
+
+Self test over a pseudo terminal pair:
+	python ImageTransfer.py <image>
+"""
+
+import os
+import sys
+import time
+import base64
+import hashlib
+import zlib
+import struct
+import binascii
+import threading
+import json
+
+WINDOWED_REQUEST = 'IMAGE;9!'
+
+# Frame types
+FRAME_DATA = 'D'
+FRAME_END = 'E'			# End of a window, carries the highest sequence number sent so far
+FRAME_BAD = 'X'			# Corrupted or unreadable frame
+
+DEFAULT_WINDOW = 8		# Chunks sent before waiting for an acknowledgement
+DEFAULT_CHUNK = 1500	# Image bytes per chunk
+
+
+def md5Digest(data):
+	""" 16 byte MD5, what the original transfer uses (sent as 32 hex characters) """
+	return hashlib.md5(data).digest()
+
+
+def crc32Digest(data):
+	""" 4 byte CRC32, catches the bit errors and dropped bytes the radio causes for a quarter of the overhead """
+	return struct.pack('>I', zlib.crc32(data) & 0xffffffff)
+
+INTEGRITY = {'md5': md5Digest, 'crc32': crc32Digest}		# Digest of each chunk's image bytes, chosen with I= in the request
+
+
+class TextFrameCodec:
+	""" Frames as ASCII lines, #D<seq>,<offset>,<hex digest>,<base64 data> and #E<last> """
+
+	name = 'b64'
+	boundary = '\n'
+
+	def __init__(self, integrity='md5'):
+		self.digest = INTEGRITY[integrity]
+		self.buffer = ''
+
+	def encodeData(self, seq, offset, data):
+		return '#D%d,%d,%s,%s\n' % (seq, offset, binascii.hexlify(self.digest(data)), base64.b64encode(data))
+
+	def encodeEnd(self, last):
+		return '#E%d\n' % last
+
+	def feed(self, data):
+		""" Returns the frames completed by data, each as (type, seq, offset, data) """
+		buf = self.buffer + data
+		frames = []
+		start = 0
+		end = buf.find('\n')
+		while end != -1:
+			frames.append(self.decode(buf[start:end]))
+			start = end + 1
+			end = buf.find('\n', start)
+		self.buffer = buf[start:]
+		return frames
+
+	def decode(self, line):
+		try:
+			line = line[line.index('#'):]		# Skip any noise before the frame
+			if line[1] == FRAME_END:
+				return (FRAME_END, int(line[2:]), 0, '')
+			if line[1] == FRAME_DATA:
+				seq, offset, digest, payload = line[2:].split(',')
+				data = base64.b64decode(payload)
+				if binascii.unhexlify(digest) == self.digest(data):
+					return (FRAME_DATA, int(seq), int(offset), data)
+		except (ValueError, IndexError, TypeError, binascii.Error):
+			pass
+		return (FRAME_BAD, -1, 0, '')
+
+
+def cobsEncode(data):
+	""" Consistent overhead byte stuffing, the result has no zero bytes so a zero can end each frame """
+	out = []
+	for segment in data.split('\x00'):
+		while len(segment) >= 254:
+			out.append('\xff' + segment[:254])
+			segment = segment[254:]
+		out.append(chr(len(segment) + 1) + segment)
+	return ''.join(out)
+
+
+def cobsDecode(data):
+	""" Undoes cobsEncode, raises ValueError if data wasn't encoded that way """
+	out = []
+	i = 0
+	end = len(data)
+	while i < end:
+		code = ord(data[i])
+		if code == 0 or i + code > end:
+			raise ValueError('Bad COBS block')
+		out.append(data[i+1:i+code])
+		i += code
+		if code < 0xff and i < end:
+			out.append('\x00')
+	return ''.join(out)
+
+
+class CobsFrameCodec:
+	"""
+	Raw image bytes instead of base64, a third less to send. Each frame is a type, sequence number, offset,
+	binary digest and the data, COBS encoded and ended with a zero byte
+	"""
+
+	name = 'cobs'
+	boundary = '\x00'
+	header = struct.Struct('>ciI')		# Type, sequence number (the last one sent for an end of window), offset
+
+	def __init__(self, integrity='md5'):
+		self.digest = INTEGRITY[integrity]
+		self.digestSize = len(self.digest(''))
+		self.buffer = ''
+
+	def encodeData(self, seq, offset, data):
+		return cobsEncode(self.header.pack(FRAME_DATA, seq, offset) + self.digest(data) + data) + self.boundary
+
+	def encodeEnd(self, last):
+		return cobsEncode(self.header.pack(FRAME_END, last, 0)) + self.boundary
+
+	def feed(self, data):
+		""" Returns the frames completed by data, each as (type, seq, offset, data) """
+		frames = (self.buffer + data).split(self.boundary)
+		self.buffer = frames.pop()
+		return [self.decode(each) for each in frames if each]
+
+	def decode(self, frame):
+		try:
+			frame = cobsDecode(frame)
+			frameType, seq, offset = self.header.unpack_from(frame)
+			if frameType == FRAME_END:
+				return (FRAME_END, seq, 0, '')
+			if frameType == FRAME_DATA:
+				start = self.header.size + self.digestSize
+				data = frame[start:]
+				if frame[self.header.size:start] == self.digest(data):
+					return (FRAME_DATA, seq, offset, data)
+		except (ValueError, struct.error):
+			pass
+		return (FRAME_BAD, -1, 0, '')
+
+CODECS = {TextFrameCodec.name: TextFrameCodec, CobsFrameCodec.name: CobsFrameCodec}
+
+
+def formatOptions(options):
+	return ';'.join(['%s=%s' % (key, options[key]) for key in sorted(options)])
+
+
+def parseOptions(fields):
+	""" Turns a list of key=value fields into a dictionary """
+	options = {}
+	for each in fields:
+		if '=' in each:
+			key, value = each.split('=', 1)
+			options[key] = value
+	return options
+
+
+def formatRanges(ranges):
+	return ','.join(['%d-%d' % (start, end) for start, end in ranges])
+
+
+def parseRanges(text):
+	""" Turns start-end,start-end into [(start, end)], with end exclusive """
+	ranges = []
+	for each in text.split(','):
+		if '-' in each:
+			start, end = each.split('-')
+			ranges.append((int(start), int(end)))
+	return ranges
+
+
+def parseSack(line):
+	""" Splits a SACK;high;missing line into (high, [missing], options) """
+	fields = line.strip().split(';')
+	high = int(fields[1])
+	missing = []
+	if len(fields) > 2 and fields[2]:
+		missing = [int(each) for each in fields[2].split(',')]
+	return high, missing, parseOptions(fields[3:])
+
+
+def exifThumbnail(image):
+	""" The thumbnail embedded in a JPEG's EXIF data (raspistill adds one by default), None if there isn't one """
+
+	if image[:2] != '\xff\xd8':
+		return None
+	pos = 2
+	while pos + 4 <= len(image) and image[pos] == '\xff':
+		marker = ord(image[pos+1])
+		length = struct.unpack('>H', image[pos+2:pos+4])[0]
+		if marker == 0xe1 and image[pos+4:pos+10] == 'Exif\x00\x00':
+			return tiffThumbnail(image[pos+10:pos+2+length])
+		if marker == 0xda:		# Start of the image data, the EXIF data comes before it
+			break
+		pos += 2 + length
+	return None
+
+
+def tiffThumbnail(tiff):
+	""" Finds the JPEG thumbnail through the second image directory of EXIF's TIFF structure """
+
+	endian = '<' if tiff[:2] == 'II' else '>'
+	try:
+		ifd = struct.unpack(endian + 'I', tiff[4:8])[0]
+		count = struct.unpack(endian + 'H', tiff[ifd:ifd+2])[0]
+		ifd = struct.unpack(endian + 'I', tiff[ifd+2+12*count:ifd+6+12*count])[0]		# The thumbnail's directory
+		if ifd == 0:
+			return None
+		count = struct.unpack(endian + 'H', tiff[ifd:ifd+2])[0]
+		tags = {}
+		for i in range(count):
+			entry = ifd + 2 + 12*i
+			tag = struct.unpack(endian + 'H', tiff[entry:entry+2])[0]
+			tags[tag] = struct.unpack(endian + 'I', tiff[entry+8:entry+12])[0]
+	except struct.error:
+		return None
+	offset = tags.get(0x0201)		# JPEGInterchangeFormat
+	length = tags.get(0x0202)		# JPEGInterchangeFormatLength
+	if offset is None or not length:
+		return None
+	thumbnail = tiff[offset:offset+length]
+	if len(thumbnail) != length or thumbnail[:2] != '\xff\xd8':
+		return None
+	return thumbnail
+
+
+class ChunkJournal:
+	"""
+	Which byte ranges of an image have been received and verified, saved as JSON next to the image
+	(Images/<image>.journal) so an interrupted download can ask the Pi for only what's missing
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.size = None
+		self.integrity = 'md5'
+		self.chunks = {}		# (length, checksum) of each verified chunk by offset
+		self.load()
+
+	def load(self):
+		if not os.path.isfile(self.path):
+			return
+		try:
+			with open(self.path, 'r') as f:
+				saved = json.load(f)
+			self.size = saved['size']
+			self.integrity = saved['integrity']
+			for each in saved['chunks']:
+				if each['verified']:
+					self.chunks[each['offset']] = (each['length'], str(each['checksum']))
+		except Exception, e:
+			print("Error reading the chunk journal " + self.path + ": " + str(e))
+			self.reset(None)
+
+	def reset(self, size, integrity='md5'):
+		self.size = size
+		self.integrity = integrity
+		self.chunks = {}
+
+	def add(self, offset, data):
+		self.chunks[offset] = (len(data), binascii.hexlify(INTEGRITY[self.integrity](data)))
+
+	def have(self):
+		""" Number of image bytes verified """
+		return sum([length for length, checksum in self.chunks.values()])
+
+	def missing(self):
+		""" The byte ranges still needed, as [(start, end)] """
+		ranges = []
+		position = 0
+		for offset in sorted(self.chunks):
+			if offset > position:
+				ranges.append((position, offset))
+			position = max(position, offset + self.chunks[offset][0])
+		if self.size is not None and position < self.size:
+			ranges.append((position, self.size))
+		return ranges
+
+	def verify(self, imagePath):
+		""" Drops any chunk whose bytes on disk no longer match its checksum """
+		if not os.path.isfile(imagePath):
+			self.chunks = {}
+			return
+		with open(imagePath, 'rb') as f:
+			for offset in sorted(self.chunks):
+				length, checksum = self.chunks[offset]
+				f.seek(offset)
+				if binascii.hexlify(INTEGRITY[self.integrity](f.read(length))) != checksum:
+					del self.chunks[offset]
+
+	def save(self):
+		""" Writes every verified chunk and every gap between them """
+		entries = [{'offset': offset, 'length': length, 'checksum': checksum, 'verified': True} for offset, (length, checksum) in self.chunks.items()]
+		entries += [{'offset': start, 'length': end - start, 'checksum': '', 'verified': False} for start, end in self.missing()]
+		entries.sort(key=lambda each: each['offset'])
+		temp = self.path + '.tmp'
+		with open(temp, 'w') as f:
+			json.dump({'size': self.size, 'integrity': self.integrity, 'chunks': entries}, f)
+		os.rename(temp, self.path)		# Never leave half a journal behind
+
+	def remove(self):
+		if os.path.isfile(self.path):
+			os.remove(self.path)
+
+
+class ChunkSizeController:
+	"""
+	Picks the chunk size for the windowed transfer. Each window the size grows by a fixed step if nothing was lost,
+	and is halved if anything was (AIMD), so it settles just under what the link can carry.
+	Each transfer's stats are saved to statsPath, and the next transfer starts at the sizes of the fastest recent one
+	"""
+
+	def __init__(self, statsPath=None, minChunk=250, maxChunk=6000, step=250, decrease=0.5, history=50):
+		self.statsPath = statsPath
+		self.minChunk = minChunk
+		self.maxChunk = maxChunk
+		self.step = step					# Bytes added after a clean window
+		self.decrease = decrease			# Fraction kept after a window with losses
+		self.historyLength = history		# Transfers kept in the stats file
+		self.rtt = None						# Round trip time from the still image system's connection test
+		self.history = []
+		self.chunk = DEFAULT_CHUNK
+		self.sizes = []						# Chunk size chosen for each window of the current transfer
+		self.load()
+
+	def load(self):
+		if not self.statsPath or not os.path.isfile(self.statsPath):
+			return
+		try:
+			with open(self.statsPath, 'r') as f:
+				self.history = json.load(f)
+		except Exception, e:
+			print("Error reading the transfer stats " + self.statsPath + ": " + str(e))
+			self.history = []
+
+	def save(self):
+		if not self.statsPath:
+			return
+		temp = self.statsPath + '.tmp'
+		with open(temp, 'w') as f:
+			json.dump(self.history[-self.historyLength:], f)
+		os.rename(temp, self.statsPath)
+
+	def setRtt(self, rtt):
+		self.rtt = rtt
+
+	def timeout(self, default):
+		""" Silence to wait before asking again, a few round trips if the round trip time is known """
+		if self.rtt is None:
+			return default
+		return max(1.0, 4*self.rtt)
+
+	def clamp(self, chunk):
+		return int(min(max(chunk, self.minChunk), self.maxChunk))
+
+	def begin(self):
+		""" Chunk size to start a transfer with, the average size used by the fastest of the last 10 transfers """
+		recent = [each for each in self.history[-10:] if each.get('sizes')]
+		if recent:
+			best = max(recent, key=lambda each: each['rate'])
+			self.chunk = self.clamp(sum(best['sizes'])/len(best['sizes']))
+		else:
+			self.chunk = self.clamp(DEFAULT_CHUNK)
+		self.sizes = [self.chunk]
+		return self.chunk
+
+	def setChunk(self, chunk):
+		""" The size the Pi actually chose """
+		self.chunk = self.clamp(chunk)
+		self.sizes = [self.chunk]
+
+	def update(self, good, lost):
+		""" Chunk size for the next window, given the chunks verified and lost in the last one """
+		if lost:
+			self.chunk = self.clamp(self.chunk*self.decrease)
+		elif good:
+			self.chunk = self.clamp(self.chunk + self.step)
+		self.sizes.append(self.chunk)
+		return self.chunk
+
+	def finish(self, stats):
+		""" Records a finished transfer """
+		self.history.append({
+			'time': time.time(),
+			'bytes': stats['bytes'],
+			'seconds': stats['seconds'],
+			'rate': stats['rate'],
+			'retries': stats['bad'] + stats['timeouts'],
+			'sizes': self.sizes[-500:],
+			'rtt': self.rtt,
+		})
+		self.history = self.history[-self.historyLength:]
+		try:
+			self.save()
+		except Exception, e:
+			print("Error saving the transfer stats " + str(self.statsPath) + ": " + str(e))
+
+
+class ImageReceiver:
+	"""
+	Ground side of the windowed transfer. Works with anything that reads and writes like serial.Serial
+	(the radio multiplexer's streams, a serial port, or a pseudo terminal)
+	"""
+
+	def __init__(self, ser, window=DEFAULT_WINDOW, chunk=DEFAULT_CHUNK, integrity='crc32', encoding='cobs', timeout=3, maxRetries=5, progress=None, status=None, controller=None, interrupted=None):
+		self.ser = ser
+		self.options = {'W': window, 'C': chunk, 'I': integrity, 'E': encoding}
+		self.controller = controller		# ChunkSizeController that adapts the chunk size, or None to keep it fixed
+		self.timeout = timeout				# Silence before the acknowledgement is sent again
+		if controller is not None:
+			self.timeout = controller.timeout(timeout)
+		self.maxRetries = maxRetries		# Acknowledgements sent in a row without an answer before giving up
+		self.progress = progress or (lambda received, total: None)
+		self.status = status or (lambda text: None)
+		self.interrupted = interrupted or (lambda: False)		# Checked between reads, stops the transfer when true
+		self.stats = {}
+		self.acknowledged = False			# Whether the Pi acknowledged the last request
+
+	def request(self, name, ackTimeout=5, journal=None, preview=False):
+		"""
+		Asks the Pi for an image, and returns the Pi's header as a dictionary with name, size and the options it chose.
+		Returns None if there's no acknowledge (firmware without the windowed transfer) or the Pi refuses.
+		If journal has part of the image, only the missing ranges are asked for. With preview, it asks for the thumbnail
+		"""
+
+		options = dict(self.options)
+		if preview:
+			options['V'] = 'thumb'
+			journal = None
+		if self.controller is not None:
+			options['C'] = self.controller.begin()
+		if journal is not None and journal.size is not None and journal.have() > 0:
+			options['S'] = journal.size
+			options['N'] = formatRanges(journal.missing())
+
+		self.acknowledged = False
+		self.ser.write(WINDOWED_REQUEST)
+		killTime = time.time() + ackTimeout
+		while self.ser.read() != 'A':
+			if time.time() > killTime:
+				return None
+			self.ser.write(WINDOWED_REQUEST)
+		self.acknowledged = True
+		self.ser.write('RQ;' + name + ';' + formatOptions(options) + '\n')
+
+		killTime = time.time() + ackTimeout
+		line = ''
+		while not line.startswith('OK;') and time.time() < killTime:
+			line = self.ser.readline()
+			if line.startswith('NO;'):
+				self.status('Image Refused: ' + line[3:].strip())
+				return None
+			line = line[line.find('OK;'):] if 'OK;' in line else ''
+		if not line:
+			return None
+		fields = line.strip().split(';')
+		header = parseOptions(fields[3:])
+		header['name'] = fields[1]
+		header['size'] = int(fields[2])
+		if self.controller is not None and 'C' in header:
+			self.controller.setChunk(int(header['C']))
+		return header
+
+	def receive(self, header, savePath, journal=None):
+		"""
+		Receives the image announced by header into savePath, returns True if every chunk arrived.
+		Verified chunks are recorded in the journal (savePath.journal by default), which is removed once the image is complete
+		"""
+
+		size = header['size']
+		integrity = header.get('I', 'md5')
+		codec = CODECS[header.get('E', 'b64')](integrity)
+		if journal is None:
+			journal = ChunkJournal(savePath + '.journal')
+		resuming = 'N' in header and journal.size == size and journal.integrity == integrity and os.path.isfile(savePath)
+		if not resuming:
+			journal.reset(size, integrity)
+		received = {}			# Length of each verified chunk by sequence number
+		have = journal.have()	# Image bytes verified
+		high = -1				# Highest sequence number seen
+		windowGood = 0			# Chunks verified since the last acknowledgement
+		retries = 0
+		stats = {'frames': 0, 'bad': 0, 'duplicates': 0, 'sacks': 0, 'timeouts': 0}
+		startTime = time.time()
+		lastData = startTime
+
+		if codec.name != TextFrameCodec.name and hasattr(self.ser, 'setFrameBoundary'):
+			self.ser.setFrameBoundary(codec.boundary)		# Keep the radio multiplexer from finding GPS lines inside the raw bytes
+
+		if resuming:
+			f = open(savePath, 'r+b')
+			self.status('Resuming with %d of %d bytes' % (have, size))
+		else:
+			f = open(savePath, 'wb')
+			f.truncate(size)
+		try:
+			while have < size:
+				if self.interrupted():
+					self.status('Transfer stopped')
+					self.stop()
+					break
+				data = self.ser.read(max(1, self.ser.inWaiting()))
+				now = time.time()
+				if not data:
+					if now - lastData < self.timeout:
+						continue
+					retries += 1
+					stats['timeouts'] += 1
+					if retries > self.maxRetries:
+						self.status('Transfer timed out')
+						break
+					self.sendSack(high, received, self.adapt(windowGood, 1))		# The window's end was lost, ask again
+					windowGood = 0
+					stats['sacks'] += 1
+					lastData = now
+					continue
+				lastData = now
+				retries = 0
+
+				for frameType, seq, offset, payload in codec.feed(data):
+					if frameType == FRAME_DATA:
+						stats['frames'] += 1
+						high = max(high, seq)
+						if seq in received:
+							stats['duplicates'] += 1
+							continue
+						f.seek(offset)
+						f.write(payload)
+						journal.add(offset, payload)
+						received[seq] = len(payload)
+						have += len(payload)
+						windowGood += 1
+						self.progress(have, size)
+					elif frameType == FRAME_END:
+						high = max(high, seq)
+						if have >= size:
+							break
+						f.flush()
+						journal.save()			# Everything verified so far survives a dropped link
+						lost = len([seq for seq in range(high + 1) if seq not in received])
+						self.sendSack(high, received, self.adapt(windowGood, lost))
+						windowGood = 0
+						stats['sacks'] += 1
+					else:
+						stats['bad'] += 1
+		finally:
+			f.close()
+
+		complete = have >= size
+		if complete:
+			self.ser.write('DONE\n')
+			journal.remove()
+		else:
+			journal.save()
+		stats['bytes'] = have
+		stats['seconds'] = time.time() - startTime
+		stats['rate'] = have/stats['seconds'] if stats['seconds'] > 0 else 0
+		self.stats = stats
+		if self.controller is not None:
+			self.controller.finish(stats)
+		return complete
+
+	def stop(self, quiet=0.5):
+		""" Tells the Pi to stop sending, and throws away what it already sent until the link has been quiet for a while """
+		self.ser.write('STOP\n')
+		killTime = time.time() + self.timeout
+		lastData = time.time()
+		while time.time() < killTime and time.time() - lastData < quiet:
+			if self.ser.inWaiting():
+				self.ser.read(self.ser.inWaiting())
+				lastData = time.time()
+			else:
+				time.sleep(0.05)
+		self.ser.flushInput()
+
+	def adapt(self, good, lost):
+		""" The chunk size to ask for next, None if it isn't adapted """
+		if self.controller is None:
+			return None
+		return self.controller.update(good, lost)
+
+	def sendSack(self, high, received, chunk=None):
+		missing = [str(seq) for seq in range(high + 1) if seq not in received]
+		line = 'SACK;%d;%s' % (high, ','.join(missing))
+		if chunk is not None:
+			line += ';C=%d' % chunk			# Size for the chunks the Pi hasn't sent yet
+		self.ser.write(line + '\n')
+
+
+class ImageSender:
+	""" Reference Pi side of the windowed transfer, serves IMAGE;9! requests from a serial-like port """
+
+	def __init__(self, ser, imageDir='.', timeout=3, maxRetries=10):
+		self.ser = ser
+		self.imageDir = imageDir
+		self.timeout = timeout				# Time to wait for an acknowledgement before sending the window's end again
+		self.maxRetries = maxRetries
+
+	def serve(self, stopEvent=None):
+		""" Answers requests until stopEvent is set """
+		command = ''
+		while stopEvent is None or not stopEvent.is_set():
+			command = (command + self.ser.read())[-len(WINDOWED_REQUEST):]
+			if command == WINDOWED_REQUEST:
+				command = ''
+				self.ser.write('A')
+				self.handleRequest()
+
+	def mostRecent(self):
+		images = [each for each in os.listdir(self.imageDir) if each.endswith('.jpg')]
+		if not images:
+			return ''
+		return max(images, key=lambda each: os.path.getmtime(os.path.join(self.imageDir, each)))
+
+	def handleRequest(self):
+		""" Reads the request line after the acknowledge, and sends the image """
+
+		line = ''
+		killTime = time.time() + self.timeout
+		while 'RQ;' not in line and time.time() < killTime:
+			line = self.ser.readline()
+		if 'RQ;' not in line:
+			return False
+		fields = line[line.find('RQ;'):].strip().split(';')
+		name = fields[1] or self.mostRecent()
+		options = parseOptions(fields[2:])
+		path = os.path.join(self.imageDir, name)
+		if not name or not os.path.isfile(path):
+			self.ser.write('NO;' + (name or 'No Images') + '\n')
+			return False
+
+		# Use what was asked for, or fall back to what this sender has
+		chosen = {
+			'W': max(1, int(options.get('W', DEFAULT_WINDOW))),
+			'C': max(1, int(options.get('C', DEFAULT_CHUNK))),
+			'I': options.get('I') if options.get('I') in INTEGRITY else 'md5',
+			'E': options.get('E') if options.get('E') in CODECS else 'b64',
+		}
+		with open(path, 'rb') as imageFile:
+			image = imageFile.read()
+		if options.get('V') == 'thumb':
+			image = exifThumbnail(image)
+			if image is None:
+				self.ser.write('NO;No Thumbnail in ' + name + '\n')
+				return False
+			chosen['V'] = 'thumb'
+			options.pop('N', None)
+
+		# A resume only makes sense if it's still the same image
+		ranges = [(0, len(image))]
+		if 'N' in options and options.get('S') == str(len(image)):
+			ranges = [(max(start, 0), min(end, len(image))) for start, end in parseRanges(options['N'])]
+			chosen['N'] = options['N']
+		self.ser.write('OK;%s;%d;%s\n' % (name, len(image), formatOptions(chosen)))
+		return self.send(image, chosen, ranges)
+
+	def send(self, image, options, ranges=None):
+		""" Sends the byte ranges of the image (all of it by default) a window at a time until the ground station says it's done """
+
+		codec = CODECS[options['E']](options['I'])
+		window = options['W']
+		chunk = options['C']
+		chunks = {}						# (offset, length) of each sequence number
+		outstanding = set()				# Sent and not acknowledged
+		resend = []
+		ranges = list(ranges or [(0, len(image))])
+		nextOffset, rangeEnd = ranges.pop(0) if ranges else (0, 0)
+		nextSeq = 0
+
+		while True:
+			frames = []
+			while resend and len(frames) < window:
+				seq = resend.pop(0)
+				offset, length = chunks[seq]
+				frames.append(codec.encodeData(seq, offset, image[offset:offset+length]))
+			while len(frames) < window:
+				if nextOffset >= rangeEnd:
+					if not ranges:
+						break
+					nextOffset, rangeEnd = ranges.pop(0)
+					continue
+				length = min(chunk, rangeEnd - nextOffset)
+				chunks[nextSeq] = (nextOffset, length)
+				outstanding.add(nextSeq)
+				frames.append(codec.encodeData(nextSeq, nextOffset, image[nextOffset:nextOffset+length]))
+				nextOffset += length
+				nextSeq += 1
+			frames.append(codec.encodeEnd(nextSeq - 1))
+			self.ser.write(''.join(frames))
+
+			reply = self.waitForReply(codec.encodeEnd(nextSeq - 1))
+			if reply is None or reply.startswith('STOP'):
+				return False
+			if reply.startswith('DONE'):
+				return True
+			high, missing, replyOptions = parseSack(reply)
+			if 'C' in replyOptions:
+				chunk = max(1, int(replyOptions['C']))		# The ground station adapts the chunk size
+			outstanding = set([seq for seq in outstanding if seq > high or seq in missing])
+			resend = sorted(outstanding)
+
+	def waitForReply(self, end):
+		""" Waits for a SACK, DONE or STOP, sending the window's end again on each timeout """
+		retries = 0
+		killTime = time.time() + self.timeout
+		while retries <= self.maxRetries:
+			line = self.ser.readline()
+			for each in ['SACK;', 'DONE', 'STOP']:
+				if each in line:
+					return line[line.find(each):]
+			if time.time() > killTime:
+				retries += 1
+				self.ser.write(end)
+				killTime = time.time() + self.timeout
+		return None
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print(__doc__)
+		sys.exit(1)
+
+	import tempfile
+	import shutil
+	from LinkSimulator import openPtyPair
+
+	ground, pi = openPtyPair()
+	imageDir = tempfile.mkdtemp()
+	try:
+		shutil.copy(sys.argv[1], os.path.join(imageDir, 'sent.jpg'))
+		stopEvent = threading.Event()
+		sender = threading.Thread(target=ImageSender(pi, imageDir).serve, args=(stopEvent,))
+		sender.daemon = True
+		sender.start()
+
+		receiver = ImageReceiver(ground)
+		header = receiver.request('sent.jpg')
+		if header is None:
+			print("No acknowledge from the sender")
+			sys.exit(1)
+		savePath = os.path.join(imageDir, 'received.jpg')
+		complete = receiver.receive(header, savePath)
+		stopEvent.set()
+		same = open(savePath, 'rb').read() == open(sys.argv[1], 'rb').read()
+		print("Complete: %s, identical: %s" % (complete, same))
+		print("%(bytes)d bytes in %(seconds).2f s (%(rate).0f bytes/s), %(frames)d frames, %(bad)d bad, %(sacks)d acknowledgements" % receiver.stats)
+	finally:
+		shutil.rmtree(imageDir)
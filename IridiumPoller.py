@@ -0,0 +1,150 @@
+"""
+Incremental polling of the Iridium GPS table, for the Iridium tracking method's database fallback.
+
+The poller keeps one connection open, checks it's still alive before polling once it has been idle,
+and reconnects after errors. The first poll gets the most recent row, after that only rows with a
+pri_key above the last one seen are fetched, in order and a limited number at a time, so a poll
+reads a few index entries instead of scanning the whole table.
+
+Works with any DB-API module, the query's placeholders follow the module's paramstyle
+(MySQLdb is format, sqlite3 is qmark). Self test against a SQLite stand-in of the table:
+	python IridiumPoller.py
+"""
+
+import time
+
+COLUMNS = 'pri_key, gps_fltDate, gps_time, gps_lat, gps_long, gps_alt'
+
+# Written with format placeholders, converted to the module's paramstyle
+LATEST_QUERY = 'SELECT ' + COLUMNS + ' FROM gps WHERE gps_IMEI = %s ORDER BY pri_key DESC LIMIT %s'
+NEW_ROWS_QUERY = 'SELECT ' + COLUMNS + ' FROM gps WHERE gps_IMEI = %s AND pri_key > %s ORDER BY pri_key LIMIT %s'
+
+
+def convertPlaceholders(sql, paramstyle):
+	""" The query with its %s placeholders in the paramstyle's form """
+	if paramstyle in ('format', 'pyformat'):		# pyformat drivers take %s as well
+		return sql
+	parts = sql.split('%s')
+	if paramstyle == 'qmark':
+		return '?'.join(parts)
+	if paramstyle == 'numeric':
+		placeholder = ':%d'
+	elif paramstyle == 'named':
+		placeholder = ':p%d'
+	else:
+		raise ValueError("Unknown paramstyle " + str(paramstyle))
+	converted = parts[0]
+	for i, part in enumerate(parts[1:]):
+		converted += placeholder % (i + 1) + part
+	return converted
+
+
+def convertParameters(parameters, paramstyle):
+	if paramstyle == 'named':
+		return dict([('p%d' % (i + 1), value) for i, value in enumerate(parameters)])
+	return tuple(parameters)
+
+
+class IridiumPoller:
+	"""
+	Polls the gps table for new rows from one IMEI. module is the DB-API module (MySQLdb), connectArgs
+	its connect() keyword arguments. poll() returns the new rows as (fltDate, time, lat, lon, alt), oldest first
+	"""
+
+	def __init__(self, module, connectArgs, imei, limit=20, pingInterval=30):
+		self.module = module
+		self.connectArgs = connectArgs
+		self.imei = str(imei)
+		self.limit = limit					# Most rows fetched per poll
+		self.pingInterval = pingInterval	# Seconds idle before the connection is checked
+		self.paramstyle = getattr(module, 'paramstyle', 'format')
+		self.latestQuery = convertPlaceholders(LATEST_QUERY, self.paramstyle)
+		self.newRowsQuery = convertPlaceholders(NEW_ROWS_QUERY, self.paramstyle)
+		self.connection = None
+		self.cursor = None
+		self.lastSeen = None				# pri_key of the newest row returned
+		self.lastUsed = 0
+		self.connects = 0
+
+	def connect(self):
+		self.close()
+		self.connection = self.module.connect(**self.connectArgs)
+		self.cursor = self.connection.cursor()
+		self.connects += 1
+		self.lastUsed = time.time()
+
+	def healthy(self):
+		""" Whether the connection still answers, only asked once it has been idle for pingInterval """
+		if self.connection is None:
+			return False
+		if time.time() - self.lastUsed < self.pingInterval:
+			return True
+		try:
+			self.cursor.execute('SELECT 1')
+			self.cursor.fetchall()
+			return True
+		except Exception, e:
+			print("Iridium database connection lost: " + str(e))
+			return False
+
+	def execute(self, sql, parameters):
+		self.cursor.execute(sql, convertParameters(parameters, self.paramstyle))
+		rows = self.cursor.fetchall()
+		try:
+			self.connection.commit()		# Ends the transaction, so the next poll sees new rows
+		except Exception:
+			pass
+		self.lastUsed = time.time()
+		return rows
+
+	def poll(self):
+		""" The rows added since the last poll, the most recent one on the first poll. Raises if the database can't be reached """
+		if not self.healthy():
+			self.connect()
+		try:
+			if self.lastSeen is None:
+				rows = self.execute(self.latestQuery, [self.imei, 1])
+			else:
+				rows = self.execute(self.newRowsQuery, [self.imei, self.lastSeen, self.limit])
+		except Exception:
+			self.close()		# Reconnect on the next poll
+			raise
+		if rows:
+			self.lastSeen = rows[-1][0]
+		return [tuple(row[1:]) for row in rows]
+
+	def close(self):
+		for each in [self.cursor, self.connection]:
+			try:
+				if each is not None:
+					each.close()
+			except Exception:
+				pass
+		self.cursor = None
+		self.connection = None
+
+
+if __name__ == "__main__":
+	import os
+	import sqlite3
+	import tempfile
+
+	path = os.path.join(tempfile.mkdtemp(), 'iridium.db')
+	db = sqlite3.connect(path)
+	db.execute('CREATE TABLE gps (pri_key INTEGER PRIMARY KEY, gps_IMEI TEXT, gps_fltDate TEXT, gps_time TEXT, gps_lat REAL, gps_long REAL, gps_alt REAL)')
+	for i in range(1000):
+		db.execute('INSERT INTO gps (gps_IMEI, gps_fltDate, gps_time, gps_lat, gps_long, gps_alt) VALUES (?,?,?,?,?,?)',
+					('300234010000000' if i % 2 else '300234010999999', '2016-05-01', '12:%02d:%02d' % (i//60 % 60, i % 60), 45.0, -93.0, 100.0*i))
+	db.commit()
+
+	poller = IridiumPoller(sqlite3, {'database': path}, '300234010000000', pingInterval=0)
+	print("First poll: " + str(poller.poll()))
+	print("Nothing new: " + str(poller.poll()))
+	db.executemany('INSERT INTO gps (gps_IMEI, gps_fltDate, gps_time, gps_lat, gps_long, gps_alt) VALUES (?,?,?,?,?,?)',
+					[('300234010000000', '2016-05-01', '13:00:0%d' % i, 45.1, -93.1, 5000.0 + i) for i in range(3)])
+	db.commit()
+	print("New rows: " + str(poller.poll()))
+	poller.connection.close()		# The health check finds the dead connection and reconnects
+	print("After reconnecting: " + str(poller.poll()) + ", " + str(poller.connects) + " connects")
+	print("Query: " + poller.newRowsQuery)
+	print("Plan: " + str(db.execute('EXPLAIN QUERY PLAN ' + poller.newRowsQuery, ('300234010000000', 0, 20)).fetchall()))
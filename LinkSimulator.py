@@ -0,0 +1,512 @@
+"""
+Software stand-ins for the RFD link, so the radio protocols can be run without radios.
+openPtyPair() gives both ends of a pseudo terminal, and SimulatedLink gives two ends of an
+in-process link paced to a baud rate, with latency, bit errors, and dropped and inserted bytes.
+Each end has the parts of the serial.Serial interface the RFD code uses. PiResponder plays the
+Pi's side of the IMAGE;n! protocol and the payload commands on one end.
+
+To run the ground station against a simulated Pi, start
+	python LinkSimulator.py [--baud 38400] [--latency 0.05] [--ber 0] [--drop 0] [--insert 0] [--images <dir>]
+and use the pseudo terminal it prints as the RFD port
+"""
+
+import os
+import pty
+import tty
+import time
+import fcntl
+import random
+import select
+import struct
+import termios
+import base64
+import hashlib
+import threading
+import collections
+from ImageTransfer import ImageSender
+
+
+class PtySerial:
+	""" One end of a pseudo terminal, used like a serial.Serial with a read timeout """
+
+	def __init__(self, fd, timeout=2):
+		self.fd = fd
+		self.timeout = timeout
+		self.buffer = bytearray()		# Bytes read from the terminal that haven't been asked for yet
+
+	def fill(self, killTime):
+		""" Waits until killTime for bytes to arrive and buffers them, returns False if none came """
+		remaining = max(killTime - time.time(), 0)
+		ready = select.select([self.fd], [], [], remaining)[0]
+		if not ready:
+			return False
+		try:
+			self.buffer += os.read(self.fd, 4096)
+		except OSError:
+			return False
+		return True
+
+	def read(self, size=1):
+		""" Reads size bytes, or fewer if the timeout passes first """
+		killTime = time.time() + self.timeout
+		while len(self.buffer) < size and self.fill(killTime):
+			pass
+		data = str(self.buffer[:size])
+		del self.buffer[:size]
+		return data
+
+	def readline(self):
+		""" Reads through the next newline, or whatever arrived if the timeout passes first """
+		killTime = time.time() + self.timeout
+		while '\n' not in self.buffer and self.fill(killTime):
+			pass
+		end = self.buffer.find('\n') + 1
+		if end == 0:
+			end = len(self.buffer)
+		data = str(self.buffer[:end])
+		del self.buffer[:end]
+		return data
+
+	def inWaiting(self):
+		waiting = struct.unpack('I', fcntl.ioctl(self.fd, termios.FIONREAD, '\0\0\0\0'))[0]
+		return len(self.buffer) + waiting
+
+	def write(self, data):
+		data = str(data)
+		while data:
+			written = os.write(self.fd, data)
+			data = data[written:]
+
+	def flushInput(self):
+		del self.buffer[:]
+		termios.tcflush(self.fd, termios.TCIFLUSH)
+
+	def flushOutput(self):
+		pass
+
+	def close(self):
+		os.close(self.fd)
+
+
+def openPtyPair(timeout=2):
+	""" Returns the (ground, pi) ends of a raw pseudo terminal pair """
+	master, slave = pty.openpty()
+	tty.setraw(master)
+	tty.setraw(slave)
+	return PtySerial(master, timeout), PtySerial(slave, timeout)
+
+
+class SimulatedWire:
+	""" One direction of a SimulatedLink, holds the bytes in flight with the time each piece arrives """
+
+	def __init__(self, link):
+		self.link = link
+		self.inFlight = collections.deque()		# (arrival time, bytes)
+		self.nextFree = 0						# When the sender's last byte finishes going out
+		self.nextError = link.errorGap()		# Bytes until the next bit error
+
+	def send(self, data):
+		""" Queues data behind what's already being sent, paced at the baud rate """
+		link = self.link
+		with link.condition:
+			data = self.impair(bytearray(data))
+			start = max(time.time(), self.nextFree)
+			for i in range(0, len(data), link.pieceSize):
+				piece = data[i:i+link.pieceSize]
+				start += len(piece)*link.byteTime
+				self.inFlight.append((start + link.latency, piece))
+			self.nextFree = start
+			link.condition.notify_all()
+
+	def impair(self, data):
+		""" Flips one bit at each bit error position, then drops and inserts bytes """
+		link = self.link
+		while self.nextError < len(data):
+			data[self.nextError] ^= 1 << link.random.randint(0, 7)
+			self.nextError += link.errorGap()
+		self.nextError -= len(data)
+		if link.dropRate <= 0 and link.insertRate <= 0:
+			return data
+
+		out = bytearray()
+		chance = link.random.random
+		for byte in data:
+			if chance() < link.insertRate:
+				out.append(link.random.randint(0, 255))
+			if chance() >= link.dropRate:
+				out.append(byte)
+		return out
+
+	def arrived(self, buffer):
+		""" Moves what's arrived by now into buffer, returns the arrival time of the next piece or None """
+		now = time.time()
+		while self.inFlight and self.inFlight[0][0] <= now:
+			buffer += self.inFlight.popleft()[1]
+		if self.inFlight:
+			return self.inFlight[0][0]
+		return None
+
+
+class SimulatedEnd:
+	""" One end of a SimulatedLink, used like a serial.Serial with a read timeout """
+
+	def __init__(self, link, incoming, outgoing, timeout):
+		self.link = link
+		self.incoming = incoming
+		self.outgoing = outgoing
+		self.timeout = timeout
+		self.buffer = bytearray()
+
+	def waitFor(self, ready):
+		""" Waits until ready() is true or the timeout passes """
+		killTime = time.time() + self.timeout
+		with self.link.condition:
+			while True:
+				nextArrival = self.incoming.arrived(self.buffer)
+				if ready():
+					return
+				now = time.time()
+				if now >= killTime:
+					return
+				wake = killTime if nextArrival is None else min(nextArrival, killTime)
+				self.link.condition.wait(max(wake - now, 0.0005))
+
+	def read(self, size=1):
+		self.waitFor(lambda: len(self.buffer) >= size)
+		data = str(self.buffer[:size])
+		del self.buffer[:size]
+		return data
+
+	def readline(self):
+		self.waitFor(lambda: '\n' in self.buffer)
+		end = self.buffer.find('\n') + 1
+		if end == 0:
+			end = len(self.buffer)
+		data = str(self.buffer[:end])
+		del self.buffer[:end]
+		return data
+
+	def inWaiting(self):
+		with self.link.condition:
+			self.incoming.arrived(self.buffer)
+			return len(self.buffer)
+
+	def write(self, data):
+		self.outgoing.send(data)
+
+	def flushInput(self):
+		with self.link.condition:
+			self.incoming.arrived(self.buffer)
+			del self.buffer[:]
+
+	def flushOutput(self):
+		pass
+
+	def close(self):
+		pass
+
+
+class SimulatedLink:
+	"""
+	A radio link in software: each direction sends at baud/10 bytes per second, delivers latency
+	seconds later, flips a bit with probability bitErrorRate, drops a byte with probability dropRate,
+	and inserts a random byte with probability insertRate
+	"""
+
+	def __init__(self, baud=57600, latency=0.05, bitErrorRate=0, seed=None, timeout=2, pieceSize=64, dropRate=0, insertRate=0):
+		self.byteTime = 10.0/baud			# Start and stop bit for every byte
+		self.latency = latency
+		self.bitErrorRate = bitErrorRate
+		self.dropRate = dropRate
+		self.insertRate = insertRate
+		self.pieceSize = pieceSize			# Bytes that arrive together
+		self.random = random.Random(seed)
+		self.condition = threading.Condition()
+		self.up = SimulatedWire(self)		# Ground to Pi
+		self.down = SimulatedWire(self)		# Pi to ground
+		self.ground = SimulatedEnd(self, self.down, self.up, timeout)
+		self.pi = SimulatedEnd(self, self.up, self.down, timeout)
+
+	def errorGap(self):
+		""" Bytes until the next bit error """
+		if self.bitErrorRate <= 0:
+			return float('inf')
+		return 1 + int(self.random.expovariate(self.bitErrorRate*8))
+
+	def ends(self):
+		""" Returns the (ground, pi) ends """
+		return self.ground, self.pi
+
+
+class GpsInterleaver:
+	"""
+	Wraps the Pi's end of the link, and writes a GPS line before a write whenever one is due,
+	the way the Pi mixes its GPS updates into whatever else it's sending
+	"""
+
+	def __init__(self, ser, interval=1.0):
+		self.ser = ser
+		self.interval = interval
+		self.nextGps = time.time() + interval
+		self.lock = threading.Lock()
+		self.timeout = ser.timeout
+
+	def gpsLine(self):
+		now = time.gmtime()
+		return 'GPS:%d,%d,%d,44.974712,-93.232101,10432.5,9!\n' % (now.tm_hour, now.tm_min, now.tm_sec)
+
+	def sendGpsIfDue(self):
+		with self.lock:
+			if self.interval and time.time() >= self.nextGps:
+				self.nextGps = time.time() + self.interval
+				self.ser.write(self.gpsLine())
+
+	def write(self, data):
+		with self.lock:
+			if self.interval and time.time() >= self.nextGps:
+				self.nextGps = time.time() + self.interval
+				data = self.gpsLine() + data
+			self.ser.write(data)
+
+	def read(self, size=1):
+		return self.ser.read(size)
+
+	def readline(self):
+		return self.ser.readline()
+
+	def inWaiting(self):
+		return self.ser.inWaiting()
+
+	def flushInput(self):
+		self.ser.flushInput()
+
+	def flushOutput(self):
+		pass
+
+
+class PiResponder:
+	"""
+	The Pi's side of the RFD protocols, for running the ground station without a payload. Answers the
+	IMAGE;n! still image commands (the windowed transfer through ImageTransfer.ImageSender) and
+	acknowledges identifier?command! payload commands. Handlers can be replaced or added with
+	setHandler(n, function), each is called with the responder after the command is read
+	"""
+
+	def __init__(self, ser, imageDir='Images', gpsInterval=1.0, wordlength=7000):
+		self.ser = GpsInterleaver(ser, gpsInterval)
+		self.imageDir = imageDir
+		self.wordlength = wordlength		# Starting word size of the original image transfer
+		self.settings = '650,450,0,50,0,0,400'
+		self.runtimeData = 'Pi runtime data\nUptime 01:23:45\n'
+		self.status = 'RFD: OK, Camera: OK, GPS: OK\n'
+		self.handlers = {
+			'1': PiResponder.sendMostRecent,
+			'2': PiResponder.sendImageList,
+			'3': PiResponder.sendRequested,
+			'4': PiResponder.sendSettings,
+			'5': PiResponder.receiveSettings,
+			'6': PiResponder.answerPings,
+			'7': PiResponder.sendRuntimeData,
+			'8': PiResponder.sendTime,
+			'9': PiResponder.sendWindowed,
+			'-': PiResponder.sendStatus,
+		}
+		self.commands = []				# (identifier, command) of each payload command received
+		self.stats = {'legacyRetries': 0}
+
+	def setHandler(self, command, handler):
+		self.handlers[command] = handler
+
+	def run(self, stopEvent=None):
+		""" Answers commands until stopEvent is set """
+		buf = ''
+		while stopEvent is None or not stopEvent.is_set():
+			self.ser.sendGpsIfDue()
+			data = self.ser.read(max(1, min(self.ser.inWaiting(), 256)))
+			if not data:
+				continue
+			buf = (buf + data)[-256:]
+			end = buf.find('!')
+			while end != -1:
+				self.handle(buf[:end+1])
+				buf = buf[end+1:]
+				end = buf.find('!')
+
+	def handle(self, text):
+		""" Runs the handler for the command that ends text """
+		idx = text.rfind('IMAGE;')
+		if idx != -1 and idx + 7 < len(text):
+			handler = self.handlers.get(text[idx+6])
+			if handler is not None:
+				handler(self)
+			return
+		if '?' in text:
+			identifier, command = text[:-1].split('?', 1)
+			identifier = identifier.split('!')[-1].strip()
+			self.commands.append((identifier, command))
+			self.ser.write(identifier + '\n')		# The payload acknowledges with its identifier
+
+	def waitFor(self, text, timeout=10):
+		""" Reads until text is received, returns what came after it on the line, None on a timeout """
+		buf = ''
+		killTime = time.time() + timeout
+		while time.time() < killTime:
+			buf += self.ser.readline()
+			if text in buf:
+				return buf[buf.find(text) + len(text):]
+		return None
+
+	def images(self):
+		if not os.path.isdir(self.imageDir):
+			return []
+		images = [each for each in os.listdir(self.imageDir) if each.endswith('.jpg')]
+		return sorted(images, key=lambda each: os.path.getmtime(os.path.join(self.imageDir, each)))
+
+	def sendMostRecent(self):
+		images = self.images()
+		if not images:
+			return
+		self.ser.write('A' + images[-1][:15].ljust(15))
+		self.sendLegacyImage(images[-1])
+
+	def sendImageList(self):
+		self.ser.write('A')
+		for each in self.images():
+			self.ser.write(each + '\n')
+		self.ser.write('X\n')
+
+	def sendRequested(self):
+		self.ser.write('A')
+		name = self.waitFor('RQ;')
+		if name is not None:
+			self.sendLegacyImage(name.strip()[0:15])
+
+	def sendLegacyImage(self, name):
+		""" The original stop and wait transfer: MD5 hex and a base64 word, then wait for Y, or N and a sync """
+		path = os.path.join(self.imageDir, name)
+		if not os.path.isfile(path):
+			return
+		with open(path, 'rb') as imageFile:
+			data = base64.b64encode(imageFile.read())
+		self.ser.write(str(len(data)) + '\n')
+		wordlength = self.wordlength
+		position = 0
+		tries = 0
+		while position < len(data):
+			word = data[position:position+wordlength]
+			self.ser.write(hashlib.md5(word).hexdigest() + word)
+			answer = self.waitForAnswer('YN')
+			if answer == 'Y':
+				position += len(word)
+				tries = 0
+				continue
+			tries += 1
+			self.stats['legacyRetries'] += 1
+			if answer is None or tries > 5:
+				return
+			if wordlength > 1000:
+				wordlength -= 1000
+			self.waitForAnswer('S')		# The ground station syncs, then asks for the word again
+
+	def waitForAnswer(self, answers, timeout=20):
+		killTime = time.time() + timeout
+		while time.time() < killTime:
+			answer = self.ser.read()
+			if answer and answer in answers:
+				return answer
+		return None
+
+	def sendSettings(self):
+		self.ser.write('Ack\n' + self.settings + '\n')
+
+	def receiveSettings(self):
+		self.ser.write('Ack1\n')
+		settings = self.waitFor('RQ/')
+		if settings is not None:
+			self.settings = settings.strip()
+			self.ser.write('Ack2\n')
+
+	def answerPings(self):
+		self.ser.write('A')
+		killTime = time.time() + 30
+		while time.time() < killTime:
+			ping = self.ser.read()
+			if ping == '~':
+				self.ser.write('~')
+			elif ping == 'D':
+				return
+
+	def sendRuntimeData(self):
+		self.ser.write('A' + self.runtimeData + '\r')
+
+	def sendTime(self):
+		self.ser.write('A' + time.strftime('%H:%M:%S', time.gmtime()) + '\n')
+
+	def sendWindowed(self):
+		self.ser.write('A')
+		ImageSender(self.ser, self.imageDir).handleRequest()
+
+	def sendStatus(self):
+		self.ser.write(self.status)
+
+
+class PtyBridge:
+	"""
+	Connects a pseudo terminal to the ground end of a SimulatedLink, so the ground station can open
+	the terminal's path like a serial port (through SerialDevice) and talk over the simulated link
+	"""
+
+	def __init__(self, link):
+		self.link = link
+		self.master, self.slave = pty.openpty()
+		tty.setraw(self.master)
+		tty.setraw(self.slave)
+		self.port = os.ttyname(self.slave)
+		self.stopEvent = threading.Event()
+
+	def start(self):
+		for target in [self.toLink, self.fromLink]:
+			thread = threading.Thread(target=target)
+			thread.daemon = True
+			thread.start()
+
+	def stop(self):
+		self.stopEvent.set()
+
+	def toLink(self):
+		while not self.stopEvent.is_set():
+			if select.select([self.master], [], [], 0.1)[0]:
+				self.link.ground.write(os.read(self.master, 4096))
+
+	def fromLink(self):
+		ground = self.link.ground
+		while not self.stopEvent.is_set():
+			data = ground.read(max(1, ground.inWaiting()))
+			if data:
+				os.write(self.master, data)
+
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(description="Simulated RFD link with a Pi at the other end")
+	parser.add_argument('--baud', type=int, default=38400)
+	parser.add_argument('--latency', type=float, default=0.05)
+	parser.add_argument('--ber', type=float, default=0, help="bit error rate")
+	parser.add_argument('--drop', type=float, default=0, help="chance each byte is dropped")
+	parser.add_argument('--insert', type=float, default=0, help="chance a byte is inserted before each byte")
+	parser.add_argument('--images', default='Images', help="directory of images the Pi has")
+	parser.add_argument('--gps', type=float, default=1.0, help="seconds between GPS lines")
+	args = parser.parse_args()
+
+	link = SimulatedLink(args.baud, args.latency, args.ber, timeout=0.5, dropRate=args.drop, insertRate=args.insert)
+	bridge = PtyBridge(link)
+	bridge.start()
+	responder = threading.Thread(target=PiResponder(link.pi, args.images, args.gps).run)
+	responder.daemon = True
+	responder.start()
+	print("RFD port: " + bridge.port)
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		bridge.stop()
@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+import geomag
+
+
+class DeclinationService:
+	"""
+	A class to serve magnetic declination without running the full geomag model on every balloon update.
+	A lat/lon/alt grid is precomputed around the ground station and interpolated, and lookups that
+	fall outside the grid are cached in a bounded LRU
+	"""
+
+	def __init__(self, latSpan=2.0, lonSpan=2.0, step=0.5, altitudes=(0, 25000, 50000, 75000, 100000, 125000), cacheSize=256, cacheResolution=0.05):
+		self.latSpan = latSpan				# Degrees north and south of the ground station covered by the grid
+		self.lonSpan = lonSpan				# Degrees east and west of the ground station covered by the grid
+		self.step = step					# Grid spacing in degrees
+		self.altitudes = list(altitudes)	# Grid altitude levels in feet, ascending
+		self.cacheSize = cacheSize			# Max number of off grid lookups held
+		self.cacheResolution = cacheResolution	# Off grid lookups are rounded to this many degrees (and 1000 ft) before caching
+
+		self.lock = threading.Lock()		# Updates arrive from the RFD, APRS and Iridium threads at once
+		self.grid = None
+		self.generation = 0					# Counts setCenter calls, so only the latest grid build is kept
+		self.cache = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def setCenter(self, lat, lon):
+		"""
+		Precomputes the declination grid around the ground station on a worker thread, the grid is a few hundred
+		geomag calls. Lookups keep using the old grid (or geomag directly) until the new one is swapped in
+		"""
+
+		with self.lock:
+			self.generation += 1
+			generation = self.generation
+		builder = threading.Thread(target=self.buildGrid, args=(float(lat), float(lon), generation))
+		builder.daemon = True
+		builder.start()
+		return builder
+
+	def buildGrid(self, lat, lon, generation):
+		""" Computes the grid around lat, lon and swaps it in, unless setCenter was called again meanwhile """
+
+		nLat = int(round(2*self.latSpan/self.step)) + 1
+		nLon = int(round(2*self.lonSpan/self.step)) + 1
+		lat0 = max(lat - self.latSpan, -89.5)
+		lon0 = lon - self.lonSpan
+
+		grid = []
+		for alt in self.altitudes:
+			level = []
+			for i in range(nLat):
+				row = []
+				for j in range(nLon):
+					row.append(float(geomag.declination(dlat=lat0 + i*self.step, dlon=lon0 + j*self.step, h=alt)))
+				level.append(row)
+			grid.append(level)
+
+		with self.lock:
+			if generation != self.generation:		# A newer center was set while this one was building
+				return
+			self.grid = grid
+			self.lat0 = lat0
+			self.lon0 = lon0
+			self.nLat = nLat
+			self.nLon = nLon
+			self.cache.clear()
+
+	def declination(self, lat, lon, alt=0):
+		""" Returns the magnetic declination in degrees, interpolated from the grid when possible """
+
+		lat = float(lat)
+		lon = float(lon)
+		alt = float(alt)
+		with self.lock:
+			if self.grid is not None:
+				value = self.interpolate(lat, lon, alt)
+				if value is not None:
+					self.hits += 1
+					return value
+
+			key = (round(lat/self.cacheResolution), round(lon/self.cacheResolution), round(alt/1000))
+			if key in self.cache:
+				value = self.cache.pop(key)
+				self.cache[key] = value		# Move to the most recently used end
+				self.hits += 1
+				return value
+
+		value = float(geomag.declination(dlat=lat, dlon=lon, h=alt))
+		with self.lock:
+			self.misses += 1
+			self.cache[key] = value
+			if len(self.cache) > self.cacheSize:
+				self.cache.popitem(last=False)		# Evict the least recently used
+		return value
+
+	def interpolate(self, lat, lon, alt):
+		""" Trilinear interpolation in the grid, None if the point is outside of it """
+
+		x = (lat - self.lat0)/self.step
+		y = ((lon - self.lon0 + 180) % 360 - 180)/self.step		# Wrapped, so grids across the antimeridian work
+		if x < 0 or y < 0 or x > self.nLat - 1 or y > self.nLon - 1:
+			return None
+
+		# Altitudes above or below the grid are clamped, declination barely changes with height
+		alts = self.altitudes
+		if alt <= alts[0]:
+			k, fz = 0, 0.0
+		elif alt >= alts[-1]:
+			k, fz = len(alts) - 1, 0.0
+		else:
+			k = 0
+			while alts[k+1] < alt:
+				k += 1
+			fz = (alt - alts[k])/float(alts[k+1] - alts[k])
+
+		i = min(int(x), self.nLat - 2)
+		j = min(int(y), self.nLon - 2)
+		fx = x - i
+		fy = y - j
+
+		value = self.bilinear(self.grid[k], i, j, fx, fy)
+		if fz > 0:
+			value += fz*(self.bilinear(self.grid[k+1], i, j, fx, fy) - value)
+		return value
+
+	def bilinear(self, level, i, j, fx, fy):
+		""" Bilinear interpolation within one altitude level of the grid """
+
+		top = level[i][j] + fy*(level[i][j+1] - level[i][j])
+		bottom = level[i+1][j] + fy*(level[i+1][j+1] - level[i+1][j])
+		return top + fx*(bottom - top)
+
+
+declinationService = DeclinationService()		# Shared by every balloon update and the ground station calibration
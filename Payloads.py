@@ -3,6 +3,7 @@ import time
 import datetime
 from datetime import *
 from MapHTML import *
+from TelemetryParser import telemetryParser
 
 
 class Payload:
@@ -30,14 +31,15 @@ class Payload:
 
 	def addMessage(self,msg):			# Determines if a message is actually a GPS update, sorts it appropriately
 		temp = PayloadMessage(msg)
-		if len(temp.getMessage().split(',')) == 5:		# GPS Updates are always comma separated with a length of 5
+		gps = telemetryParser.parsePayloadGps(msg)
+		if gps is not None:
 			self.gpsUpdates.append(temp)
 			self.newGPSUpdates.append(temp)
-			self.time = temp.getMessage().split(',')[0]
-			self.lat = temp.getMessage().split(',')[1]
-			self.lon = temp.getMessage().split(',')[2]
-			self.alt = temp.getMessage().split(',')[3]
-			self.sat = temp.getMessage().split(',')[4]
+			self.time = gps.time
+			self.lat = gps.lat
+			self.lon = gps.lon
+			self.alt = gps.alt
+			self.sat = gps.sat
 			self.newLocation = True
 		else:
 			self.messages.append(temp)
@@ -0,0 +1,88 @@
+import os
+from collections import OrderedDict
+from PyQt4 import QtCore
+from PyQt4.QtGui import QPixmap, QTransform
+
+
+class PictureCache:
+	"""
+	A class to keep decoded still image pictures so the display doesn't reload and rescale them from disk
+	on every update. Holds the flipped full size picture for each (path, hflip, vflip), and the smooth scaled
+	copy for each target size, least recently used first out once they go over the memory budget.
+	The file's modified time is part of the key so a picture saved again under the same name (a thumbnail
+	replaced by the full image) is loaded fresh
+	"""
+
+	def __init__(self, maxBytes=64*1024*1024):
+		self.maxBytes = maxBytes
+		self.entries = OrderedDict()		# key -> (pixmap, bytes), oldest first
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	@staticmethod
+	def pixmapBytes(pm):
+		return pm.width()*pm.height()*max(pm.depth(), 8)/8
+
+	def get(self, key):
+		entry = self.entries.pop(key, None)
+		if entry is None:
+			self.misses += 1
+			return None
+		self.entries[key] = entry		# Now the most recently used
+		self.hits += 1
+		return entry[0]
+
+	def put(self, key, pm):
+		size = self.pixmapBytes(pm)
+		if size > self.maxBytes:		# Too big to keep, don't flush everything else for it
+			return pm
+		old = self.entries.pop(key, None)
+		if old is not None:
+			self.bytes -= old[1]
+		self.entries[key] = (pm, size)
+		self.bytes += size
+		while self.bytes > self.maxBytes:
+			oldKey, (oldPm, oldSize) = self.entries.popitem(last=False)
+			self.bytes -= oldSize
+		return pm
+
+	def clear(self):
+		self.entries.clear()
+		self.bytes = 0
+
+	@staticmethod
+	def modified(path):
+		try:
+			return os.path.getmtime(path)
+		except OSError:
+			return None
+
+	def original(self, path, hflip, vflip):
+		""" The full size picture with the flips applied """
+		path = str(path)
+		key = (path, self.modified(path), hflip, vflip, None)
+		pm = self.get(key)
+		if pm is not None:
+			return pm
+		pm = QPixmap(path)
+		if hflip or vflip:
+			pm = pm.transformed(QTransform().scale(-1 if hflip else 1, -1 if vflip else 1))
+		return self.put(key, pm)
+
+	def scaled(self, path, hflip, vflip, size, smooth=True):
+		"""
+		The picture scaled to fit size, keeping its aspect ratio. Smooth scales are cached,
+		fast ones are only meant to be shown until the next smooth pass so they aren't
+		"""
+		pm = self.original(path, hflip, vflip)
+		if pm.isNull():
+			return pm
+		if not smooth:
+			return pm.scaled(size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation)
+		path = str(path)
+		key = (path, self.modified(path), hflip, vflip, (size.width(), size.height()))
+		scaledPm = self.get(key)
+		if scaledPm is None:
+			scaledPm = self.put(key, pm.scaled(size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
+		return scaledPm
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 def bearing(trackerLat, trackerLon, remoteLat, remoteLon):
@@ -41,4 +42,61 @@ def haversine(trackerLat, trackerLon, remoteLat, remoteLon):
 def losDistance(alt,trackerAlt,distance):
 	""" The line of sight distance based on ground distance and altitude """
 
-	return math.sqrt(math.pow(distance/3.2808,2) + math.pow((alt-trackerAlt)/3.2808,2))/1000
\ No newline at end of file
+	return math.sqrt(math.pow(distance/3.2808,2) + math.pow((alt-trackerAlt)/3.2808,2))/1000
+
+
+class PointingSolver:
+	"""
+	Vectorized pointing math for many remote points against one fixed ground station.
+	The ground station trig is computed once, and each call handles whole numpy arrays of
+	remote positions in a single pass (log replays, prediction sweeps, graphing arrays)
+	"""
+
+	def __init__(self, trackerLat, trackerLon, trackerAlt):
+		self.trackerLat = float(trackerLat)
+		self.trackerLon = float(trackerLon)
+		self.trackerAlt = float(trackerAlt)
+
+		# Ground station values that never change for this solver
+		self.latRad = math.radians(self.trackerLat)
+		self.lonRad = math.radians(self.trackerLon)
+		self.cosLat = math.cos(self.latRad)
+		self.sinLat = math.sin(self.latRad)
+
+	def bearing(self, remoteLat, remoteLon):
+		""" great circle bearing from the ground station to each remote point, between 0 and 360 """
+
+		lat = np.radians(np.asarray(remoteLat, dtype=np.float64))
+		dLon = np.radians(np.asarray(remoteLon, dtype=np.float64)) - self.lonRad
+		cosRemote = np.cos(lat)
+
+		y = np.sin(dLon)*cosRemote
+		x = self.cosLat*np.sin(lat) - self.sinLat*cosRemote*np.cos(lat - self.latRad)
+		return np.mod(np.degrees(np.arctan2(y, x)), 360.0)
+
+	def haversine(self, remoteLat, remoteLon):
+		""" ground distance in feet from the ground station to each remote point """
+
+		lat = np.radians(np.asarray(remoteLat, dtype=np.float64))
+		dLat = lat - self.latRad
+		dLon = np.radians(np.asarray(remoteLon, dtype=np.float64)) - self.lonRad
+
+		a = np.sin(dLat/2)**2 + self.cosLat*np.cos(lat)*np.sin(dLon/2)**2
+		c = 2*np.arctan2(np.sqrt(a), np.sqrt(1-a))
+		return 6371*c*3280.839895		# Km to feet, same as haversine()
+
+	def elevationAngle(self, remoteAlt, distance):
+		""" elevation angle for each remote altitude and ground distance """
+
+		return np.degrees(np.arctan2(np.asarray(remoteAlt, dtype=np.float64) - self.trackerAlt, distance))
+
+	def losDistance(self, remoteAlt, distance):
+		""" line of sight distance in km for each remote altitude and ground distance """
+
+		return np.hypot(np.asarray(distance, dtype=np.float64)/3.2808, (np.asarray(remoteAlt, dtype=np.float64) - self.trackerAlt)/3.2808)/1000
+
+	def solve(self, remoteLat, remoteLon, remoteAlt):
+		""" Returns the bearing, elevation and line of sight arrays for the remote points in one pass """
+
+		distance = self.haversine(remoteLat, remoteLon)
+		return self.bearing(remoteLat, remoteLon), self.elevationAngle(remoteAlt, distance), self.losDistance(remoteAlt, distance)
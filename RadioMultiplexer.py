@@ -0,0 +1,305 @@
+import time
+import threading
+import itertools
+import Queue
+
+# Write priorities, lower goes first
+PRIORITY_CONTROL = 0		# Still image protocol traffic
+PRIORITY_COMMAND = 1		# Payload commands
+PRIORITY_BULK = 2			# Anything that can wait
+
+GPS_PREFIX = 'GPS:'
+
+
+class MuxStream:
+	"""
+	A consumer's view of the radio, with the parts of the serial.Serial interface the RFD code uses.
+	Reads come from this stream's own receive buffer, writes go through the multiplexer at this stream's priority
+	"""
+
+	def __init__(self, mux, priority, timeout=2):
+		self.mux = mux
+		self.priority = priority
+		self.timeout = timeout
+		self.buffer = bytearray()
+		self.condition = threading.Condition()
+
+	def feed(self, data):
+		""" Called by the multiplexer with bytes for this stream """
+		with self.condition:
+			self.buffer += data
+			self.condition.notify_all()
+
+	def waitFor(self, ready):
+		""" Waits until ready() is true or the timeout passes """
+		killTime = time.time() + self.timeout
+		while not ready():
+			remaining = killTime - time.time()
+			if remaining <= 0:
+				return
+			self.condition.wait(remaining)
+
+	def read(self, size=1):
+		""" Reads size bytes, or fewer if the timeout passes first """
+		with self.condition:
+			self.waitFor(lambda: len(self.buffer) >= size)
+			data = str(self.buffer[:size])
+			del self.buffer[:size]
+			return data
+
+	def readinto(self, view):
+		""" Reads len(view) bytes into view, or fewer if the timeout passes first, returns the number read """
+		size = len(view)
+		with self.condition:
+			self.waitFor(lambda: len(self.buffer) >= size)
+			size = min(size, len(self.buffer))
+			view[:size] = self.buffer[:size]
+			del self.buffer[:size]
+			return size
+
+	def readline(self):
+		""" Reads through the next newline, or whatever arrived if the timeout passes first """
+		with self.condition:
+			self.waitFor(lambda: '\n' in self.buffer)
+			end = self.buffer.find('\n') + 1
+			if end == 0:
+				end = len(self.buffer)
+			data = str(self.buffer[:end])
+			del self.buffer[:end]
+			return data
+
+	def inWaiting(self):
+		return len(self.buffer)
+
+	def write(self, data):
+		self.mux.write(data, self.priority, self)
+
+	def setFrameBoundary(self, boundary):
+		""" Tells the multiplexer this stream's session is framed binary, see RadioMultiplexer.setFrameBoundary """
+		self.mux.setFrameBoundary(boundary)
+
+	def flushInput(self):
+		with self.condition:
+			del self.buffer[:]
+
+	def flushOutput(self):
+		pass
+
+
+class RadioMultiplexer:
+	"""
+	Owns the RFD serial port so the listen, commands and still image system can share it.
+	One reader thread demultiplexes what's received: normally every line goes to the line listeners
+	(RFD listen), but while a session (a still image transfer or Pi runtime download) holds the radio,
+	received bytes go to that session's stream and only GPS lines are picked out for the listeners,
+	so tracking keeps running during downloads. One writer thread serializes writes by priority;
+	while a session is running, writes from other streams wait until it ends so they can't
+	corrupt the session's protocol on the Pi
+	"""
+
+	def __init__(self, ser, pollInterval=0.01):
+		self.ser = ser
+		self.pollInterval = pollInterval		# Time the reader waits when nothing is waiting on the port
+		self.lock = threading.RLock()
+		self.lineListeners = []
+		self.session = None						# Stream that currently holds the radio
+		self.deferred = []						# Writes waiting for the session to end
+
+		# Receive state
+		self.lineBuffer = ''		# Partial line outside of a session
+		self.frame = None			# Partial GPS line inside of a session
+		self.held = ''				# Session bytes held back because they might start a GPS line
+		self.heldTime = 0
+		self.boundary = None		# Byte that ends the session's frames, GPS lines only start after one when set
+		self.lastByte = ''			# Last session byte before the current data
+
+		# Write queue, the counter keeps writes of the same priority in order
+		self.writeQueue = Queue.PriorityQueue()
+		self.writeCount = itertools.count()
+
+		self.stopEvent = threading.Event()
+		self.readerThread = threading.Thread(target=self.readLoop)
+		self.readerThread.daemon = True
+		self.writerThread = threading.Thread(target=self.writeLoop)
+		self.writerThread.daemon = True
+
+	def start(self):
+		self.ser.flushInput()
+		self.readerThread.start()
+		self.writerThread.start()
+
+	def stop(self, timeout=1):
+		self.stopEvent.set()
+		self.writeQueue.put((-1, 0, None))
+		for each in [self.readerThread, self.writerThread]:
+			if each.is_alive():
+				each.join(timeout)
+
+	def openStream(self, priority=PRIORITY_COMMAND, timeout=2):
+		""" Makes a new stream for a consumer of the radio """
+		return MuxStream(self, priority, timeout)
+
+	def addLineListener(self, callback):
+		with self.lock:
+			if callback not in self.lineListeners:
+				self.lineListeners.append(callback)
+
+	def removeLineListener(self, callback):
+		with self.lock:
+			if callback in self.lineListeners:
+				self.lineListeners.remove(callback)
+
+	def busy(self):
+		""" Whether a session holds the radio """
+		return self.session is not None
+
+	def beginSession(self, stream):
+		"""
+		Gives the stream everything received (except GPS lines) until the session ends. Returns False,
+		and leaves the radio alone, if another stream's session already holds it
+		"""
+		with self.lock:
+			if self.session is not None and self.session is not stream:
+				return False
+			stream.flushInput()
+			if self.lineBuffer.startswith(GPS_PREFIX):		# Finish a GPS line that was already arriving
+				self.frame = self.lineBuffer
+			self.lineBuffer = ''
+			self.held = ''
+			self.boundary = None
+			self.lastByte = ''
+			self.session = stream
+		return True
+
+	def endSession(self):
+		""" Returns received lines to the listeners, and releases the writes that were waiting """
+		with self.lock:
+			self.session = None
+			if self.frame is not None:
+				self.lineBuffer = self.frame
+				self.frame = None
+			self.held = ''
+			self.boundary = None
+			deferred = self.deferred
+			self.deferred = []
+		for priority, data in deferred:
+			self.queueWrite(data, priority)
+
+	def setFrameBoundary(self, boundary):
+		"""
+		For sessions that send raw binary, where 'GPS:' can turn up inside the data. GPS lines are then only
+		picked out right after the boundary byte that ends each frame (or right after another GPS line)
+		"""
+		with self.lock:
+			self.boundary = boundary
+			self.lastByte = boundary
+
+	def write(self, data, priority=PRIORITY_COMMAND, stream=None):
+		""" Queues data to be written to the radio """
+		with self.lock:
+			if self.session is not None and stream is not self.session:
+				if (priority, data) not in self.deferred:		# Retransmits of the same command only need to go once
+					self.deferred.append((priority, data))
+				return
+		self.queueWrite(data, priority)
+
+	def queueWrite(self, data, priority):
+		self.writeQueue.put((priority, next(self.writeCount), data))
+
+	def writeLoop(self):
+		while not self.stopEvent.is_set():
+			priority, count, data = self.writeQueue.get()
+			if data is None:
+				break
+			try:
+				self.ser.write(data)
+			except Exception, e:
+				print("Error writing to the RFD: " + str(e))
+
+	def readLoop(self):
+		while not self.stopEvent.is_set():
+			try:
+				waiting = self.ser.inWaiting()
+				if waiting == 0:
+					self.releaseHeld()
+					self.stopEvent.wait(self.pollInterval)
+					continue
+				data = self.ser.read(waiting)
+			except Exception, e:
+				print("Error reading the RFD: " + str(e))
+				self.stopEvent.wait(1)
+				continue
+			self.route(data)
+
+	def route(self, data):
+		""" Sends received bytes to the line listeners or to the session """
+		lines = []
+		with self.lock:
+			if self.session is None:
+				lines = self.splitLines(data)
+			else:
+				lines = self.splitSession(self.held + data)
+			listeners = list(self.lineListeners)
+		for line in lines:
+			for callback in listeners:
+				callback(line)
+
+	def splitLines(self, data):
+		""" Splits off the complete lines, keeping the partial one """
+		buf = self.lineBuffer + data
+		lines = []
+		start = 0
+		end = buf.find('\n')
+		while end != -1:
+			lines.append(buf[start:end+1])
+			start = end + 1
+			end = buf.find('\n', start)
+		self.lineBuffer = buf[start:]
+		return lines
+
+	def splitSession(self, data):
+		""" Picks the GPS lines out of the session's bytes, the rest goes to the session """
+		self.held = ''
+		lines = []
+		while data:
+			if self.frame is not None:		# In the middle of a GPS line
+				end = data.find('\n')
+				if end == -1:
+					self.frame += data
+					return lines
+				lines.append(self.frame + data[:end+1])
+				self.frame = None
+				data = data[end+1:]
+				continue
+
+			idx = data.find(GPS_PREFIX)
+			while idx != -1 and self.boundary is not None and (data[idx-1] if idx > 0 else self.lastByte) != self.boundary:
+				idx = data.find(GPS_PREFIX, idx + 1)		# Inside a binary frame, not a GPS line
+			if idx == -1:
+				# Hold back a tail that could be the start of a GPS line split across reads
+				keep = 0
+				for n in range(len(GPS_PREFIX) - 1, 0, -1):
+					if data.endswith(GPS_PREFIX[:n]):
+						keep = n
+						break
+				self.session.feed(data[:len(data) - keep])
+				if keep < len(data):
+					self.lastByte = data[len(data) - keep - 1]
+				if keep:
+					self.held = data[len(data) - keep:]
+					self.heldTime = time.time()
+				return lines
+			if idx > 0:
+				self.session.feed(data[:idx])
+			self.frame = ''
+			self.lastByte = self.boundary		# A GPS line can follow another one
+			data = data[idx:]
+		return lines
+
+	def releaseHeld(self):
+		""" Gives held back bytes to the session once it's clear no GPS line followed them """
+		with self.lock:
+			if self.held and self.session is not None and time.time() - self.heldTime > self.pollInterval:
+				self.session.feed(self.held)
+				self.lastByte = self.held[-1]
+				self.held = ''
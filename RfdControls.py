@@ -6,7 +6,10 @@ from PyQt4 import QtCore
 from PyQt4 import QtGui
 from PyQt4.QtCore import *
 from BalloonUpdate import *
+from TelemetryParser import telemetryParser
 import threading
+import random
+import collections
 
 
 class RfdListen(QtCore.QObject):
@@ -14,87 +17,88 @@ class RfdListen(QtCore.QObject):
 	# Received Signals
 	listenStart = pyqtSignal()
 	listenInterrupt = pyqtSignal()
-	shareIdentifier = pyqtSignal(str)
 
-	def __init__(self, MainWindow, RFD):
+	# Lines from the radio's reader thread
+	newLine = pyqtSignal(str)
+
+	def __init__(self, MainWindow, radio):
 		super(RfdListen, self).__init__()
-		self.rfdSer = RFD
+		self.radio = radio
 		self.mainWindow = MainWindow
 		self.interrupt = False
-		self.identifier = ''
+		self.lineCallback = self.newLine.emit		# Kept so the same callback can be removed from the radio
 
 		# Emitted Signals
 		self.mainWindow.rfdListenNewText.connect(self.mainWindow.updateRFDBrowser)
-		self.mainWindow.rfdNewLocation.connect(self.mainWindow.updateBalloonLocation)
 		self.mainWindow.payloadUpdate.connect(self.mainWindow.updatePayloads)
 
+		# Lines are handled in this object's thread as they arrive
+		self.newLine.connect(self.handleLine)
 
 	def listen(self):
-		""" Listens to the RFD serial port until interrupted """
-				
-		### Loop until interrupted; handle anything received by the RFD ###
-		self.rfdSer.flushInput()
-		while not self.interrupt:
-			QtGui.QApplication.processEvents()
-			line = str(self.rfdSer.readline())
-			if line[0:3] == "GPS" and len(line[4:].split(','))==7:		# If the line received has the GPS identifier, handle it as a newly received RFD balloon location update
-				lineLst = line.split(',')
-				lineLst[0] = lineLst[0][4:]
-				lineLst[-1] = lineLst[-1][:-1]
-
-				### Interpret the balloon location list ###
-				try:
-					hours = lineLst[0]		# Fix taken at this time
-					minutes = lineLst[1]		# Fix taken at this time
-					seconds = lineLst[2]		# Fix taken at this time
-					lat = stringToFloat(lineLst[3])		# Latitude in Degrees
-					lon = stringToFloat(lineLst[4])		# Longitude in Degrees
-					alt = stringToFloat(lineLst[5])		# Altitude in meters (sealevel)
-					sat = stringToFloat(lineLst[6][:-1])		# Number of Satellites
-				except Exception, e:
-					print(str(e))
-
-				### Do some calculations, get some values ###
-				alt = alt*3.2808	# Convert Altitude to feet
-				gpsTime = hours + ":" +  minutes + ":" + seconds.split(".")[0]
-				rfdSeconds = stringToFloat(hours) * 3600 + stringToFloat(minutes)*60 + stringToFloat(seconds)
-
-				### Create a new location object ###
-				try:
-					newLocation = BalloonUpdate(gpsTime,rfdSeconds,lat,lon,alt,"RFD",self.mainWindow.groundLat,self.mainWindow.groundLon,self.mainWindow.groundAlt)
-				except Exception, e:
-					print(str(e))
-					
-				try:
-					self.mainWindow.rfdNewLocation.emit(newLocation)				# Notify the main GUI of the new position
-				except Exception, e:
-					print(str(e))
-					
-				#self.mainWindow.rfdListenNewText.emit(datetime.datetime.today().strftime('%H:%M:%S') + " || "+line)
-				
-			if(line.replace('\n','') == self.identifier and self.identifier != ''):
-				print('ID Found')
-				self.rfdCommand.foundIdentifier.emit(True)
-				self.identifier = ''
-				
-			elif line != '':				# Send the line to the text browser if it's not empty
-				self.mainWindow.rfdListenNewText.emit(datetime.datetime.today().strftime('%H:%M:%S') + " || "+line)
-				self.mainWindow.payloadUpdate.emit(line)			# Send it to the payload manager
+		""" Starts listening to the RFD until interrupted, each line received is handled by handleLine """
 
 		self.interrupt = False
+		self.radio.addLineListener(self.lineCallback)
+
+	def handleLine(self, line):
+		""" Handle anything received by the RFD """
+
+		if self.interrupt:		# Lines already queued when the listen was interrupted
+			return
+		line = str(line)
+		fix = telemetryParser.parseRfdGps(line)
+		if fix is not None:		# If the line received is a GPS line, handle it as a newly received RFD balloon location update
+
+			### Create a new location object ###
+			try:
+				newLocation = BalloonUpdate(fix.time,fix.seconds,fix.lat,fix.lon,fix.alt,"RFD",self.mainWindow.groundLat,self.mainWindow.groundLon,self.mainWindow.groundAlt)
+				self.mainWindow.rfdNewLocation.emit(newLocation)				# Notify the main GUI of the new position
+			except Exception, e:
+				print(str(e))
+
+		acknowledged = self.rfdCommand.acknowledge(line.replace('\n',''))		# The identifier of a command waiting for its acknowledge
+
+		if not acknowledged and line != '':				# Send the line to the text browser if it's not empty
+			self.mainWindow.rfdListenNewText.emit(datetime.datetime.today().strftime('%H:%M:%S') + " || "+line)
+			self.mainWindow.payloadUpdate.emit(line)			# Send it to the payload manager
 
 	def setInterrupt(self,arg):
 		self.mainWindow.rfdCommandNewText.emit("Listen Interrupted")
 		self.interrupt = arg
-
-	def setIdentifier(self,ID):
-		self.identifier = ID
-		print("New ID: " + self.identifier)
+		if arg:
+			self.radio.removeLineListener(self.lineCallback)
 
 	def setCommand(self,command):
 		self.rfdCommand = command
 
 
+class RetransmitSchedule:
+	"""
+	When to resend a command that hasn't been acknowledged. The wait after each send starts at initial
+	(or a multiple of the measured round trip, whichever is longer), grows by factor up to maxInterval,
+	and is randomized by +/- jitter so retries don't line up with the Pi's replies. Gives up after
+	maxAttempts sends or deadline seconds, whichever comes first
+	"""
+
+	def __init__(self, initial=0.25, factor=2.0, maxInterval=4.0, jitter=0.25, maxAttempts=20, deadline=60.0, rttFactor=2.0):
+		self.initial = initial
+		self.factor = factor
+		self.maxInterval = maxInterval
+		self.jitter = jitter				# Fraction of the interval
+		self.maxAttempts = maxAttempts
+		self.deadline = deadline			# Seconds from the first send
+		self.rttFactor = rttFactor
+
+	def interval(self, attempt, srtt=None):
+		""" Seconds to wait for an acknowledge after the attempt'th send (starting at 1) """
+		base = self.initial
+		if srtt is not None:
+			base = max(base, self.rttFactor*srtt)
+		interval = min(base*self.factor**(attempt - 1), self.maxInterval)
+		return interval*random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
 class RfdCommand(QtCore.QObject):
 
 	# Signals
@@ -103,54 +107,129 @@ class RfdCommand(QtCore.QObject):
 	piruntimeStart = pyqtSignal()
 	statusStart = pyqtSignal()
 	cutdownStart = pyqtSignal()
-	foundIdentifier = pyqtSignal(bool)
 
-	def __init__(self,MainWindow,RFD):
+	def __init__(self,MainWindow,RFD,runtimeSer):
 		super(RfdCommand, self).__init__()
 		self.rfdSer = RFD
+		self.runtimeSer = runtimeSer			# The Pi runtime data download's own stream, it holds the radio's session so command resends wait until it's done
 		self.mainWindow = MainWindow
-		self.acknowledged = False
-		self.interrupt = False
+		self.schedule = RetransmitSchedule()
+		self.srtt = None						# Smoothed round trip time of commands acknowledged on their first send
+		self.history = collections.deque(maxlen=100)		# Dicts describing the latest commands, oldest first
+
+		# Commands waiting for their acknowledge, resent on their schedule by the retry thread
+		self.outstanding = {}					# identifier -> the command's record in the history
+		self.condition = threading.Condition()
+		self.retryThread = None
+
+		# Pi runtime data receive
+		self.runtimeBlockSize = 65536			# File buffer size
+		self.runtimeBatchLines = 100			# Lines shown in the browser per signal
 
 		# Connections
 		self.mainWindow.rfdCommandNewText.connect(self.mainWindow.updateRFDBrowser)
-		self.mainWindow.commandFinished.connect(self.mainWindow.rfdCommandsDone)
+		self.mainWindow.commandsOutstanding.connect(self.mainWindow.rfdCommandsDone)
 		self.mainWindow.piruntimeFinished.connect(self.mainWindow.piruntimeDone)
 
 
 	def command(self,identifier,command):
-		""" Handles the RFD Commands """
+		"""
+		Sends an RFD Command, and leaves it to the retry thread to resend it until it's acknowledged or the
+		schedule gives up. Returns right away so more commands can be sent while this one is outstanding
+		"""
 
-		self.identifier = str(identifier)
-		self.command = str(command)
-		toSend = self.identifier + "?" + self.command	+ "!"	# Connect the identifier and the command with a ? separating for parsing, and an ! at the end
+		identifier = str(identifier)
+		command = str(command)
+		toSend = identifier + "?" + command	+ "!"	# Connect the identifier and the command with a ? separating for parsing, and an ! at the end
 
-		self.rfdListen.shareIdentifier.emit(self.identifier)		# Send out the identifier so the listen function can get it
-		
 		print(datetime.datetime.today().strftime('%H:%M:%S'))
 		self.mainWindow.rfdCommandNewText.emit('\n' + datetime.datetime.today().strftime('%H:%M:%S'))		# Print out when the message began to send
-
-		### Until the acknowledge is received, or the stop button is pressed, keep sending the message ###
-		self.setAcknowledged(False)
-		self.setInterrupt(False)
 		self.mainWindow.rfdCommandNewText.emit("Sending " + toSend)		# Add the message to the browser
-		while not self.acknowledged:
-			QtGui.QApplication.processEvents()
-			self.rfdSer.write(toSend)
-			if self.interrupt:		# If the stop button is pressed, interrupt the sending
-				self.mainWindow.rfdCommandNewText.emit("Command Interrupted")
-				self.setAcknowledged(True)
-			time.sleep(0.05)
 
-		if self.interrupt:
-			self.setInterrupt(False)
-
-		else:
+		with self.condition:
+			if identifier in self.outstanding:		# The acknowledge can't tell them apart, so the new command takes over
+				self.retire(self.outstanding[identifier], 'Replaced')
+			record = {'identifier': identifier, 'command': command, 'toSend': toSend, 'start': time.time(), 'attempts': 0,
+						'lastSend': 0, 'nextSend': 0, 'result': 'Pending', 'latency': None, 'rtt': None}
+			self.history.append(record)
+			self.outstanding[identifier] = record
+			self.send(record)
+			self.mainWindow.commandsOutstanding.emit(len(self.outstanding))
+			if self.retryThread is None:
+				self.retryThread = threading.Thread(target=self.retryLoop)
+				self.retryThread.daemon = True
+				self.retryThread.start()
+			self.condition.notify()
+
+	def send(self, record):
+		""" Writes the command and schedules its next send, call with the condition held """
+		self.rfdSer.write(record['toSend'])
+		record['attempts'] += 1
+		record['lastSend'] = time.time()
+		wait = self.schedule.interval(record['attempts'], self.srtt)
+		record['nextSend'] = min(record['lastSend'] + wait, record['start'] + self.schedule.deadline)
+
+	def retryLoop(self):
+		""" Resends each outstanding command when it's due, and gives up on the ones that have run out of attempts or time """
+		with self.condition:
+			while True:
+				now = time.time()
+				for record in self.outstanding.values():
+					if record['nextSend'] > now:
+						continue
+					if record['attempts'] >= self.schedule.maxAttempts or now - record['start'] >= self.schedule.deadline:
+						self.retire(record, 'No Acknowledge')
+					else:
+						self.send(record)
+				if self.outstanding:
+					self.condition.wait(max(min([each['nextSend'] for each in self.outstanding.values()]) - time.time(), 0))
+				else:
+					self.condition.wait()
+
+	def retire(self, record, result):
+		""" Stops resending the command, call with the condition held """
+		del self.outstanding[record['identifier']]
+		record['result'] = result
+		if result == 'Acknowledged':
 			print("Acknowledged at: " + datetime.datetime.today().strftime('%H:%M:%S'))
-			self.mainWindow.rfdCommandNewText.emit("Acknowledged at: " + datetime.datetime.today().strftime('%H:%M:%S'))		# Print out the time of acknowledge to see how long it took to get the message through
-			self.setAcknowledged(False)
-
-		self.mainWindow.commandFinished.emit()
+			self.mainWindow.rfdCommandNewText.emit(record['identifier'] + " Acknowledged at: " + datetime.datetime.today().strftime('%H:%M:%S'))		# Print out the time of acknowledge to see how long it took to get the message through
+			self.mainWindow.rfdCommandNewText.emit("Latency %.2f s after %d attempts" % (record['latency'], record['attempts']))
+		elif result == 'No Acknowledge':
+			print("No Acknowledge for " + record['identifier'] + " after %d attempts" % record['attempts'])
+			self.mainWindow.rfdCommandNewText.emit("No Acknowledge for " + record['identifier'] + " after %d attempts in %.0f s" % (record['attempts'], time.time() - record['start']))
+		else:
+			self.mainWindow.rfdCommandNewText.emit(record['toSend'] + " " + result)
+		self.mainWindow.commandsOutstanding.emit(len(self.outstanding))
+
+	def acknowledge(self, identifier):
+		""" Retires the outstanding command with this identifier, returns whether there was one. Safe from any thread """
+		with self.condition:
+			record = self.outstanding.get(identifier)
+			if record is None:
+				return False
+			now = time.time()
+			record['latency'] = now - record['start']
+			if record['attempts'] == 1:		# Only a single send tells which one the acknowledge was for
+				record['rtt'] = now - record['lastSend']
+				self.srtt = record['rtt'] if self.srtt is None else 0.875*self.srtt + 0.125*record['rtt']
+			self.retire(record, 'Acknowledged')
+			return True
+
+	def outstandingCount(self):
+		with self.condition:
+			return len(self.outstanding)
+
+	def commandHistory(self):
+		""" Lines describing the latest commands, for tuning the retransmit schedule to the link """
+		lines = []
+		for record in list(self.history):
+			line = "%s %s?%s! %s, %d attempts" % (datetime.datetime.fromtimestamp(record['start']).strftime('%H:%M:%S'), record['identifier'], record['command'], record['result'], record['attempts'])
+			if record['latency'] is not None:
+				line += ", latency %.2f s" % record['latency']
+			if record['rtt'] is not None:
+				line += ", rtt %.2f s" % record['rtt']
+			lines.append(line)
+		return lines
 
 	def getPiRuntimeData(self):
 		""" Retrieve the runtime data from the Pi """
@@ -158,34 +237,41 @@ class RfdCommand(QtCore.QObject):
 		### Send the pi 7 until the acknowledge is received, or until too much time has passed ###
 		termtime = time.time() + 10
 		timeCheck = time.time() + 1
-		self.rfdSer.write('IMAGE;7!')
-		while self.rfdSer.read() != 'A':
+		self.runtimeSer.write('IMAGE;7!')
+		while self.runtimeSer.read() != 'A':
 			if(timeCheck < time.time()):
 				print("Waiting for Acknowledge")
 				self.mainWindow.rfdCommandNewText.emit("Waiting for Acknowledge")
 				timeCheck = time.time() + 1
-			self.rfdSer.write('IMAGE;7!')
+			self.runtimeSer.write('IMAGE;7!')
 			if(termtime < time.time()):
 				print("No Acknowldeg Received, Connection Error")
 				self.mainWindow.rfdCommandNewText.emit("No Acknowledge Received, Connect Error")
 				self.mainWindow.piruntimeFinished.emit()
 				return
 		
-		### Receive piruntimedata.txt ###
+		### Receive piruntimedata.txt in blocks, until the \r terminator or a read times out ###
 		timecheck = time.time()
+		termtime = time.time()+60
+		received = []
 		try:
-			f = open("piruntimedata.txt","w")
+			f = open("piruntimedata.txt","w",self.runtimeBlockSize)
 		except:
 			print "Error opening file"
 			self.mainWindow.rfdCommandNewText.emit("Error opening file")
 			self.mainWindow.piruntimeFinished.emit()
 			return
-		timecheck = time.time()
-		termtime = time.time()+60
-		temp = self.rfdSer.readline()
-		while (temp != "\r") & (temp != ""):		# Write everything the radio is receiving to the file
-			f.write(temp)
-			temp = self.rfdSer.read()
+		while True:
+			data = self.runtimeSer.read(max(self.runtimeSer.inWaiting(), 1))		# Everything that's arrived, or wait for the next byte
+			if data == "":
+				break
+			end = data.find("\r")
+			if end != -1:
+				data = data[:end]
+			f.write(data)
+			received.append(data)
+			if end != -1:
+				break
 			if (termtime < time.time()):
 				print "Error receiving piruntimedata.txt"
 				self.mainWindow.rfdCommandNewText.emit("Error receiving piruntimedata.txt")
@@ -199,16 +285,12 @@ class RfdCommand(QtCore.QObject):
 		print "Receive Time =", (time.time() - timecheck)
 		self.mainWindow.rfdCommandNewText.emit("Receive Time ="+str((time.time() - timecheck)))
 		
-		### Open piruntimedata.txt and print it into the command browser ###
-		try:
-			f = open('piruntimedata.txt','r')
-			for line in f:
-				print(line)
-				self.mainWindow.rfdCommandNewText.emit(line)
-			f.close()
-		except:
-			print("Error reading piruntimedata.txt")
-			self.mainWindow.rfdCommandNewText.emit("Error reading piruntimedata.txt")
+		### Print piruntimedata.txt into the command browser, a batch of lines per signal ###
+		lines = "".join(received).splitlines()
+		for i in range(0, len(lines), self.runtimeBatchLines):
+			batch = "\n".join(lines[i:i+self.runtimeBatchLines])
+			print(batch)
+			self.mainWindow.rfdCommandNewText.emit(batch)
 			
 		self.mainWindow.piruntimeFinished.emit()
 		return
@@ -222,11 +304,12 @@ class RfdCommand(QtCore.QObject):
 		time.sleep(4)
 		self.rfdSer.write("PRI")
 
-	def setAcknowledged(self,arg):
-		self.acknowledged = arg
-
 	def setInterrupt(self,arg):
-		self.interrupt = arg
+		""" Stops resending every outstanding command """
+		if arg:
+			with self.condition:
+				for record in self.outstanding.values():
+					self.retire(record, 'Interrupted')
 
 	def setListen(self,listen):
 		self.rfdListen = listen
@@ -5,8 +5,11 @@ import serial
 import time
 import datetime
 import sys
+import os
 import base64
 import hashlib
+import binascii
+from ImageTransfer import ImageReceiver, ChunkJournal, ChunkSizeController
 
 
 class StillImageSystem(QtCore.QObject):
@@ -16,6 +19,7 @@ class StillImageSystem(QtCore.QObject):
 	mostRecentImageStart = pyqtSignal(str)
 	imageDataStart = pyqtSignal()
 	requestedImageStart = pyqtSignal(str)
+	previewImageStart = pyqtSignal(str)
 	getSettingsStart = pyqtSignal()
 	sendSettingsStart = pyqtSignal(list)
 	timeSyncStart = pyqtSignal()
@@ -39,18 +43,27 @@ class StillImageSystem(QtCore.QObject):
 		self.wordlength = 7000		  									# Variable to determine spacing of checksum. Ex. wordlength = 1000 will send one thousand bits before calculating and verifying checksum
 		self.extension = ".jpg"
 		self.displayPhotoPath = "Images/MnSGC_Logo_highRes.png"			# The starting display photo is the logo of the MnSGC
+		self.windowedSupported = None		# Whether the Pi answers the windowed transfer, None until it's been tried
+		self.imageComplete = False			# Whether the last image transfer got the whole image
+		self.chunkSizer = ChunkSizeController("Images/transferstats.json")		# Adapts the windowed transfer's chunk size to the link
 
 		self.mainWindow.stillNewText.connect(self.mainWindow.updateStillBrowser)
 		self.mainWindow.listboxUpdate.connect(self.mainWindow.updateListbox)
 		self.mainWindow.stillNewProgress.connect(self.mainWindow.updatePictureProgress)
 		self.mainWindow.newPicture.connect(self.mainWindow.updatePicture)
 		self.mainWindow.requestConfirmation.connect(self.mainWindow.checkRequestedImage)
+		self.mainWindow.previewReady.connect(self.mainWindow.confirmFullImage)
 		self.mainWindow.newPicSliderValues.connect(self.mainWindow.updateStillImageValues)
 		self.mainWindow.stillSystemFinished.connect(self.mainWindow.stillImageSystemFinished)
 
 	def getMostRecentImage(self,requestedImageName):
 		""" Still Image System: Get the Most Recent Image through the RFD 900 """
 		self.mainWindow.stillNewText.emit("Requesting Most Recent Image")
+
+		### Use the windowed transfer if the Pi has it ###
+		if self.receiveWindowed('', str(requestedImageName)):
+			self.mainWindow.stillSystemFinished.emit()
+			return
 		
 		### Write 1 until you get the acknowledge back ###
 		self.rfdSer.write('IMAGE;1!')
@@ -150,6 +163,11 @@ class StillImageSystem(QtCore.QObject):
 		""" Still Image System: Retrieves the image specified in the argument, deletes the confirmation window if needed """
 		self.mainWindow.stillNewText.emit("Requesting Image")
 
+		### Use the windowed transfer if the Pi has it ###
+		if self.receiveWindowed(str(data)[0:15]):
+			self.mainWindow.stillSystemFinished.emit()
+			return
+
 		### Continuously write 3 until the acknowledge is received ###
 		self.rfdSer.write('IMAGE;3!')
 		timeCheck = time.time() + 1
@@ -178,6 +196,21 @@ class StillImageSystem(QtCore.QObject):
 
 		return
 			
+	def getImagePreview(self, data):
+		""" Still Image System: Gets the thumbnail of the image specified in the argument, shows it, and asks whether to get the whole image """
+		self.mainWindow.stillNewText.emit("Requesting Preview")
+
+		if not self.receiveWindowed(str(data)[0:15], preview=True):
+			self.mainWindow.stillNewText.emit("No preview available, the Pi doesn't have the windowed transfer")
+		elif self.imageComplete:
+			self.mainWindow.previewReady.emit(data)		# Ask whether the full image is worth the link time
+		else:
+			self.mainWindow.stillNewText.emit("No preview available")
+
+		self.mainWindow.stillSystemFinished.emit()		# Emit the finished signal
+
+		return
+			
 	def getPicSettings(self):
 		""" Still Image System: Retrieve Current Camera Settings """	
 			
@@ -199,6 +232,7 @@ class StillImageSystem(QtCore.QObject):
 		
 		if time.time() > killtime:
 			self.mainWindow.stillNewText.emit('No Acknowledge Received')
+			self.mainWindow.stillSystemFinished.emit()		# Emit the finished signal so the radio is released
 			return
 		
 		termtime = time.time()+10
@@ -274,6 +308,7 @@ class StillImageSystem(QtCore.QObject):
 			
 		if time.time() > killTime:
 			self.mainWindow.stillNewText.emit('No Acknowledge Received, Settings not Updated')
+			self.mainWindow.stillSystemFinished.emit()		# Emit the finished signal so the radio is released
 			return
 		
 		killTime = time.time() + 10
@@ -374,9 +409,11 @@ class StillImageSystem(QtCore.QObject):
 		sys.stdout.flush()
 		
 		### Module Specific Variables ###
+		self.imageComplete = True
 		trycnt = 0				# Initializes the checksum timeout (timeout value is not set here)
-		finalstring = ""		# Initializes the data string so that the += function can be used
+		received = 0			# Number of base64 characters received and written
 		done = False			# Initializes the end condition
+		chunk = memoryview(bytearray(wordlength))		# Every word is read into this same buffer, the wordlength only ever shrinks
 		
 		### Setup the Progress Bar ###
 		stillProgress = 0
@@ -386,20 +423,31 @@ class StillImageSystem(QtCore.QObject):
 			photoSize = temp			# The first thing you get is the total picture size so you can make the progress bar
 			print("Total Picture Size: ",photoSize)
 			self.mainWindow.stillNewText.emit("Total Picture Size: " + photoSize)
-			stillPhotoMax = int(photoSize)
+			stillPhotoMax = int(photoSize)*3/4		# Progress is reported in image bytes, the same as the windowed transfer, every 4 base64 characters are 3 bytes
 			self.mainWindow.stillNewProgress.emit(stillProgress,stillPhotoMax)
 		except Exception, e:
 			print(str(e))
 			print("Error retrieving picture size")
 			self.mainWindow.stillNewText.emit("Error retrieving picture size")
 			stillPhotoMax = 1
+
+		### Open the image in the Images folder, the words are decoded into it as they're verified ###
+		imagePath = "Images/"+str(savepath)
+		try:
+			image = Base64FileWriter(imagePath)
+		except:
+			print "Error with filename, saved as newimage" + self.extension
+			self.mainWindow.stillNewText.emit("Error with filename, saved as newimage" + self.extension)
+			sys.stdout.flush()
+			imagePath = None
+			image = Base64FileWriter("Images/"+"newimage" + self.extension)			#Save image as newimage.jpg due to a naming error in the Images folder
 		
 		### Retreive Data Loop (Will end when on timeout) ###
 		while not done:
-			print "Current Receive Position: ", str(len(finalstring))
-			self.mainWindow.stillNewText.emit("Current Received Position: "+ str(len(finalstring)))
+			print "Current Receive Position: ", str(received)
+			self.mainWindow.stillNewText.emit("Current Received Position: "+ str(received))
 			checktheirs = self.rfdSer.read(32)		# Asks first for checksum. Checksum is asked for first so that if data is less than wordlength, it won't error out the checksum data
-			word = self.rfdSer.read(wordlength)		# Retreives characters, who's total string length is predetermined by variable wordlength
+			word = chunk[:self.readInto(chunk[:wordlength])]		# Retreives characters, who's total string length is predetermined by variable wordlength
 			checkours = self.gen_checksum(word)		# Retreives a checksum based on the received data string
 			
 			#CHECKSUM
@@ -411,8 +459,8 @@ class StillImageSystem(QtCore.QObject):
 					self.mainWindow.stillNewText.emit("try number: "+str(trycnt))
 					print "\tresend last"		# This line is mostly used for troubleshooting, allows user to view that both devices are at the same position when a checksum error occurs
 					self.mainWindow.stillNewText.emit("\tresent last")
-					print "\tpos @" , str(len(finalstring))
-					self.mainWindow.stillNewText.emit("\tpos @ "+ str(len(finalstring)))
+					print "\tpos @" , str(received)
+					self.mainWindow.stillNewText.emit("\tpos @ "+ str(received))
 					print "\twordlength", str(wordlength)
 					self.mainWindow.stillNewText.emit("\twordlength "+str(wordlength))
 					sys.stdout.flush()
@@ -421,34 +469,101 @@ class StillImageSystem(QtCore.QObject):
 					self.sync()		# This corrects for bit deficits or excesses ######  THIS IS A MUST FOR DATA TRANSMISSION WITH THE RFD900s!!!! #####
 				else:
 					self.rfdSer.write('N')		# Kind of a worst case, checksum trycnt is reached and so we save the image and end the receive, a partial image will render if enough data
-					finalstring += word								 
+					self.imageComplete = False
+					image.write(word)
+					received += len(word)
 					done = True
 					break
-			else:							# If everything goes well, reset the try counter, and add the word to the accumulating final wor
+			else:							# If everything goes well, reset the try counter, and add the word to the image
 				trycnt = 0
 				self.rfdSer.write('Y')
-				finalstring += str(word)
-				stillProgress += wordlength
+				image.write(word)
+				received += len(word)
+				stillProgress += len(word)*3/4
 				self.mainWindow.stillNewProgress.emit(stillProgress, stillPhotoMax)
-			if len(finalstring) % 1000 != 0:			# The words always come in increments of some thousand, so if it's not evenly divisible, you're probably at the end
+			if received % 1000 != 0:			# The words always come in increments of some thousand, so if it's not evenly divisible, you're probably at the end
 				done = True
 				break
-		### Save the image as the given filename in the Images folder
-		try:
-			self.b64_to_image(finalstring,"Images/"+str(savepath))			# Decode the image
-			self.displayPhotoPath = "Images/"+str(savepath)
+
+		### Finish the image and show it ###
+		image.close()
+		if imagePath is not None:
+			self.displayPhotoPath = imagePath
 			self.mainWindow.newPicture.emit(self.displayPhotoPath)		# Send the signal with the new image location to the main GUI
-		except:
-			print "Error with filename, saved as newimage" + self.extension
-			self.mainWindow.stillNewText.emit("Error with filename, saved as newimage" + self.extension)
-			sys.stdout.flush()
-			self.b64_to_image(finalstring,"Images/"+"newimage" + self.extension)			#Save image as newimage.jpg due to a naming error in the Images folder
 		
 		### Clean Up ###
 		self.wordlength = 7000			# Reset the wordlength to the original
 		print "Image Saved"
 		self.mainWindow.stillNewText.emit("Image Saved")
 		sys.stdout.flush()
+
+	def receiveWindowed(self, name, requestedImageName='', preview=False):
+		"""
+		Gets an image with the windowed transfer, or only its thumbnail with preview.
+		Returns False if the Pi doesn't have the windowed transfer so the original transfer can be used
+		"""
+
+		self.imageComplete = False
+		if self.windowedSupported is False:
+			return False
+
+		### A named image that was cut off before only needs its missing chunks ###
+		journal = None
+		if name != "" and not preview:
+			journal = ChunkJournal("Images/" + name + ".journal")
+			journal.verify("Images/" + name)
+			if journal.have() > 0:
+				self.mainWindow.stillNewText.emit("Asking for the missing parts of " + name)
+
+		self.interrupt = False
+		receiver = ImageReceiver(self.rfdSer, progress=self.mainWindow.stillNewProgress.emit, status=self.mainWindow.stillNewText.emit, controller=self.chunkSizer, interrupted=lambda: self.interrupt)
+		header = receiver.request(name, journal=journal, preview=preview)
+		if header is None:
+			if receiver.acknowledged:
+				return True				# The Pi has the windowed transfer, but not the image
+			if self.windowedSupported is None:
+				print "No windowed transfer on the Pi, using the original transfer"
+				self.mainWindow.stillNewText.emit("No windowed transfer on the Pi, using the original transfer")
+				self.windowedSupported = False
+			return False
+		self.windowedSupported = True
+
+		### Save it as the requested name, or the name from the Pi ###
+		if requestedImageName != "":
+			imagepath = requestedImageName + self.extension
+		else:
+			imagepath = header['name']
+		if header.get('V') == 'thumb':
+			imagepath = os.path.splitext(imagepath)[0] + "_thumb" + self.extension
+		print "Image will be saved as:", imagepath
+		self.mainWindow.stillNewText.emit("Image will be saved as: " + imagepath)
+		self.mainWindow.stillNewText.emit("Total Picture Size: " + str(header['size']))
+
+		### Receive the Image ###
+		if journal is not None and imagepath != name:
+			journal = None
+		complete = receiver.receive(header, "Images/" + imagepath, journal)
+		stats = receiver.stats
+		print "Receive Time =", stats['seconds']
+		self.mainWindow.stillNewText.emit("Receive Time = " + str(stats['seconds']))
+		self.mainWindow.stillNewText.emit("%d bytes/s, %d bad chunks, %d acknowledgements" % (stats['rate'], stats['bad'], stats['sacks']))
+		if not complete:
+			self.mainWindow.stillNewText.emit("Image Incomplete, request it again to get the rest")
+		self.imageComplete = complete
+
+		self.displayPhotoPath = "Images/" + imagepath
+		self.mainWindow.newPicture.emit(self.displayPhotoPath)		# A partial image will render if enough arrived
+		self.mainWindow.stillNewProgress.emit(0,1)		# Reset the progress bar to empty
+		sys.stdout.flush()
+		return True
+
+	def readInto(self, view):
+		""" Reads up to len(view) bytes from the radio into view, and returns how many were read """
+		if hasattr(self.rfdSer, 'readinto'):
+			return self.rfdSer.readinto(view)
+		data = self.rfdSer.read(len(view))
+		view[:len(data)] = data
+		return len(data)
 		
 	def sync(self):
 		""" Ensures both sender and receiver are at that the same point in their data streams """
@@ -525,6 +640,7 @@ class StillImageSystem(QtCore.QObject):
 		
 		### Determine and print the average response time ###
 		avg = avg/numping
+		self.chunkSizer.setRtt(avg)			# The windowed transfer times its acknowledgements from this
 		print "Ping Response Time = " + str(avg)[0:4] + " seconds"
 		self.mainWindow.stillNewText.emit("Ping Response Time = " + str(avg)[0:4] + " seconds\n")
 		sys.stdout.flush()			# Clear the buffer
@@ -548,4 +664,28 @@ class StillImageSystem(QtCore.QObject):
 		return hashlib.md5(data).hexdigest()
 
 	def setInterrupt(self, arg):
-		self.interrupt = arg
\ No newline at end of file
+		self.interrupt = arg
+
+
+class Base64FileWriter:
+	""" Decodes base64 as it arrives and writes the bytes to a file, holding back a partial group of 4 characters for the next write """
+
+	def __init__(self, path):
+		self.f = open(path, "wb")
+		self.pending = bytearray()
+
+	def write(self, data):
+		self.pending += data
+		end = len(self.pending) - len(self.pending) % 4
+		if end:
+			self.f.write(binascii.a2b_base64(self.pending[:end]))
+			del self.pending[:end]
+
+	def close(self):
+		""" Decodes whatever is left (a cut off image still renders if enough arrived) and closes the file """
+		if self.pending:
+			try:
+				self.f.write(binascii.a2b_base64(self.pending + '=' * (-len(self.pending) % 4)))
+			except binascii.Error, e:
+				print("Dropped the end of the image: " + str(e))
+		self.f.close()
@@ -0,0 +1,114 @@
+"""
+Decoders for the telemetry lines received by the ground station, built on precompiled regular expressions.
+Each decoder returns a typed record, or None if the line isn't that kind of frame or is malformed.
+Malformed frames are counted per source
+"""
+
+import re
+import time
+from collections import namedtuple
+
+# Records
+RfdGps = namedtuple('RfdGps', 'time seconds lat lon alt sat')				# alt in feet, seconds into the UTC day
+AprsPosition = namedtuple('AprsPosition', 'callsign time seconds lat lon alt')	# alt in feet, seconds into the UTC day
+PayloadLine = namedtuple('PayloadLine', 'name message')
+PayloadGps = namedtuple('PayloadGps', 'time lat lon alt sat')
+
+# Sources for the error counters
+SOURCE_RFD = 'RFD'
+SOURCE_APRS = 'APRS'
+SOURCE_PAYLOAD = 'Payload'
+
+NUMBER = r'[-+]?\d+(?:\.\d*)?'
+
+# RFD GPS: "GPS:hours,minutes,seconds,latitude,longitude,altitude,satellites!"
+RFD_GPS = re.compile(r'GPS:(\d{1,2}),(\d{1,2}),(\d{1,2})(\.\d*)?,(' + NUMBER + '),(' + NUMBER + '),(' + NUMBER + r'),(\d+)!')
+
+# Eagle flight computer position, after the callsign: ">CQ,WIDE1-1,WIDE2-2:!DDMM.mmN/DDDMM.mmWO000/000/A=001234RadBug,..."
+EAGLE_POSITION = r'>[^:]*:!(\d{2})(\d{2}\.\d+)([NS]).(\d{3})(\d{2}\.\d+)([EW]).*?/A=(-?\d+)'
+
+# Payload message: "name;message" followed by two terminating characters
+PAYLOAD_LINE = re.compile(r'([^;\r\n]+);([^;]*)$')
+
+# Payload GPS update message: "time,lat,lon,alt,sat"
+PAYLOAD_GPS = re.compile(r'([^,]*),(' + NUMBER + '),(' + NUMBER + '),(' + NUMBER + '),(' + NUMBER + ')$')
+
+
+class TelemetryParser:
+	""" Parses RFD, APRS and payload telemetry lines, and counts the parsed and malformed frames for each source """
+
+	def __init__(self):
+		self.parsed = {SOURCE_RFD: 0, SOURCE_APRS: 0, SOURCE_PAYLOAD: 0}
+		self.errors = {SOURCE_RFD: 0, SOURCE_APRS: 0, SOURCE_PAYLOAD: 0}
+		self.aprsPatterns = {}		# Compiled position pattern for each callsign
+
+	def parseRfdGps(self, line):
+		""" Decodes an RFD GPS line, None if it isn't one """
+
+		if not line.startswith('GPS'):
+			return None
+		m = RFD_GPS.match(line)
+		if m is None:
+			self.errors[SOURCE_RFD] += 1
+			return None
+		hours, minutes, seconds, fraction, lat, lon, alt, sat = m.groups()
+		self.parsed[SOURCE_RFD] += 1
+		daySeconds = int(hours)*3600 + int(minutes)*60 + float(seconds + (fraction or ''))
+		return RfdGps(hours + ':' + minutes + ':' + seconds, daySeconds, float(lat), float(lon), float(alt)*3.2808, int(sat))
+
+	def parseEagleAprs(self, line, callsign):
+		""" Decodes an Eagle flight computer position report from the callsign, None if there isn't one """
+
+		idx = line.find(callsign)		# Cheap check before any decoding
+		if idx == -1 or not callsign:
+			return None
+		pattern = self.aprsPatterns.get(callsign)
+		if pattern is None:
+			pattern = re.compile(re.escape(callsign) + EAGLE_POSITION)
+			self.aprsPatterns[callsign] = pattern
+		m = pattern.search(line, idx)
+		if m is None:
+			self.errors[SOURCE_APRS] += 1
+			return None
+		latDeg, latMin, ns, lonDeg, lonMin, ew, alt = m.groups()
+		lat = int(latDeg) + float(latMin)/60
+		lon = int(lonDeg) + float(lonMin)/60
+		if ns == 'S':
+			lat = -lat
+		if ew == 'W':
+			lon = -lon
+		self.parsed[SOURCE_APRS] += 1
+		now = time.gmtime()		# The Eagle doesn't send a time, use the time it was received
+		return AprsPosition(callsign, time.strftime('%H:%M:%S', now), now.tm_hour*3600 + now.tm_min*60 + now.tm_sec, lat, lon, float(alt))
+
+	def parsePayloadLine(self, line):
+		""" Splits a payload line into the payload name and message, None if it isn't a payload line """
+
+		m = PAYLOAD_LINE.match(line)
+		if m is None:
+			if ';' in line:
+				self.errors[SOURCE_PAYLOAD] += 1
+			return None
+		self.parsed[SOURCE_PAYLOAD] += 1
+		return PayloadLine(m.group(1), m.group(2)[:-2])
+
+	def parsePayloadGps(self, message):
+		""" Decodes a payload GPS update message, None if the message isn't one """
+
+		if message.count(',') != 4:		# GPS Updates are always comma separated with a length of 5
+			return None
+		m = PAYLOAD_GPS.match(message)
+		if m is None:
+			self.errors[SOURCE_PAYLOAD] += 1
+			return None
+		gpsTime, lat, lon, alt, sat = m.groups()
+		return PayloadGps(gpsTime, float(lat), float(lon), float(alt), float(sat))
+
+	def getErrors(self, source):
+		return self.errors[source]
+
+	def getParsed(self, source):
+		return self.parsed[source]
+
+
+telemetryParser = TelemetryParser()		# Shared by the RFD listen, APRS and payload handling
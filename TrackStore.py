@@ -0,0 +1,91 @@
+import numpy as np
+
+# Small integer codes for the tracking method column
+METHOD_UNKNOWN = 0
+METHOD_RFD = 1
+METHOD_IRIDIUM = 2
+METHOD_APRS = 3
+
+trackingMethodCodes = {'RFD': METHOD_RFD, 'Iridium': METHOD_IRIDIUM, 'APRS': METHOD_APRS}
+trackingMethodNames = dict((code, name) for name, code in trackingMethodCodes.items())
+
+
+class TrackStore:
+	"""
+	A columnar store for the balloon track history. Each value has its own preallocated
+	float64 column that doubles in capacity when full, so appending an update is amortized O(1)
+	and every column can be handed to numpy or matplotlib as a view without copying
+	"""
+
+	columns = ('seconds', 'lat', 'lon', 'alt', 'bear', 'ele', 'los', 'magDec')
+
+	def __init__(self, capacity=256):
+		self.capacity = max(int(capacity), 1)
+		self.size = 0
+		self.data = dict((name, np.empty(self.capacity, dtype=np.float64)) for name in self.columns)
+		self.method = np.empty(self.capacity, dtype=np.int8)
+
+	def __len__(self):
+		return self.size
+
+	def grow(self):
+		""" Doubles the capacity of every column """
+
+		self.capacity *= 2
+		for name in self.columns:
+			column = np.empty(self.capacity, dtype=np.float64)
+			column[:self.size] = self.data[name][:self.size]
+			self.data[name] = column
+		method = np.empty(self.capacity, dtype=np.int8)
+		method[:self.size] = self.method[:self.size]
+		self.method = method
+
+	def append(self, update):
+		""" Adds a BalloonUpdate to the end of the track """
+
+		self.appendValues(update.getSeconds(), update.getLat(), update.getLon(), update.getAlt(), update.getBear(), update.getEle(), update.getLOS(), update.getMagDec(), update.getTrackingMethod())
+
+	def appendValues(self, seconds, lat, lon, alt, bear, ele, los, magDec, trackingMethod):
+		""" Adds a single track point to the end of each column """
+
+		if self.size == self.capacity:
+			self.grow()
+		i = self.size
+		data = self.data
+		data['seconds'][i] = seconds
+		data['lat'][i] = lat
+		data['lon'][i] = lon
+		data['alt'][i] = alt
+		data['bear'][i] = bear
+		data['ele'][i] = ele
+		data['los'][i] = los
+		data['magDec'][i] = magDec
+		self.method[i] = trackingMethodCodes.get(trackingMethod, METHOD_UNKNOWN)
+		self.size += 1
+
+	def column(self, name):
+		""" Returns a view of the filled part of a column """
+
+		return self.data[name][:self.size]
+
+	def methods(self):
+		""" Returns a view of the filled part of the tracking method column """
+
+		return self.method[:self.size]
+
+	def last(self, name):
+		""" Returns the most recent value of a column """
+
+		return self.data[name][self.size - 1]
+
+	def setPointing(self, bear, ele, los):
+		""" Overwrites the pointing columns in place, e.g. after the ground station moves """
+
+		self.data['bear'][:self.size] = bear
+		self.data['ele'][:self.size] = ele
+		self.data['los'][:self.size] = los
+
+	def clear(self):
+		""" Empties the track, keeping the allocated capacity """
+
+		self.size = 0
@@ -0,0 +1,123 @@
+import time
+import numpy as np
+from PyQt4 import QtCore
+
+
+class TrackingGraphs:
+	"""
+	A class to draw the four tracking graphs incrementally. The axes and lines are made once,
+	new data is pushed in with set_data, and redraws blit the lines over a cached background.
+	Redraws are throttled to a max frame rate so a burst of updates can't stall the GUI thread
+	"""
+
+	def __init__(self, figure, canvas, maxFrameRate=4):
+		self.figure = figure
+		self.canvas = canvas
+		self.maxFrameRate = maxFrameRate		# Max number of redraws per second
+
+		# Create the 4 subplots and their lines once
+		self.altPlot = figure.add_subplot(221)
+		self.losPlot = figure.add_subplot(222)
+		self.elePlot = figure.add_subplot(223)
+		self.bearPlot = figure.add_subplot(224)
+		self.altPlot.set_ylabel('Altitude (ft)')
+		self.losPlot.set_ylabel('Line-of-Sight (km)')
+		self.elePlot.set_ylabel('Elevation Angle')
+		self.bearPlot.set_ylabel('Bearing Angle')
+		self.axes = [self.altPlot, self.losPlot, self.elePlot, self.bearPlot]
+		self.lines = []
+		for ax, style in zip(self.axes, ['r-', 'g-', 'b-', 'y-']):
+			line, = ax.plot([], [], style, animated=True)		# Animated lines are left out of the cached background
+			self.lines.append(line)
+
+		self.background = None
+		self.refit = False			# Fit the limits to the data even if it fits, after a reset
+		self.lastDraw = 0
+		self.redrawTimer = QtCore.QTimer()
+		self.redrawTimer.setSingleShot(True)
+		self.redrawTimer.timeout.connect(self.redraw)
+		self.canvas.mpl_connect('draw_event', self.onDraw)
+
+	def setMaxFrameRate(self, maxFrameRate):
+		self.maxFrameRate = maxFrameRate
+
+	def setData(self, elapsed, alt, los, ele, bear):
+		""" Updates the data of each line, and asks for a redraw """
+
+		for line, values in zip(self.lines, [alt, los, ele, bear]):
+			line.set_data(elapsed, values)
+		self.requestRedraw()
+
+	def requestRedraw(self):
+		""" Redraws now if the last frame is old enough, otherwise schedules a single redraw for when it is """
+
+		interval = 1.0/self.maxFrameRate
+		wait = self.lastDraw + interval - time.time()
+		if wait <= 0:
+			self.redrawTimer.stop()
+			self.redraw()
+		elif not self.redrawTimer.isActive():
+			self.redrawTimer.start(int(wait*1000))
+
+	def reset(self):
+		""" Clears the lines for a new track, the limits are fitted to it from scratch on the next update """
+
+		for ax, line in zip(self.axes, self.lines):
+			line.set_data([], [])
+			ax.set_xlim(0, 1)
+			ax.set_ylim(0, 1)
+		self.refit = True
+		self.redrawTimer.stop()
+		self.canvas.draw()
+
+	def redraw(self):
+		""" Blits the lines over the cached background, or does a full draw if the axes had to grow """
+
+		self.lastDraw = time.time()
+		if self.rescale() or self.background is None:
+			self.canvas.draw()		# onDraw recaptures the background and draws the lines
+			return
+		self.canvas.restore_region(self.background)
+		self.drawLines()
+		self.canvas.blit(self.figure.bbox)
+
+	def onDraw(self, event):
+		""" After a full draw (including resizes), cache the background and put the lines back """
+
+		self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+		self.drawLines()
+		self.canvas.blit(self.figure.bbox)
+
+	def drawLines(self):
+		for ax, line in zip(self.axes, self.lines):
+			ax.draw_artist(line)
+
+	def rescale(self):
+		""" Grows the limits of any axes the data has outgrown, with headroom so it doesn't happen every update """
+
+		changed = False
+		refit = False
+		for ax, line in zip(self.axes, self.lines):
+			x, y = line.get_data()
+			if len(x) == 0:
+				continue
+			xLimits = self.fitLimits(None if self.refit else ax.get_xlim(), np.min(x), np.max(x))
+			yLimits = self.fitLimits(None if self.refit else ax.get_ylim(), np.min(y), np.max(y))
+			refit = self.refit
+			if xLimits is not None:
+				ax.set_xlim(xLimits)
+				changed = True
+			if yLimits is not None:
+				ax.set_ylim(yLimits)
+				changed = True
+		if refit:
+			self.refit = False
+		return changed
+
+	def fitLimits(self, limits, low, high):
+		""" Returns new padded limits if low or high is outside of the current ones (or there are none), None if they still fit """
+
+		if limits is not None and low >= limits[0] and high <= limits[1]:
+			return None
+		pad = max((high - low)*0.25, 1.0)
+		return (low - pad, high + pad)